@@ -1,37 +1,137 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import pandas as pd
-import joblib
 import os
+import time
 from contextlib import asynccontextmanager
-from src.utils.paths import ARTIFACTS_DIR
+from typing import NamedTuple
+from api.startup_timing import timed_import, record, startup_report
+
+# Imports medidos para o relatorio de startup; pandas, sklearn e pyarrow so
+# entram no processo quando a engine/config em uso precisa deles
+with timed_import('fastapi'):
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import PlainTextResponse
+    from starlette.concurrency import run_in_threadpool
+    from pydantic import BaseModel, model_validator
+with timed_import('src'):
+    from src.utils.paths import ARTIFACTS_DIR, LOGS_DIR, PROCESSED_DATA_DIR
+    from src.utils.metrics import METRICS, request_timings, server_timing
+    from src.models.compiled_model import COMPILED_MODEL_PATH
+    from src.models.threshold import THRESHOLD_PATH, is_risk
+with timed_import('api'):
+    from api.model_registry import ModelRegistry, as_model_input
+    from api.batching import MicroBatcher
+    from api.prediction_cache import PredictionCache, cache_key, canonical_float, canonical_str
+    from api.prediction_logger import PredictionLogger, prediction_record
+    from api.readiness import WorkerReadiness
+    from api.score_store import ScoreStore
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global model
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-        print("Model loaded successfully.")
-    else:
-        print(f"Warning: Model not found at {MODEL_PATH}. API will not be able to predict.")
+    global registry, batcher, prediction_logger
+    registry = ModelRegistry(MODEL_PATH, COMPILED_MODEL_PATH, MODEL_ENGINE, swap_model, MODEL_WATCH_INTERVAL_S,
+                             THRESHOLD_PATH)
+    await run_in_threadpool(registry.reload)
+    record('model_load', registry.load_seconds)
+    registry.start_watching()
+
+    if MICRO_BATCH_MAX_SIZE > 1:
+        batcher = MicroBatcher(score_queued, MICRO_BATCH_WINDOW_MS, MICRO_BATCH_MAX_SIZE)
+        await batcher.start()
+
+    if PREDICTION_LOG_ENABLED:
+        prediction_logger = PredictionLogger(
+            PREDICTION_LOG_DIR, PREDICTION_LOG_FORMAT, PREDICTION_LOG_CAPACITY,
+            PREDICTION_LOG_FLUSH_SIZE, PREDICTION_LOG_FLUSH_INTERVAL_S,
+            # Com varios workers cada processo escreve o proprio arquivo
+            filename=f"predictions-w{os.getpid()}.jsonl" if SERVING_WORKERS > 1 else "predictions.jsonl"
+        )
+        await prediction_logger.start()
+
+    print(f"Startup timing: {startup_report()}")
     
     yield  # Aqui a API "roda". O que vem depois do yield é no shutdown.
     print("Shutting down API...")
+    registry.stop_watching()
+    if readiness is not None:
+        readiness.mark_stopped()
+    if batcher is not None:
+        await batcher.stop()
+        batcher = None
+    if prediction_logger is not None:
+        # Grava o que ainda estiver no buffer antes de sair
+        await prediction_logger.stop()
+        prediction_logger = None
+    score_store.close()
 
 app = FastAPI(title="Passos Mágicos - School Lag Prediction API", lifespan=lifespan)
 
 MODEL_PATH = os.path.join(ARTIFACTS_DIR, 'model.joblib')
 
-# Carrega o modelo globalmente quando iniciar o carregamento apos cada request
-model = None
+# Engine de inferencia: 'sklearn' (Pipeline) ou 'numpy' (modelo compilado). O padrao
+# e o mesmo do api.serve, do Docker e da tabela de scores (score_table.SERVED_ENGINE)
+MODEL_ENGINE = os.environ.get("MODEL_ENGINE", "numpy")
 
-def load_model():
-    global model
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-        print("Model loaded successfully.")
-    else:
-        print(f"Warning: Model not found at {MODEL_PATH}. API will not be able to predict.")
+# Intervalo (s) para verificar se ha um novo artefato em ARTIFACTS_DIR; 0 desliga
+MODEL_WATCH_INTERVAL_S = float(os.environ.get("MODEL_WATCH_INTERVAL_S", "30"))
+registry = None
+
+# Limite de alunos por chamada ao /predict/batch (configuravel via ambiente)
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+
+# Micro-batching do /predict: tamanho maximo do lote (1 desliga) e janela de espera. Sem
+# janela (padrao) so agrupa o que chega enquanto um lote roda; uma requisicao sozinha nao espera
+MICRO_BATCH_WINDOW_MS = float(os.environ.get("MICRO_BATCH_WINDOW_MS", "0"))
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", "64"))
+batcher = None
+
+# Cache de previsoes: tamanho maximo (0 desliga), TTL e arquivo SQLite opcional compartilhado entre workers
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL_S = float(os.environ.get("PREDICTION_CACHE_TTL_S", "3600"))
+PREDICTION_CACHE_PATH = os.environ.get("PREDICTION_CACHE_PATH")
+prediction_cache = (
+    PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_S, PREDICTION_CACHE_PATH)
+    if PREDICTION_CACHE_SIZE > 0 else None
+)
+# Log de previsoes em background (buffer circular + gravacao em lote)
+PREDICTION_LOG_ENABLED = os.environ.get("PREDICTION_LOG_ENABLED", "1") == "1"
+PREDICTION_LOG_DIR = os.environ.get("PREDICTION_LOG_DIR", LOGS_DIR)
+PREDICTION_LOG_FORMAT = os.environ.get("PREDICTION_LOG_FORMAT", "jsonl")
+PREDICTION_LOG_CAPACITY = int(os.environ.get("PREDICTION_LOG_CAPACITY", "10000"))
+PREDICTION_LOG_FLUSH_SIZE = int(os.environ.get("PREDICTION_LOG_FLUSH_SIZE", "1000"))
+PREDICTION_LOG_FLUSH_INTERVAL_S = float(os.environ.get("PREDICTION_LOG_FLUSH_INTERVAL_S", "1"))
+prediction_logger = None
+
+# Workers iniciados por api/serve.py; cada um marca a propria prontidao em SERVING_STATE_DIR
+SERVING_WORKERS = int(os.environ.get("SERVING_WORKERS", "1"))
+SERVING_STATE_DIR = os.environ.get("SERVING_STATE_DIR")
+readiness = WorkerReadiness(SERVING_STATE_DIR, SERVING_WORKERS) if SERVING_STATE_DIR else None
+
+# Scores pre-calculados da base (python -m src.models.score_table), consultados por RA
+SCORE_TABLE_PATH = os.environ.get("SCORE_TABLE_PATH", os.path.join(PROCESSED_DATA_DIR, 'risk_scores.sqlite'))
+score_store = ScoreStore(SCORE_TABLE_PATH)
+
+# Devolve o tempo de cada etapa no header Server-Timing (depuracao)
+METRICS_DEBUG_HEADER = os.environ.get("METRICS_DEBUG_HEADER", "0") == "1"
+
+class ServedModel(NamedTuple):
+    """
+    Modelo em uso, limiar de P(risco) escolhido no treino
+    (models_artifacts/model_threshold.json; None = 0.5) e hash do artefato,
+    que entra na chave do cache.
+    """
+    model: object = None
+    threshold: float | None = None
+    fingerprint: str | None = None
+
+# Trocado pelo ModelRegistry em uma unica atribuicao: cada requisicao le `served` uma vez
+# e usa modelo, limiar e fingerprint da mesma versao (as em andamento mantem a antiga)
+served = ServedModel()
+
+def swap_model(new_model, fingerprint):
+    global served
+    threshold = registry.threshold if registry is not None else None
+    served = ServedModel(new_model, threshold, fingerprint)
+    if readiness is not None:
+        readiness.mark_ready(fingerprint)
 
 class StudentData(BaseModel):
     idade_22: float
@@ -47,6 +147,12 @@ class StudentData(BaseModel):
     portug: float
     ingles: float
 
+    @model_validator(mode='wrap')
+    @classmethod
+    def timed_validation(cls, data, handler):
+        with METRICS.stage('validate'):
+            return handler(data)
+
     # Map to DataFrame columns expected by the model
     def to_dict(self):
         return {
@@ -64,32 +170,325 @@ class StudentData(BaseModel):
             'Inglês': [self.ingles]
         }
 
+class StudentBatch(BaseModel):
+    students: list[StudentData]
+
+def students_to_frame(students, model):
+    """
+    Monta a entrada do modelo (uma linha por aluno, na ordem de entrada).
+
+    DataFrame para o Pipeline do sklearn; dict de colunas para a engine
+    NumPy, que assim nao precisa importar pandas.
+    """
+    with METRICS.stage('frame'):
+        columns = {}
+        for student in students:
+            for col, values in student.to_dict().items():
+                columns.setdefault(col, []).extend(values)
+        return as_model_input(model, columns)
+
+def score_students(students, current):
+    """
+    Probabilidade da classe 1 para cada aluno, com uma unica passada do modelo.
+    """
+    started = time.perf_counter()
+    data = students_to_frame(students, current.model)
+    with METRICS.stage('model'):
+        probability = current.model.predict_proba(data)
+    record('first_prediction', time.perf_counter() - started)
+    return probability[:, 1]
+
+def score_queued(students):
+    # Lote do micro-batcher: um unico modelo para todos, e cada resultado leva a versao que o calculou
+    current = served
+    return [(p, current) for p in score_students(students, current)]
+
+def explain_students(students, current):
+    """
+    P(risco) e a contribuicao de cada coluna para cada aluno (decomposicao pelos caminhos das arvores).
+    """
+    model = current.model
+    if not hasattr(model, 'explain'):
+        raise HTTPException(status_code=501, detail="Explanations not supported by the loaded model")
+    data = students_to_frame(students, model)
+    with METRICS.stage('explain'):
+        probability, base_value, contributions = model.explain(data)
+    columns = model.explain_columns
+    return probability, [format_explanation(base_value, row, columns) for row in contributions]
+
+def format_explanation(base_value, contributions, columns):
+    # Maior impacto absoluto primeiro: o que mais empurrou P(risco) para cima ou para baixo
+    order = sorted(range(len(columns)), key=lambda i: -abs(contributions[i]))
+    return {
+        "base_value": float(base_value),
+        "contributions": {columns[i]: float(contributions[i]) for i in order},
+    }
+
+def student_cache_key(student, current):
+    # Sem fingerprint nao ha como invalidar as entradas, entao o cache fica de fora
+    if prediction_cache is None or current.fingerprint is None:
+        return None
+    # Forma canonica so na chave (numeros arredondados, textos NFC sem espacos nas pontas):
+    # o modelo e o log recebem os valores como enviados
+    features = [canonical_str(v) if isinstance(v, str) else canonical_float(v)
+                for v in (values[0] for values in student.to_dict().values())]
+    return cache_key(features, current.fingerprint)
+
+def log_prediction(student, risk_probability, started_at, current, cached=False):
+    if prediction_logger is None:
+        return
+    with METRICS.stage('log'):
+        features = {col: values[0] for col, values in student.to_dict().items()}
+        latency_ms = (time.perf_counter() - started_at) * 1000.0
+        model_version = current.fingerprint[:12] if current.fingerprint else None
+        prediction_logger.log(prediction_record(features, risk_probability, model_version, latency_ms, cached))
+
+def format_prediction(risk_probability, threshold):
+    # Limiar aplicado sobre a probabilidade ja calculada: nenhuma passada extra pela floresta
+    return label_response(bool(is_risk(risk_probability, threshold)), risk_probability)
+
+def label_response(risk, risk_probability):
+    return {
+        "risk_of_lag": risk,
+        "risk_probability": float(risk_probability),
+        "message": "High risk of lag" if risk else "Low risk of lag"
+    }
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Conta requisicoes/erros e mede a duracao por rota; as etapas medidas durante
+    a requisicao vao para o header Server-Timing quando METRICS_DEBUG_HEADER=1.
+    """
+    started_at = time.perf_counter()
+    with request_timings() as timings:
+        try:
+            response = await call_next(request)
+        except Exception:
+            METRICS.observe_request(route_path(request), 500, time.perf_counter() - started_at)
+            raise
+    elapsed = time.perf_counter() - started_at
+    METRICS.observe_request(route_path(request), response.status_code, elapsed)
+    if METRICS_DEBUG_HEADER:
+        response.headers['Server-Timing'] = server_timing({**timings, 'total': elapsed})
+    return response
+
+def route_path(request):
+    # Template da rota (ex.: /predict/batch), nao a URL: mantem a cardinalidade dos rotulos baixa
+    route = request.scope.get('route')
+    return route.path if route is not None else 'unmatched'
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Passos Mágicos Lag Prediction API"}
 
 @app.post("/predict")
-def predict(student: StudentData):
-    global model
-    if model is None:
+async def predict(student: StudentData, explain: bool = False):
+    current = served
+    if current.model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    started_at = time.perf_counter()
+    key = student_cache_key(student, current)
     try:
-        # Convert input to DataFrame
-        input_data = pd.DataFrame(student.to_dict())
-        
-        # Predict
-        prediction = model.predict(input_data)
-        probability = model.predict_proba(input_data)
-        
-        # Expected prediction is 0 (No Risk) or 1 (Risk)
-        risk = bool(prediction[0])
-        risk_probability = float(probability[0][1]) # Probability of class 1
-        
-        return {
-            "risk_of_lag": risk,
-            "risk_probability": risk_probability,
-            "message": "High risk of lag" if risk else "Low risk of lag"
-        }
+        if explain:
+            # Explicacao sai do mesmo percurso das arvores que calcula P(risco); sem cache nem batcher
+            probability, explanations = await run_in_threadpool(explain_students, [student], current)
+            if key is not None:
+                prediction_cache.set(key, probability[0])
+            log_prediction(student, probability[0], started_at, current)
+            return {**format_prediction(probability[0], current.threshold), "explanation": explanations[0]}
+
+        if key is not None:
+            with METRICS.stage('cache'):
+                cached = prediction_cache.get(key)
+            if cached is not None:
+                log_prediction(student, cached, started_at, current, cached=True)
+                return format_prediction(cached, current.threshold)
+
+        if batcher is not None:
+            # Entra na fila e e avaliado junto com as requisicoes concorrentes
+            # (frame/model sao medidos na task do batcher, fora desta requisicao).
+            # O lote pode rodar com um modelo mais novo: cache, log e limiar seguem a versao dele
+            with METRICS.stage('batch'):
+                risk_probability, current = await batcher.submit(student)
+            key = student_cache_key(student, current)
+        else:
+            risk_probability = (await run_in_threadpool(score_students, [student], current))[0]
+
+        if key is not None:
+            with METRICS.stage('cache'):
+                prediction_cache.set(key, risk_probability)
+        log_prediction(student, risk_probability, started_at, current)
+        return format_prediction(risk_probability, current.threshold)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+@app.get("/predict/batching")
+def batching_stats():
+    """
+    Distribuicao do tamanho dos lotes e do tempo de espera na fila do micro-batcher.
+    """
+    if batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **batcher.stats()}
+
+@app.post("/predict/batch")
+def predict_batch(batch: StudentBatch, explain: bool = False):
+    current = served
+    if current.model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    if len(batch.students) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(batch.students)} students (max {MAX_BATCH_SIZE})"
+        )
+
+    if not batch.students:
+        return {"predictions": []}
+
+    started_at = time.perf_counter()
+    try:
+        if explain:
+            probability, explanations = explain_students(batch.students, current)
+            for student, p in zip(batch.students, probability):
+                key = student_cache_key(student, current)
+                if key is not None:
+                    prediction_cache.set(key, p)
+                log_prediction(student, p, started_at, current)
+            return {"predictions": [
+                {**format_prediction(p, current.threshold), "explanation": e} for p, e in zip(probability, explanations)
+            ]}
+
+        with METRICS.stage('cache'):
+            keys = [student_cache_key(student, current) for student in batch.students]
+            probability = [prediction_cache.get(key) if key is not None else None for key in keys]
+        missing = [i for i, p in enumerate(probability) if p is None]
+
+        if missing:
+            # Uma unica passada pela floresta so para quem nao estava no cache
+            scored = score_students([batch.students[i] for i in missing], current)
+            for i, p in zip(missing, scored):
+                probability[i] = p
+                if keys[i] is not None:
+                    prediction_cache.set(keys[i], p)
+
+        missing_set = set(missing)
+        for i, (student, p) in enumerate(zip(batch.students, probability)):
+            log_prediction(student, p, started_at, current, cached=i not in missing_set)
+
+        # Os rotulos derivam das probabilidades
+        return {"predictions": [format_prediction(p, current.threshold) for p in probability]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+@app.get("/predict/cache")
+def cache_stats():
+    """
+    Contadores de acerto/falha e ocupacao do cache de previsoes.
+    """
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, "model_fingerprint": served.fingerprint, **prediction_cache.stats()}
+
+@app.get("/predict/log")
+def log_stats():
+    """
+    Registros enfileirados, gravados e descartados pelo log de previsoes.
+    """
+    if prediction_logger is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_logger.stats()}
+
+@app.get("/students/{student_id}/risk")
+def student_risk(student_id: str):
+    """
+    Score pre-calculado de um aluno da base: busca pela chave na tabela de
+    scores, sem passar pelo modelo. O rotulo e o gravado com o score (limiar do
+    modelo que pontuou); `current_model` diz se a linha e do modelo servido.
+    """
+    try:
+        with METRICS.stage('score_lookup'):
+            row = score_store.get(student_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Student {student_id} not found in score table")
+    risk_probability, prediction, version, scored_at = row
+    fingerprint = served.fingerprint
+    return {
+        "student_id": student_id,
+        **label_response(bool(prediction), risk_probability),
+        "model_version": version,
+        # False logo apos um reload, ate a tabela ser repontuada com o modelo novo
+        "current_model": fingerprint is not None and version == fingerprint[:12],
+        "scored_at": scored_at,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Metricas no formato texto do Prometheus: versao do modelo, requisicoes e
+    erros por rota e histogramas de latencia por rota e por etapa.
+    """
+    current = served
+    info = {
+        "engine": MODEL_ENGINE,
+        "version": current.fingerprint[:12] if current.fingerprint else "none",
+        "loaded": str(current.model is not None).lower(),
+    }
+    return PlainTextResponse(METRICS.render(info), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+def health():
+    """
+    Liveness: o processo responde.
+    """
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness: 200 so quando todos os workers tem o modelo carregado (503 antes disso).
+    """
+    if readiness is None:
+        loaded = served.model is not None
+        status = {"ready": loaded, "expected_workers": 1, "ready_workers": int(loaded)}
+    else:
+        status = readiness.status()
+    if not status["ready"]:
+        raise HTTPException(status_code=503, detail=status)
+    return status
+
+@app.get("/admin/model")
+def model_status():
+    if registry is None:
+        return {"loaded": served.model is not None}
+    return {"loaded": served.model is not None, **registry.status()}
+
+@app.get("/admin/startup")
+def startup_timing():
+    """
+    Tempo de import por grupo de modulos, carga do modelo e primeira previsao.
+    """
+    return startup_report()
+
+@app.post("/admin/reload")
+def reload_model():
+    """
+    Carrega o artefato atual e troca o modelo se ele mudou.
+
+    Roda na threadpool (as outras requisicoes seguem com o modelo antigo), mas
+    a resposta so sai depois da carga e do aquecimento, com o resultado da troca.
+    """
+    if registry is None:
+        raise HTTPException(status_code=503, detail="Model registry not started")
+    reloaded = registry.reload()
+    if registry.last_error:
+        raise HTTPException(status_code=500, detail=f"Reload error: {registry.last_error}")
+    return {"reloaded": reloaded, **registry.status()}
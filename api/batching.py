@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+# Limites superiores dos buckets dos histogramas
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+def _bucket_counts(buckets):
+    return {str(b): 0 for b in buckets} | {"+Inf": 0}
+
+
+def _observe(counts, buckets, value):
+    for b in buckets:
+        if value <= b:
+            counts[str(b)] += 1
+            return
+    counts["+Inf"] += 1
+
+
+class MicroBatcher:
+    """
+    Agrupa requisicoes concorrentes do /predict em um unico lote.
+
+    Cada chamada a submit() entra em uma fila; o worker roda score_fn uma vez
+    em uma thread para o lote e resolve o future de cada chamador com o seu
+    resultado, na ordem de entrada.
+
+    Com max_wait_ms=0 (padrao) nao ha espera: uma requisicao sozinha vai direto
+    para o modelo, e as que chegam enquanto um lote roda formam o proximo. Com
+    max_wait_ms > 0 o worker ainda espera ate essa janela (ou ate juntar
+    max_batch_size itens) antes de cada lote.
+    """
+
+    def __init__(self, score_fn, max_wait_ms=0.0, max_batch_size=64):
+        self.score_fn = score_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._wakeup = None
+        self._task = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.batches = 0
+        self.items = 0
+        self.batch_size_hist = _bucket_counts(BATCH_SIZE_BUCKETS)
+        self.queue_wait_hist = _bucket_counts(QUEUE_WAIT_BUCKETS_MS)
+        self.queue_wait_sum_ms = 0.0
+        self.queue_wait_max_ms = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Quem ainda estava na fila recebe erro em vez de ficar pendurado
+        while not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, item):
+        if self._task is None:
+            raise RuntimeError("Batcher not started")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        if self.max_wait <= 0:
+            # So o que ja esta na fila (chegou durante o lote anterior), sem esperar o relogio
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            return batch
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        _observe(self.batch_size_hist, BATCH_SIZE_BUCKETS, len(batch))
+        for _, _, enqueued_at in batch:
+            wait_ms = (now - enqueued_at) * 1000.0
+            self.queue_wait_sum_ms += wait_ms
+            self.queue_wait_max_ms = max(self.queue_wait_max_ms, wait_ms)
+            _observe(self.queue_wait_hist, QUEUE_WAIT_BUCKETS_MS, wait_ms)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._record(batch)
+            items = [item for item, _, _ in batch]
+            try:
+                # O modelo roda fora do event loop; enquanto isso a fila continua enchendo
+                results = await asyncio.to_thread(self.score_fn, items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(self.batch_size_hist),
+            "queue_wait_ms": {
+                "mean": self.queue_wait_sum_ms / self.items if self.items else 0.0,
+                "max": self.queue_wait_max_ms,
+                "histogram": dict(self.queue_wait_hist),
+            },
+        }
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+from src.models.compiled_model import CompiledModel, load_compiled_model
+from src.models.feature_encoder import EncodedPipeline, encode_pipeline
+from src.models.threshold import load_threshold
+from src.utils.fingerprint import artifact_fingerprint
+from api.startup_timing import lazy_import
+
+# Modulos do sklearn que o Pipeline salvo precisa; so sao importados com a engine 'sklearn'
+SKLEARN_MODULES = (
+    'sklearn.pipeline', 'sklearn.compose', 'sklearn.impute', 'sklearn.preprocessing', 'sklearn.ensemble',
+)
+
+# Linhas sinteticas usadas para aquecer um modelo recem-carregado antes da troca
+WARMUP_ROWS = {
+    'Idade 22': [10.0, 15.0, 18.0],
+    'Gênero': ['Menina', 'Menino', 'Menina'],
+    'Instituição de ensino': ['Escola Pública', 'Rede Decisão', 'Escola Pública'],
+    'Pedra 22': ['Quartzo', 'Ametista', 'Topázio'],
+    'INDE 22': [5.5, 7.5, 8.5],
+    'IAA': [7.0, 8.0, 9.0],
+    'IEG': [6.0, 6.5, 8.0],
+    'IPS': [6.0, 7.0, 7.5],
+    'IDA': [5.0, 7.2, 8.0],
+    'Matem': [4.0, 6.0, 8.0],
+    'Portug': [5.0, 6.5, 8.0],
+    'Inglês': [4.5, 8.0, 7.0],
+}
+
+
+def as_model_input(model, columns):
+    """
+    Colunas -> entrada do modelo: CompiledModel e EncodedPipeline aceitam o dict
+    direto; outros modelos precisam de um DataFrame (pandas so e importado aqui).
+    """
+    if isinstance(model, (CompiledModel, EncodedPipeline)):
+        return columns
+    return lazy_import('pandas').DataFrame(columns)
+
+
+class ModelRegistry:
+    """
+    Carrega o artefato do modelo e o substitui sem derrubar a API.
+
+    O novo modelo e carregado em background (joblib ou .npz memory-mapped),
+    aquecido com WARMUP_ROWS e so entao entregue a on_swap.
+    Requisicoes em andamento terminam com a referencia antiga.
+
+    O fingerprint inclui o sidecar do limiar: um treino que so muda o limiar
+    (mesmo artefato byte a byte) tambem troca a versao servida.
+    """
+
+    def __init__(self, model_path, compiled_path=None, engine='sklearn', on_swap=None, poll_interval_s=0,
+                 threshold_path=None):
+        self.model_path = model_path
+        self.threshold_path = threshold_path
+        self.compiled_path = compiled_path
+        self.engine = engine
+        self.on_swap = on_swap
+        self.poll_interval = poll_interval_s
+        self.model = None
+        self.threshold = None
+        self.fingerprint = None
+        self.loaded_path = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.reloads = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._watched_mtime = None
+
+    def artifact_path(self):
+        if self.engine == 'numpy' and self.compiled_path and os.path.exists(self.compiled_path):
+            return self.compiled_path
+        return self.model_path
+
+    def _mtimes(self, path):
+        # Artefato e sidecar do limiar: qualquer um dos dois mudando dispara o reload
+        threshold_mtime = None
+        if self.threshold_path and os.path.exists(self.threshold_path):
+            threshold_mtime = os.path.getmtime(self.threshold_path)
+        return os.path.getmtime(path), threshold_mtime
+
+    def _load(self, path):
+        if path == self.compiled_path:
+            return load_compiled_model(path, mmap=True)
+        for name in SKLEARN_MODULES:
+            lazy_import(name)
+        # mmap_mode so mapeia os arrays pequenos (classes_, estatisticas do scaler): o
+        # __setstate__ das arvores do sklearn copia os nos, entao cada worker tem a sua copia.
+        # O ColumnTransformer e trocado pelo FeatureEncoder (sem pandas por requisicao)
+        return encode_pipeline(lazy_import('joblib').load(path, mmap_mode='r'))
+
+    def reload(self, force=False):
+        """
+        Carrega o artefato atual se ele mudou. Retorna True quando houve troca.
+        """
+        # Um reload por vez; quem chegar depois ve o fingerprint ja atualizado
+        with self._lock:
+            path = self.artifact_path()
+            if not os.path.exists(path):
+                print(f"Warning: Model not found at {path}. API will not be able to predict.")
+                return False
+            self._watched_mtime = self._mtimes(path)
+            fingerprint = artifact_fingerprint(path, self.threshold_path)
+            if fingerprint == self.fingerprint and not force:
+                return False
+
+            started = time.perf_counter()
+            try:
+                model = self._load(path)
+                model.predict_proba(as_model_input(model, WARMUP_ROWS))
+                # Limiar de decisao salvo no treino junto com este artefato (None = 0.5)
+                threshold = load_threshold(self.threshold_path)
+            except Exception as e:
+                # Artefato quebrado nao substitui o modelo que ja esta servindo
+                self.last_error = f"{path}: {e}"
+                print(f"Warning: failed to load model from {path}: {e}")
+                return False
+
+            self.model, self.threshold, self.fingerprint, self.loaded_path = model, threshold, fingerprint, path
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - started
+            self.reloads += 1
+            self.last_error = None
+            if self.on_swap is not None:
+                self.on_swap(model, fingerprint)
+            print(f"Model loaded successfully from {path} ({fingerprint[:12]}).")
+            return True
+
+    def start_watching(self):
+        """
+        Verifica o mtime do artefato a cada poll_interval_s em uma thread.
+        """
+        if self.poll_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            path = self.artifact_path()
+            try:
+                mtimes = self._mtimes(path)
+            except OSError:
+                continue
+            if mtimes != self._watched_mtime:
+                self.reload()
+
+    def status(self):
+        return {
+            "engine": self.engine,
+            "path": self.loaded_path,
+            "model_fingerprint": self.fingerprint,
+            "decision_threshold": self.threshold,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "reloads": self.reloads,
+            "watching": self._watcher is not None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Casas decimais mais finas presentes no dataset (INDE 22 tem 3, o resto 1)
+FLOAT_DECIMALS = 3
+
+
+def canonical_float(value):
+    return round(float(value), FLOAT_DECIMALS)
+
+
+def canonical_str(value):
+    # NFC para que 'Ágata' composto e decomposto sejam a mesma categoria
+    return unicodedata.normalize('NFC', value).strip()
+
+
+def cache_key(features, model_fingerprint):
+    """
+    Hash estavel do vetor de features canonico + impressao digital do modelo.
+
+    Como o fingerprint entra na chave, um novo model.joblib invalida
+    automaticamente todas as entradas antigas.
+    """
+    payload = json.dumps([model_fingerprint, features], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    """
+    Cache LRU com TTL para P(risco) por aluno.
+
+    Em memoria por padrao; com `path` usa um arquivo SQLite compartilhado, de
+    modo que varios workers do uvicorn reaproveitam as mesmas entradas (no
+    disco as entradas mais antigas sao descartadas primeiro).
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=3600.0, path=None):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key TEXT PRIMARY KEY, value REAL NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            value = self._get_db(key, now) if self._db else self._get_memory(key, now)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _get_memory(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if now - created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _get_db(self, key, now):
+        row = self._db.execute(
+            "SELECT value FROM predictions WHERE key = ? AND created >= ?", (key, now - self.ttl)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            if self._db:
+                self._set_db(key, float(value), now)
+            else:
+                self._entries[key] = (float(value), now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+    def _set_db(self, key, value, now):
+        self._db.execute(
+            "INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)", (key, value, now)
+        )
+        self._writes += 1
+        # Limpeza periodica: expirados e excedentes do limite de tamanho
+        if self._writes % 100 == 0:
+            self._db.execute("DELETE FROM predictions WHERE created < ?", (now - self.ttl,))
+            cursor = self._db.execute(
+                "DELETE FROM predictions WHERE key IN ("
+                "SELECT key FROM predictions ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            if self._db:
+                return self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite" if self._db else "memory",
+            "size": len(self),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
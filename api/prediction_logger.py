@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from api.startup_timing import lazy_import
+
+FORMATS = ('jsonl', 'parquet')
+
+
+class PredictionLogger:
+    """
+    Log de previsoes sem bloquear o handler.
+
+    log() so coloca o registro em um buffer circular em memoria; uma task em
+    background grava em lote (por tamanho ou tempo) em segmentos JSONL com
+    rotacao ou em arquivos Parquet. Com o buffer cheio, os registros mais
+    antigos sao descartados e contados em `dropped`. log() pode ser chamado
+    de varias threads (handlers sync): buffer e contadores ficam sob um lock.
+    """
+
+    def __init__(self, log_dir, fmt='jsonl', capacity=10000, flush_size=1000,
+                 flush_interval_s=1.0, segment_max_bytes=50 * 1024 * 1024, filename='predictions.jsonl'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato invalido: {fmt}. Opcoes: {FORMATS}")
+        self.log_dir = log_dir
+        self.fmt = fmt
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_s
+        self.segment_max_bytes = segment_max_bytes
+        self.current_path = os.path.join(log_dir, filename)
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=capacity)
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.segments = 0
+
+    def log(self, record):
+        with self._lock:
+            if len(self._buffer) == self.capacity:
+                self.dropped += 1
+            self._buffer.append(record)
+            self.logged += 1
+            buffered = len(self._buffer)
+        if self._loop is not None and buffered >= self.flush_size and not self._wakeup.is_set():
+            # log() pode vir de handlers sync (threadpool), entao acorda a task via loop
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Para a task de background e grava o que ainda estiver no buffer.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await self.flush()
+
+    async def flush(self):
+        records = self._drain()
+        if records:
+            await asyncio.to_thread(self._write, records)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Falha de disco nao pode derrubar a API; os registros do lote se perdem
+                print(f"Warning: prediction log flush failed: {e}")
+
+    def _drain(self):
+        with self._lock:
+            records = list(self._buffer)
+            self._buffer.clear()
+        return records
+
+    def _write(self, records):
+        if self.fmt == 'parquet':
+            self._write_parquet(records)
+        else:
+            self._write_jsonl(records)
+        self.written += len(records)
+
+    def _segment_name(self, extension):
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        self.segments += 1
+        return os.path.join(self.log_dir, f"predictions-{stamp}-{os.getpid()}-{self.segments:05d}.{extension}")
+
+    def _write_jsonl(self, records):
+        lines = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+        with open(self.current_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+        # Rotacao: o arquivo atual vira um segmento fechado e o proximo lote comeca outro
+        if os.path.getsize(self.current_path) >= self.segment_max_bytes:
+            os.replace(self.current_path, self._segment_name('jsonl'))
+
+    def _write_parquet(self, records):
+        # Parquet nao aceita append: cada lote vira um segmento
+        pa = lazy_import('pyarrow')
+        pq = lazy_import('pyarrow.parquet')
+        rows = [{**r, 'features': json.dumps(r.get('features', {}), ensure_ascii=False)} for r in records]
+        pq.write_table(pa.Table.from_pylist(rows), self._segment_name('parquet'))
+
+    def stats(self):
+        return {
+            "format": self.fmt,
+            "log_dir": self.log_dir,
+            "buffered": len(self._buffer),
+            "capacity": self.capacity,
+            "logged": self.logged,
+            "written": self.written,
+            "dropped": self.dropped,
+            "segments": self.segments,
+        }
+
+
+def prediction_record(features, risk_probability, model_version, latency_ms, cached=False):
+    return {
+        "timestamp": time.time(),
+        "model_version": model_version,
+        "features": features,
+        "risk_probability": float(risk_probability),
+        "latency_ms": latency_ms,
+        "cached": cached,
+    }
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkerReadiness:
+    """
+    Prontidao compartilhada entre os workers de api/serve.py.
+
+    Cada worker grava um marcador worker-<pid>.json em state_dir quando tem um
+    modelo carregado; o conjunto so esta pronto quando ha `expected` marcadores
+    de processos vivos (marcadores de workers que morreram sao ignorados).
+    """
+
+    def __init__(self, state_dir, expected_workers):
+        self.state_dir = state_dir
+        self.expected = expected_workers
+
+    def _path(self, pid):
+        return os.path.join(self.state_dir, f"worker-{pid}.json")
+
+    def mark_ready(self, fingerprint, pid=None):
+        pid = pid or os.getpid()
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._path(pid)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"pid": pid, "model_fingerprint": fingerprint, "ready_at": time.time()}, f)
+        os.replace(tmp_path, path)
+
+    def mark_stopped(self, pid=None):
+        try:
+            os.remove(self._path(pid or os.getpid()))
+        except FileNotFoundError:
+            pass
+
+    def workers(self):
+        workers = []
+        if not os.path.isdir(self.state_dir):
+            return workers
+        for name in sorted(os.listdir(self.state_dir)):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if pid_alive(worker['pid']):
+                workers.append(worker)
+        return workers
+
+    def status(self):
+        workers = self.workers()
+        return {
+            "ready": len(workers) >= self.expected,
+            "expected_workers": self.expected,
+            "ready_workers": len(workers),
+            "model_fingerprints": sorted({w['model_fingerprint'] for w in workers}),
+            "workers": workers,
+        }
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import threading
+
+
+class ScoreStore:
+    """
+    Leitura da tabela de scores pre-calculados (src/models/score_table.py).
+
+    Conexao SQLite somente leitura, aberta na primeira consulta: o job que
+    atualiza a tabela pode rodar com a API no ar (WAL), e a API sobe mesmo
+    antes da primeira pontuacao da base.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._db is None:
+            if not os.path.exists(self.path):
+                return None
+            self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=5.0, check_same_thread=False)
+        return self._db
+
+    def get(self, student_id):
+        """
+        (risk_probability, prediction, model_version, scored_at) do aluno, ou None.
+
+        Raises FileNotFoundError se a tabela ainda nao foi gerada.
+        """
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                raise FileNotFoundError(f"Score table not found at {self.path}")
+            row = db.execute(
+                "SELECT risk_probability, prediction, model_version, scored_at FROM scores WHERE student_id = ?",
+                (student_id,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return row
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
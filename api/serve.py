@@ -0,0 +1,83 @@
+import argparse
+import math
+import os
+import shutil
+import tempfile
+
+# Quotas de CPU do cgroup (v2 e v1), usadas por Docker/Kubernetes/Cloud Run
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    """
+    Limite de CPUs imposto pelo cgroup do container (None se nao houver).
+    """
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return max(1, math.ceil(int(quota) / int(period)))
+    return None
+
+
+def available_cpus():
+    """
+    CPUs que o processo pode usar: afinidade e quota do cgroup, nao os nucleos do host.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sobe a API com um worker por CPU disponivel.")
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVING_WORKERS', '0')),
+                        help="Numero de processos (0 = CPUs disponiveis)")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or available_cpus()
+
+    # Os workers herdam o ambiente: engine NumPy (arvores em .npz memory-mapped,
+    # uma unica copia fisica no page cache) e um thread de BLAS/OpenMP por processo.
+    # A engine NumPy ganha ate ~1000 linhas por chamada (o teto do /predict/batch);
+    # acima disso o sklearn e mais rapido (ver README, "Qual engine usar")
+    os.environ.setdefault('MODEL_ENGINE', 'numpy')
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(var, '1')
+    if os.environ['MODEL_ENGINE'] != 'numpy':
+        print("Warning: com MODEL_ENGINE=sklearn cada worker guarda uma copia propria das arvores.")
+
+    # Diretorio novo a cada start: marcadores de prontidao de execucoes antigas nao contam
+    state_dir = tempfile.mkdtemp(prefix='passos-serving-')
+    os.environ['SERVING_WORKERS'] = str(workers)
+    os.environ['SERVING_STATE_DIR'] = state_dir
+
+    import uvicorn
+    print(f"Starting {workers} worker(s) on {args.host}:{args.port}.")
+    try:
+        uvicorn.run('api.app:app', host=args.host, port=args.port, workers=workers)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+
+# Tempos de inicializacao da API (segundos), expostos em /admin/startup
+STARTUP = {
+    'imports': {},
+    'model_load': None,
+    'first_prediction': None,
+}
+
+_started_at = time.perf_counter()
+
+
+@contextmanager
+def timed_import(name):
+    """
+    Mede o tempo de um bloco de imports e registra em STARTUP['imports'].
+    """
+    start = time.perf_counter()
+    yield
+    STARTUP['imports'][name] = time.perf_counter() - start
+
+
+def lazy_import(name):
+    """
+    Importa um modulo pesado so quando ele e usado pela primeira vez, registrando o custo.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with timed_import(name):
+        module = importlib.import_module(name)
+    return module
+
+
+def record(key, seconds):
+    if STARTUP[key] is None:
+        STARTUP[key] = seconds
+
+
+def startup_report():
+    return {
+        'imports': dict(STARTUP['imports']),
+        'import_total': sum(STARTUP['imports'].values()),
+        'model_load': STARTUP['model_load'],
+        'first_prediction': STARTUP['first_prediction'],
+        'since_startup': time.perf_counter() - _started_at,
+        'heavy_modules_loaded': [m for m in ('pandas', 'sklearn', 'pyarrow', 'scipy', 'mlflow', 'evidently')
+                                 if m in sys.modules],
+    }
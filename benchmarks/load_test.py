@@ -0,0 +1,356 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+import httpx
+
+from benchmarks.synthetic import PAYLOAD_FIELDS, generate_students, student_payloads
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARKS_DIR)
+LOAD_TEST_PATH = os.path.join(BENCHMARKS_DIR, 'load_test.json')
+
+SOURCES = ('synthetic', 'training')
+ARRIVALS = ('poisson', 'constant')
+
+# Taxas (req/s) da curva de saturacao padrao
+RATES = (10, 25, 50, 100, 200, 400)
+
+# Criterios de saturacao: vazao abaixo de 90% da oferecida, p99 acima do SLO ou mais de 1% de erros
+MIN_THROUGHPUT_RATIO = 0.9
+MAX_ERROR_RATE = 0.01
+SLO_P99_MS = 200.0
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def training_payloads(n_rows, seed=42):
+    """
+    Alunos do PEDE2022 sorteados com reposicao (so linhas com todas as features preenchidas).
+    """
+    from src.data.load_data import load_raw_data
+    df = load_raw_data(columns=list(PAYLOAD_FIELDS.values())).dropna()
+    return student_payloads(df.sample(n_rows, replace=True, random_state=seed))
+
+
+def read_payloads(paths):
+    """
+    Payloads de arquivos JSONL: uma requisicao do /predict por linha, ou um
+    registro do log de previsoes da API (as features voltam aos campos do StudentData).
+    """
+    fields = {col: field for field, col in PAYLOAD_FIELDS.items()}
+    payloads = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'features' in record:
+                    record = {fields[col]: value for col, value in record['features'].items() if col in fields}
+                payloads.append(record)
+    if not payloads:
+        raise ValueError(f"Nenhum payload em {paths}")
+    return payloads
+
+
+def arrival_times(rate, duration_s, arrival='poisson', seed=0):
+    """
+    Instantes de envio (segundos desde o inicio do passo) para uma taxa media de `rate` req/s.
+    """
+    if arrival not in ARRIVALS:
+        raise ValueError(f"Chegada invalida: {arrival}. Opcoes: {ARRIVALS}")
+    if arrival == 'constant':
+        return np.arange(int(rate * duration_s)) / rate
+    rng = np.random.default_rng(seed)
+    # Intervalos exponenciais: alguns a mais que o esperado e corta no fim do passo
+    gaps = rng.exponential(1.0 / rate, int(rate * duration_s * 1.5) + 10)
+    times = np.cumsum(gaps) - gaps[0]
+    return times[times < duration_s]
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if len(latencies) else None
+
+
+async def run_step(client, payloads, rate, duration_s, concurrency=64, arrival='poisson', seed=0,
+                   endpoint='/predict'):
+    """
+    Um passo em malha aberta: cada requisicao sai no instante agendado, sem esperar
+    as anteriores responderem (no maximo `concurrency` em voo; as excedentes
+    esperam a vez na fila do cliente).
+
+    A latencia conta a partir do instante agendado, nao do envio efetivo: a
+    espera na fila entra na medida quando o servidor nao acompanha a taxa.
+    """
+    offsets = arrival_times(rate, duration_s, arrival, seed)
+    choice = np.random.default_rng(seed).integers(0, len(payloads), len(offsets))
+    latencies = np.zeros(len(offsets))
+    ok = np.zeros(len(offsets), dtype=bool)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i, scheduled):
+        async with semaphore:
+            try:
+                response = await client.post(endpoint, json=payloads[choice[i]])
+                ok[i] = response.status_code == 200
+            except httpx.HTTPError:
+                ok[i] = False
+        latencies[i] = time.perf_counter() - scheduled
+
+    started = time.perf_counter()
+    tasks = []
+    max_lag = 0.0
+    for i, offset in enumerate(offsets):
+        scheduled = started + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Atraso do proprio gerador: se crescer, o gargalo e o cliente, nao a API
+        max_lag = max(max_lag, time.perf_counter() - scheduled)
+        tasks.append(asyncio.create_task(send(i, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    succeeded = latencies[ok]
+    return {
+        'offered_rps': float(rate),
+        'sent': int(len(offsets)),
+        'errors': int((~ok).sum()),
+        'error_rate': float((~ok).mean()) if len(ok) else 0.0,
+        'throughput_rps': float(ok.sum() / elapsed) if elapsed > 0 else 0.0,
+        'elapsed_s': elapsed,
+        'p50_ms': percentile_ms(succeeded, 50),
+        'p95_ms': percentile_ms(succeeded, 95),
+        'p99_ms': percentile_ms(succeeded, 99),
+        'max_ms': float(succeeded.max() * 1000) if len(succeeded) else None,
+        'client_lag_ms': max_lag * 1000,
+    }
+
+
+def _proc_stat(pid):
+    # Campos depois do nome do processo (que pode conter espacos e parenteses)
+    with open(f'/proc/{pid}/stat') as f:
+        return f.read().rpartition(')')[2].split()
+
+
+def process_tree(pid):
+    """
+    O processo e seus descendentes (o supervisor do uvicorn e os workers), via /proc.
+    """
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                parents[int(entry)] = int(_proc_stat(entry)[1])
+            except (OSError, IndexError):
+                continue
+    tree, frontier = [pid], [pid]
+    while frontier:
+        frontier = [child for child, parent in parents.items() if parent in frontier]
+        tree.extend(frontier)
+    return tree
+
+
+def process_usage(pid):
+    """
+    (segundos de CPU acumulados, RSS em bytes) de um processo; None se ele ja saiu.
+    """
+    try:
+        fields = _proc_stat(pid)
+        with open(f'/proc/{pid}/status') as f:
+            rss_kb = next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime e stime sao os campos 14 e 15 do /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, rss_kb * 1024
+
+
+def sample_processes(pid):
+    if pid is None or not os.path.isdir('/proc'):
+        return {}
+    usage = {p: process_usage(p) for p in process_tree(pid)}
+    return {p: u for p, u in usage.items() if u is not None}
+
+
+def process_report(before, after, elapsed_s):
+    """
+    CPU (% de um nucleo) e RSS de cada processo do servidor durante o passo.
+    """
+    rows = []
+    for pid, (cpu_s, rss) in sorted(after.items()):
+        cpu_before = before.get(pid, (cpu_s, rss))[0]
+        rows.append({
+            'pid': pid,
+            'cpu_percent': 100.0 * (cpu_s - cpu_before) / elapsed_s if elapsed_s > 0 else 0.0,
+            'rss_mb': rss / (1024 * 1024),
+        })
+    return rows
+
+
+def saturation_point(steps, slo_p99_ms=SLO_P99_MS, min_ratio=MIN_THROUGHPUT_RATIO, max_error_rate=MAX_ERROR_RATE):
+    """
+    Primeira taxa oferecida em que a API deixa de acompanhar (None se nenhuma).
+    """
+    for step in steps:
+        if (step['throughput_rps'] < min_ratio * step['offered_rps']
+                or step['error_rate'] > max_error_rate
+                or step['p99_ms'] is None or step['p99_ms'] > slo_p99_ms):
+            return step['offered_rps']
+    return None
+
+
+async def load_test(base_url, payloads, rates=RATES, duration_s=10.0, concurrency=64, arrival='poisson',
+                    endpoint='/predict', server_pid=None, warmup_s=1.0, timeout_s=10.0, transport=None):
+    """
+    Roda um passo por taxa (da menor para a maior) e monta a curva de saturacao.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout_s, transport=transport) as client:
+        if warmup_s > 0:
+            await run_step(client, payloads, min(rates), warmup_s, concurrency, arrival, seed=len(rates), endpoint=endpoint)
+        steps = []
+        for seed, rate in enumerate(sorted(rates)):
+            before = sample_processes(server_pid)
+            step = await run_step(client, payloads, rate, duration_s, concurrency, arrival, seed, endpoint)
+            step['processes'] = process_report(before, sample_processes(server_pid), step['elapsed_s'])
+            steps.append(step)
+            print(format_step(step), flush=True)
+    return steps
+
+
+def format_step(step):
+    p = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+    processes = ' '.join(f"{r['pid']}:{r['cpu_percent']:.0f}%/{r['rss_mb']:.0f}MB" for r in step.get('processes', []))
+    return (f"{step['offered_rps']:>9.0f}{step['throughput_rps']:>10.1f}{p(step['p50_ms'])}{p(step['p95_ms'])}"
+            f"{p(step['p99_ms'])}{step['error_rate']:>8.2%}  {processes}")
+
+
+def format_header():
+    return f"{'oferta/s':>9}{'vazao/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>8}  pid:CPU/RSS"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workers=1, cache=False, ready_timeout_s=60.0, env=None):
+    """
+    Sobe a API local (api.serve) e espera o GET /ready.
+
+    Sem cache de previsoes por padrao (payloads repetidos mediriam o cache, nao
+    o modelo), log de previsoes em um diretorio temporario e sem polling do modelo.
+    """
+    log_dir = tempfile.mkdtemp(prefix='load_test_logs_')
+    server_env = {
+        **os.environ,
+        'PREDICTION_LOG_DIR': log_dir,
+        'MODEL_WATCH_INTERVAL_S': '0',
+        **({} if cache else {'PREDICTION_CACHE_SIZE': '0'}),
+        **(env or {}),
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'api.serve', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)],
+        cwd=PROJECT_ROOT, env=server_env, stdout=subprocess.DEVNULL, start_new_session=True,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + ready_timeout_s
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API saiu com codigo {process.returncode} antes de ficar pronta")
+        try:
+            if httpx.get(f"{url}/ready", timeout=1.0).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise TimeoutError(f"API nao ficou pronta em {ready_timeout_s:.0f}s")
+
+
+def stop_server(process, timeout_s=10.0):
+    if process.poll() is not None:
+        return
+    # Sessao propria: o sinal chega ao supervisor e a todos os workers
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout_s)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga em malha aberta do /predict com curva de saturacao.")
+    parser.add_argument('--url', help="API ja em execucao (padrao: sobe uma local com api.serve)")
+    parser.add_argument('--pid', type=int, help="PID do servidor em --url, para medir CPU/RSS")
+    parser.add_argument('--workers', type=int, default=1, help="Workers da API local")
+    parser.add_argument('--cache', action='store_true', help="Mantem o cache de previsoes da API local")
+    parser.add_argument('--rates', type=float, nargs='+', default=list(RATES), help="Taxas oferecidas (req/s)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Segundos por taxa")
+    parser.add_argument('--warmup', type=float, default=1.0, help="Segundos de aquecimento")
+    parser.add_argument('--concurrency', type=int, default=64, help="Maximo de requisicoes em voo")
+    parser.add_argument('--arrival', choices=ARRIVALS, default='poisson')
+    parser.add_argument('--source', choices=SOURCES, default='synthetic', help="Origem dos payloads sem --payloads")
+    parser.add_argument('--payloads', nargs='+', help="JSONL com payloads ou log de previsoes para reproduzir")
+    parser.add_argument('--rows', type=int, default=5000, help="Payloads sorteados (synthetic/training)")
+    parser.add_argument('--endpoint', default='/predict')
+    parser.add_argument('--slo-ms', type=float, default=SLO_P99_MS, help="p99 maximo aceito")
+    parser.add_argument('--output', default=LOAD_TEST_PATH)
+    args = parser.parse_args(argv)
+
+    if args.payloads:
+        payloads = read_payloads(args.payloads)
+    elif args.source == 'training':
+        payloads = training_payloads(args.rows)
+    else:
+        payloads = student_payloads(generate_students(args.rows, seed=7))
+
+    process, url, pid = None, args.url, args.pid
+    if url is None:
+        process, url = start_server(free_port(), args.workers, args.cache)
+        pid = process.pid
+    try:
+        print(format_header())
+        steps = asyncio.run(load_test(url, payloads, args.rates, args.duration, args.concurrency, args.arrival,
+                                      args.endpoint, pid, args.warmup))
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    saturation = saturation_point(steps, args.slo_ms)
+    print(f"Saturacao: {'nao atingida' if saturation is None else f'{saturation:.0f} req/s'}")
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'url': args.url or 'local',
+            'workers': args.workers if args.url is None else None,
+            'cpus': os.cpu_count(),
+            'arrival': args.arrival,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'payloads': len(payloads),
+            'slo_p99_ms': args.slo_ms,
+        },
+        'saturation_rps': saturation,
+        'steps': steps,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Curva de saturacao salva em {args.output}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
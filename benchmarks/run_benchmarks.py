@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import sklearn
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from benchmarks.synthetic import generate_students, student_payloads
+from src.data import load_data
+from src.data.preprocess import preprocess_data, select_features, build_preprocessing_pipeline, REQUIRED_COLUMNS
+from src.models.predict_model import load_model, make_prediction, ENGINES
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(BENCHMARKS_DIR, 'results.json')
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+BATCH_SIZES = (1, 10, 100, 1000, 10000, 100000)
+
+# Candidatos fixos para medir o custo de fit por configuracao
+TRAIN_CANDIDATES = (
+    {'n_estimators': 50, 'max_depth': 10},
+    {'n_estimators': 100, 'max_depth': None},
+    {'n_estimators': 200, 'max_depth': 10},
+)
+
+SECTIONS = ('load', 'preprocess', 'train', 'predict', 'api')
+
+def measure(fn, repeat=5):
+    """
+    Mediana do tempo de parede (s) de `repeat` execucoes de fn.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def bench_load(n_rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'dados.xlsx')
+        generate_students(n_rows).to_excel(source, index=False)
+        cache_dir = os.path.join(tmp, 'processed')
+
+        def load():
+            return load_data.load_raw_data(source, columns=REQUIRED_COLUMNS, cache_dir=cache_dir)
+
+        cold = measure(load, repeat=1)
+        # Sem o memo do processo: leitura do Parquet memory-mapped
+        load_data._MEMO.clear()
+        warm = measure(load, repeat=1)
+        memo = measure(load)
+        load_data._MEMO.clear()
+    return {
+        'load.excel_cold_s': cold,
+        'load.parquet_warm_s': warm,
+        'load.memo_s': memo,
+    }
+
+def bench_preprocess(df):
+    seconds = measure(lambda: preprocess_data(df))
+    return {'preprocess.s_per_1k_rows': seconds / len(df) * 1000}
+
+def bench_train(df):
+    X, y, num_cols, cat_cols = preprocess_data(df)
+    base = Pipeline(steps=[
+        ('preprocessor', build_preprocessing_pipeline(num_cols, cat_cols)),
+        ('classifier', RandomForestClassifier(random_state=42))
+    ])
+    metrics = {}
+    for params in TRAIN_CANDIDATES:
+        candidate = clone(base).set_params(**{f'classifier__{k}': v for k, v in params.items()})
+        name = ','.join(f'{k}={v}' for k, v in params.items())
+        metrics[f'train.fit_s[{name}]'] = measure(lambda: candidate.fit(X, y), repeat=1)
+    return metrics
+
+def benchmark_model(engine, df):
+    """
+    Artefato real quando existe; senao um modelo pequeno treinado no dataset sintetico.
+    """
+    try:
+        return load_model(engine)
+    except FileNotFoundError:
+        if engine != 'sklearn':
+            raise
+        X, y, num_cols, cat_cols = preprocess_data(df)
+        return Pipeline(steps=[
+            ('preprocessor', build_preprocessing_pipeline(num_cols, cat_cols)),
+            ('classifier', RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42))
+        ]).fit(X, y)
+
+def bench_predict(df, batch_sizes, engines=ENGINES):
+    metrics = {}
+    for engine in engines:
+        try:
+            model = benchmark_model(engine, df)
+        except FileNotFoundError as e:
+            print(f"Pulando engine {engine}: {e}")
+            continue
+        for size in batch_sizes:
+            X, _, _ = select_features(generate_students(size, seed=size))
+            # Mais repeticoes para lotes pequenos, onde o ruido e maior
+            repeat = max(1, min(20, 2000 // size))
+            metrics[f'predict.{engine}.batch={size}_s'] = measure(lambda: make_prediction(model, X), repeat)
+    return metrics
+
+def bench_api(n_requests):
+    # Configura a API antes do import: sem cache (payloads variados), sem
+    # micro-batching (requisicoes sequenciais) e sem log de previsoes
+    os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+    os.environ.setdefault('MICRO_BATCH_MAX_SIZE', '1')
+    os.environ.setdefault('MODEL_WATCH_INTERVAL_S', '0')
+    os.environ.setdefault('PREDICTION_LOG_ENABLED', '0')
+    from fastapi.testclient import TestClient
+    from api.app import app
+
+    payloads = student_payloads(generate_students(n_requests, seed=7))
+
+    latencies = []
+    with TestClient(app) as client:
+        if client.get('/admin/model').json().get('loaded') is not True:
+            print("Pulando benchmark da API: modelo nao carregado.")
+            return {}
+        client.post('/predict', json=payloads[0])
+        for payload in payloads:
+            start = time.perf_counter()
+            response = client.post('/predict', json=payload)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return {
+        'api.predict_p50_s': float(np.percentile(latencies, 50)),
+        'api.predict_p99_s': float(np.percentile(latencies, 99)),
+    }
+
+def run_benchmarks(rows=5000, batch_sizes=BATCH_SIZES, n_requests=200, sections=SECTIONS):
+    df = generate_students(rows)
+    metrics = {}
+    if 'load' in sections:
+        metrics.update(bench_load(min(rows, 2000)))
+    if 'preprocess' in sections:
+        metrics.update(bench_preprocess(df))
+    if 'train' in sections:
+        metrics.update(bench_train(df))
+    if 'predict' in sections:
+        metrics.update(bench_predict(df, batch_sizes))
+    if 'api' in sections:
+        metrics.update(bench_api(n_requests))
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'rows': rows,
+        },
+        'metrics': metrics,
+    }
+
+# Campos do meta que precisam bater para os tempos absolutos serem comparaveis
+HOST_FIELDS = ('platform', 'cpu_count', 'python', 'numpy', 'sklearn', 'rows')
+
+def host_mismatch(current, baseline):
+    """
+    Campos do ambiente em que o baseline difere da execucao atual (vazio = comparavel).
+    """
+    return [f for f in HOST_FIELDS if current['meta'].get(f) != baseline.get('meta', {}).get(f)]
+
+def compare_results(current, baseline, threshold=0.25):
+    """
+    Metricas (todas em segundos, menor e melhor) que pioraram mais que `threshold`.
+    """
+    regressions = []
+    for name, base_value in baseline['metrics'].items():
+        value = current['metrics'].get(name)
+        if value is None or base_value <= 0:
+            continue
+        change = value / base_value - 1
+        if change > threshold:
+            regressions.append({'metric': name, 'baseline': base_value, 'current': value, 'change': change})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de treino e inferencia.")
+    parser.add_argument('--rows', type=int, default=5000, help="Linhas do dataset sintetico")
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=list(BATCH_SIZES))
+    parser.add_argument('--requests', type=int, default=200, help="Requisicoes ao /predict")
+    parser.add_argument('--sections', nargs='*', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=0.25, help="Piora relativa tolerada")
+    parser.add_argument('--update-baseline', action='store_true', help="Grava os resultados como novo baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.batch_sizes, args.requests, args.sections)
+    for name, value in results['metrics'].items():
+        print(f"{name:<55} {value * 1000:>12.3f} ms")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados salvos em {args.output}.")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline atualizado em {args.baseline}.")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Baseline nao encontrado em {args.baseline}; nada a comparar.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    mismatch = host_mismatch(results, baseline)
+    if mismatch:
+        # Tempos absolutos de outra maquina nao dizem nada sobre regressao
+        print(f"Baseline gerado em outro ambiente ({', '.join(mismatch)}); rode com --update-baseline nesta maquina.")
+        return 2
+    regressions = compare_results(results, baseline, args.threshold)
+    for r in regressions:
+        print(f"REGRESSAO {r['metric']}: {r['baseline'] * 1000:.3f} ms -> {r['current'] * 1000:.3f} ms (+{r['change']:.0%})")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# Categorias e proporcoes aproximadas do PEDE2022
+GENEROS = (['Menina', 'Menino'], [0.55, 0.45])
+INSTITUICOES = (['Escola Pública', 'Rede Decisão', 'Escola JP II'], [0.83, 0.14, 0.03])
+PEDRAS = (['Quartzo', 'Ágata', 'Ametista', 'Topázio'], [0.15, 0.25, 0.40, 0.20])
+
+def generate_students(n_rows, seed=42):
+    """
+    Gera um dataset sintetico com o mesmo schema bruto que preprocess_data espera
+    (features, alvo 'Defas' e identificador 'RA').
+    """
+    rng = np.random.default_rng(seed)
+
+    def grade(mean, std):
+        # Notas de 0 a 10 com uma casa decimal, como no dataset original
+        return np.clip(rng.normal(mean, std, n_rows), 0, 10).round(1)
+
+    df = pd.DataFrame({
+        'RA': [f"RA-{i}" for i in range(n_rows)],
+        'Idade 22': rng.integers(7, 22, n_rows),
+        'Gênero': rng.choice(GENEROS[0], n_rows, p=GENEROS[1]),
+        'Instituição de ensino': rng.choice(INSTITUICOES[0], n_rows, p=INSTITUICOES[1]),
+        'Pedra 22': rng.choice(PEDRAS[0], n_rows, p=PEDRAS[1]),
+        'INDE 22': np.clip(rng.normal(7.0, 1.0, n_rows), 0, 10).round(3),
+        'IAA': grade(8.3, 1.6),
+        'IEG': grade(7.9, 1.6),
+        'IPS': grade(6.9, 1.1),
+        'IDA': grade(6.1, 2.1),
+        'Matem': grade(5.8, 2.4),
+        'Portug': grade(6.3, 2.1),
+        'Inglês': grade(6.3, 2.6),
+    })
+    # Alvo ligado as features para que o modelo tenha sinal a aprender
+    score = (df['INDE 22'] - 7.0) + 0.3 * (df['IDA'] - 6.1) - 0.15 * (df['Idade 22'] - 14) + rng.normal(0, 1, n_rows)
+    df['Defas'] = np.where(score < 0.3, -1, 0) - (score < -1.5)
+    return df
+
+# Campo do StudentData (payload da API) -> coluna do modelo
+PAYLOAD_FIELDS = {
+    'idade_22': 'Idade 22',
+    'genero': 'Gênero',
+    'instituicao_ensino': 'Instituição de ensino',
+    'pedra_22': 'Pedra 22',
+    'inde_22': 'INDE 22',
+    'iaa': 'IAA',
+    'ieg': 'IEG',
+    'ips': 'IPS',
+    'ida': 'IDA',
+    'matem': 'Matem',
+    'portug': 'Portug',
+    'ingles': 'Inglês',
+}
+
+def student_payloads(students):
+    """
+    Payloads do POST /predict (um por linha) a partir de um DataFrame com as colunas do modelo.
+    """
+    records = students[list(PAYLOAD_FIELDS.values())].to_dict(orient='records')
+    return [{field: row[col] for field, col in PAYLOAD_FIELDS.items()} for row in records]
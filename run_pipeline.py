@@ -1,9 +1,17 @@
+import os
 from src.models.train_model import train_model
 
 if __name__ == "__main__":
     print("Iniciando Pipeline de ML...")
     try:
-        train_model()
+        if os.environ.get("TRAINING_MODE", "full") == "incremental":
+            # So os dados novos (NEW_DATA_PATH), com os hiperparametros da ultima busca
+            from src.models.incremental_train import incremental_train
+            incremental_train(os.environ["NEW_DATA_PATH"], os.environ.get("INCREMENTAL_MODE", "auto"))
+        else:
+            # Estrategia de busca: 'random' (padrao) ou 'halving'; anos: ex. TRAINING_YEARS=2022,2023,2024
+            years = [int(y) for y in os.environ.get("TRAINING_YEARS", "").split(",") if y.strip()]
+            train_model(os.environ.get("SEARCH_STRATEGY", "random"), years=years or None)
         print("Pipeline concluído com sucesso.")
     except Exception as e:
         print(f"Pipeline falhou: {e}")
@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import shutil
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from src.utils.paths import RAW_DATA_FILE, PROCESSED_DATA_DIR
+from src.utils.fingerprint import file_fingerprint
+
+# Tabela longitudinal (todas as abas PEDE<ano>), particionada por ano: year=2022/, year=2023/, ...
+LONGITUDINAL_DIR = os.path.join(PROCESSED_DATA_DIR, 'pede_longitudinal')
+
+SHEET_PATTERN = re.compile(r'^PEDE(\d{4})$')
+
+# Schema comum: colunas com sufixo do ano viram nomes genericos e o ano vai para a particao
+SCHEMA = pa.schema([
+    ('RA', pa.string()),
+    ('Fase', pa.string()),
+    ('Turma', pa.string()),
+    ('Idade', pa.float64()),
+    ('Gênero', pa.string()),
+    ('Ano ingresso', pa.float64()),
+    ('Instituição de ensino', pa.string()),
+    ('Pedra', pa.string()),
+    ('INDE', pa.float64()),
+    ('IAA', pa.float64()),
+    ('IEG', pa.float64()),
+    ('IPS', pa.float64()),
+    ('IPP', pa.float64()),
+    ('IDA', pa.float64()),
+    ('Matem', pa.float64()),
+    ('Portug', pa.float64()),
+    ('Inglês', pa.float64()),
+    ('IPV', pa.float64()),
+    ('IAN', pa.float64()),
+    ('Fase ideal', pa.string()),
+    ('Defas', pa.float64()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+
+# A troca do diretorio pela ingestao deixa um instante sem a tabela (ou some com os
+# arquivos de uma leitura em andamento): o leitor tenta de novo antes de desistir
+LOAD_RETRIES = 5
+LOAD_RETRY_DELAY_S = 0.2
+
+# Colunas do ano da aba: '<base> <ano>' ou '<base> <aa>' (a primeira presente vence)
+YEAR_SUFFIXED = ('Idade', 'Pedra', 'INDE')
+
+# Nomes que mudaram entre as abas -> nome do schema comum
+COLUMN_ALIASES = {
+    'Mat': 'Matem',
+    'Por': 'Portug',
+    'Ing': 'Inglês',
+    'Fase Ideal': 'Fase ideal',
+    'Defasagem': 'Defas',
+}
+
+# Categorias grafadas de outro jeito a partir de 2023 -> grafia do PEDE2022 (a do modelo)
+CATEGORY_ALIASES = {
+    'Gênero': {'Feminino': 'Menina', 'Masculino': 'Menino'},
+    'Pedra': {'Agata': 'Ágata'},
+}
+
+# Data de referencia do Excel: idades gravadas como data (1900-01-08 = 8)
+EXCEL_EPOCH = pd.Timestamp('1899-12-31')
+
+
+def sheet_years(file_path=RAW_DATA_FILE):
+    """
+    Abas PEDE<ano> da planilha -> ano.
+    """
+    sheets = pd.ExcelFile(file_path).sheet_names
+    return {s: int(m.group(1)) for s in sheets if (m := SHEET_PATTERN.match(s))}
+
+
+def _numeric(values):
+    # Datas (celula formatada errada no Excel) voltam ao numero serial
+    values = values.map(lambda v: (v - EXCEL_EPOCH).days if isinstance(v, datetime) else v)
+    return pd.to_numeric(values, errors='coerce').astype('float64')
+
+
+def to_common_schema(df, year):
+    """
+    Renomeia as colunas de uma aba para o schema comum e aplica os tipos dele.
+    """
+    renames = dict(COLUMN_ALIASES)
+    for base in YEAR_SUFFIXED:
+        for name in (f"{base} {year}", f"{base} {year % 100}"):
+            if name in df.columns and df[name].notna().any():
+                renames[name] = base
+                break
+    df = df.rename(columns=renames)
+
+    out = {}
+    for field in SCHEMA:
+        values = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if pa.types.is_floating(field.type):
+            out[field.name] = _numeric(values)
+        else:
+            values = values.where(values.isna(), values.astype(str).str.strip())
+            out[field.name] = values.replace(CATEGORY_ALIASES.get(field.name, {}))
+    return pd.DataFrame(out)
+
+
+def ingest_sheet(file_path, sheet, year, output_dir):
+    """
+    Le uma aba e grava a particao year=<ano> (roda em um processo do pool).
+    """
+    df = to_common_schema(pd.read_excel(file_path, sheet_name=sheet), year)
+    partition = os.path.join(output_dir, f"year={year}")
+    os.makedirs(partition, exist_ok=True)
+    table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+    pq.write_table(table, os.path.join(partition, 'part-0.parquet'))
+    return year, len(df)
+
+
+def ingest_workbook(file_path=RAW_DATA_FILE, output_dir=LONGITUDINAL_DIR, workers=None, force=False):
+    """
+    Converte todas as abas PEDE<ano> em uma tabela Parquet particionada por ano.
+
+    Cada aba e lida e gravada em um processo do pool. A tabela e montada em um
+    diretorio temporario e trocada de uma vez, e so e refeita quando o conteudo
+    da planilha muda. Retorna {ano: linhas}.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Arquivo nao encontrado: {file_path}")
+    meta_path = os.path.join(output_dir, '_meta.json')
+    stat = os.stat(file_path)
+    meta = {}
+    if not force and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('mtime') == stat.st_mtime and meta.get('size') == stat.st_size:
+            return {int(k): v for k, v in meta['rows'].items()}
+    sha256 = file_fingerprint(file_path)
+    if meta.get('sha256') == sha256:
+        # Conteudo igual (ex.: arquivo copiado/tocado): so atualiza o mtime
+        meta.update(mtime=stat.st_mtime, size=stat.st_size)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        return {int(k): v for k, v in meta['rows'].items()}
+
+    years = sheet_years(file_path)
+    if not years:
+        raise ValueError(f"Nenhuma aba PEDE<ano> em {file_path}")
+
+    tmp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    print(f"Ingerindo abas {sorted(years)} de {file_path}...")
+    try:
+        with ProcessPoolExecutor(max_workers=workers or min(len(years), os.cpu_count() or 1)) as pool:
+            futures = [pool.submit(ingest_sheet, file_path, sheet, year, tmp_dir) for sheet, year in years.items()]
+            rows = dict(f.result() for f in futures)
+        meta = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': sha256,
+                'rows': {str(y): n for y, n in sorted(rows.items())}}
+        with open(os.path.join(tmp_dir, '_meta.json'), 'w') as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Troca o diretorio inteiro: leitores nunca veem anos de versoes diferentes misturados
+    old_dir = f"{output_dir}.old-{os.getpid()}"
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    print(f"Tabela longitudinal gerada em {output_dir}: {meta['rows']}")
+    return rows
+
+
+def load_longitudinal(years=None, columns=None, path=LONGITUDINAL_DIR):
+    """
+    Le a tabela longitudinal (coluna 'year' inclusa), apenas as particoes dos anos pedidos.
+
+    Uma ingestao concorrente troca o diretorio com dois renames; se a tabela some
+    no meio da leitura, ela e refeita depois de LOAD_RETRY_DELAY_S.
+    """
+    for attempt in range(LOAD_RETRIES):
+        try:
+            return read_longitudinal(years, columns, path)
+        except FileNotFoundError:
+            if attempt == LOAD_RETRIES - 1:
+                raise
+            time.sleep(LOAD_RETRY_DELAY_S)
+
+
+def read_longitudinal(years, columns, path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Tabela longitudinal nao encontrada: {path}. Rode src.data.ingest.")
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+        if 'year' not in columns:
+            columns.append('year')
+    row_filter = ds.field('year').isin([int(y) for y in years]) if years else None
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestao das abas PEDE<ano> em Parquet particionado por ano.")
+    parser.add_argument('--file', default=RAW_DATA_FILE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="Refaz a tabela mesmo sem mudanca na planilha")
+    args = parser.parse_args()
+    ingest_workbook(args.file, workers=args.workers, force=args.force)
@@ -1,17 +1,97 @@
 import pandas as pd
 import os
-from src.utils.paths import RAW_DATA_FILE
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.utils.paths import RAW_DATA_FILE, PROCESSED_DATA_DIR
+from src.utils.fingerprint import file_fingerprint
 
-def load_raw_data(file_path=RAW_DATA_FILE):
+# Memo do processo: (cache parquet, mtime, colunas) -> DataFrame
+_MEMO = {}
+
+def load_raw_data(file_path=RAW_DATA_FILE, columns=None, use_cache=True, cache_dir=PROCESSED_DATA_DIR):
     """
     Carrega os dados brutos do Excel.
+
+    Com use_cache, o Excel e convertido uma unica vez para Parquet em
+    cache_dir e as chamadas seguintes leem o Parquet (memory-mapped), apenas
+    com as colunas pedidas. O cache e invalidado quando o Excel muda.
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Arquivo nao encontrado: {file_path}")
-    
-    print(f"Carregando dados de {file_path}...")
-    df = pd.read_excel(file_path)
-    return df
+
+    if not use_cache:
+        print(f"Carregando dados de {file_path}...")
+        df = pd.read_excel(file_path)
+        return df[[c for c in columns if c in df.columns]] if columns is not None else df
+
+    cache_path = build_parquet_cache(file_path, cache_dir)
+
+    cache_mtime = os.path.getmtime(cache_path)
+    memo_key = (cache_path, cache_mtime, tuple(columns) if columns is not None else None)
+    if memo_key not in _MEMO:
+        if columns is not None:
+            available = pq.read_schema(cache_path).names
+            columns = [c for c in columns if c in available]
+        table = pq.read_table(cache_path, columns=columns, memory_map=True)
+        # Descarta entradas de versoes anteriores do mesmo cache
+        for key in [k for k in _MEMO if k[0] == cache_path and k[1] != cache_mtime]:
+            del _MEMO[key]
+        _MEMO[memo_key] = table.to_pandas()
+
+    # Copia para que quem chama possa alterar o DataFrame sem sujar o memo
+    return _MEMO[memo_key].copy()
+
+def build_parquet_cache(file_path=RAW_DATA_FILE, cache_dir=PROCESSED_DATA_DIR):
+    """
+    Garante um Parquet atualizado para o Excel e retorna o seu caminho.
+
+    A validade e checada pelo mtime/tamanho do Excel; se o mtime mudou, o hash
+    do conteudo decide se e preciso reconverter.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    cache_path = os.path.join(cache_dir, f"{name}.parquet")
+    meta_path = os.path.join(cache_dir, f"{name}.meta.json")
+
+    stat = os.stat(file_path)
+    meta = {}
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('mtime') == stat.st_mtime and meta.get('size') == stat.st_size:
+            return cache_path
+
+    sha256 = file_fingerprint(file_path)
+    if os.path.exists(cache_path) and meta.get('sha256') == sha256:
+        # Conteudo igual (ex.: arquivo copiado/tocado): so atualiza o mtime
+        meta.update(mtime=stat.st_mtime, size=stat.st_size)
+    else:
+        print(f"Carregando dados de {file_path}...")
+        df = pd.read_excel(file_path)
+        write_parquet(df, cache_path)
+        meta = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': sha256}
+        print(f"Cache Parquet gerado em {cache_path}.")
+
+    # Mesmo padrao do Parquet: outro processo nunca le um .meta.json pela metade
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+    return cache_path
+
+def write_parquet(df, path):
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col])
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Colunas com tipos misturados (numeros e textos) viram texto
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    # Escreve em arquivo temporario e renomeia para nao expor um Parquet pela metade
+    tmp_path = f"{path}.tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
 
 if __name__ == "__main__":
     try:
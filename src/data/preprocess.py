@@ -6,6 +6,25 @@ from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 
+TARGET_COLUMN = 'Defas'
+
+NUMERIC_FEATURES = ['Idade 22', 'INDE 22', 'IAA', 'IEG', 'IPS', 'IDA', 'Matem', 'Portug', 'Inglês']
+CATEGORICAL_FEATURES = ['Gênero', 'Instituição de ensino', 'Pedra 22']
+
+FEATURE_COLUMNS = [
+    'Idade 22', 'Gênero', 'Instituição de ensino', 
+    'Pedra 22', 'INDE 22', 
+    'IAA', 'IEG', 'IPS', 'IDA', 
+    'Matem', 'Portug', 'Inglês'
+]
+
+# Colunas do dataset bruto que preprocess_data realmente usa
+REQUIRED_COLUMNS = FEATURE_COLUMNS + [TARGET_COLUMN]
+
+# Nomes genericos da tabela longitudinal (src.data.ingest) -> features do modelo,
+# que mantem os nomes do PEDE2022 (os mesmos da API)
+LONGITUDINAL_FEATURES = {'Idade': 'Idade 22', 'Pedra': 'Pedra 22', 'INDE': 'INDE 22'}
+
 def preprocess_data(df):
     """
     Preprocessa os dados brutos.
@@ -17,13 +36,13 @@ def preprocess_data(df):
     
     # Target: 'Defas'
     # Verifica se 'Defas' existe
-    if 'Defas' not in df.columns:
+    if TARGET_COLUMN not in df.columns:
          # Tenta encontrar uma coluna similar se a correspondência exata falhar, ou gera erro
          # Baseado na inspeção, 'Defas' estava presente na saída do script personalizado.
          raise ValueError("Coluna 'Defas' nao encontrada no dataset.")
 
     # Drop rows quando target é missing
-    df = df.dropna(subset=['Defas'])
+    df = df.dropna(subset=[TARGET_COLUMN])
     
     # Define Target
     # Queremos prever o RISCO de defasagem. 
@@ -31,37 +50,41 @@ def preprocess_data(df):
     # Criei um target binário: 1 se Defas < 0 (Risco), 0 caso contrário.
     # A probabilidade da classe 1 (Defasagem) é um "Risk Score".
     
-    y = (df['Defas'] < 0).astype(int)
+    y = (df[TARGET_COLUMN] < 0).astype(int)
     
     # Select Features
-    
+    X, numeric_features, categorical_features = select_features(df)
+        
+    return X, y, numeric_features, categorical_features
+
+def select_features(df):
+    """
+    Seleciona as colunas de features e converte as numericas.
+
+    Usada tanto no treino (via preprocess_data) quanto na inferencia em lote,
+    onde os dados nao tem a coluna alvo.
+    """
     # Features potenciais baseadas na análise exploratória:
     # 'Idade 22', 'Gênero', 'Instituição de ensino', 'Pedra 22', 'INDE 22', 'IAA', 'IEG', 'IPS', 'IDA', 'Matem', 'Portug', 'Inglês'
     
-    feature_cols = [
-        'Idade 22', 'Gênero', 'Instituição de ensino', 
-        'Pedra 22', 'INDE 22', 
-        'IAA', 'IEG', 'IPS', 'IDA', 
-        'Matem', 'Portug', 'Inglês'
-    ]
-    
+    # Dados de qualquer ano da tabela longitudinal usam as mesmas features
+    df = df.rename(columns={k: v for k, v in LONGITUDINAL_FEATURES.items() if k in df.columns and v not in df.columns})
+
     # Filtra apenas colunas existentes
-    feature_cols = [c for c in feature_cols if c in df.columns]
+    feature_cols = [c for c in FEATURE_COLUMNS if c in df.columns]
     
-    X = df[feature_cols]
+    X = df[feature_cols].copy()
     
     # Cleaning / Type conversion
     # Algumas colunas numéricas podem ser lidas como strings se tiverem lixo.
-    numeric_features = ['Idade 22', 'INDE 22', 'IAA', 'IEG', 'IPS', 'IDA', 'Matem', 'Portug', 'Inglês']
-    numeric_features = [c for c in numeric_features if c in X.columns]
+    numeric_features = [c for c in NUMERIC_FEATURES if c in X.columns]
     
-    categorical_features = ['Gênero', 'Instituição de ensino', 'Pedra 22']
-    categorical_features = [c for c in categorical_features if c in X.columns]
+    categorical_features = [c for c in CATEGORICAL_FEATURES if c in X.columns]
     
     for col in numeric_features:
         X[col] = pd.to_numeric(X[col], errors='coerce')
         
-    return X, y, numeric_features, categorical_features
+    return X, numeric_features, categorical_features
 
 def build_preprocessing_pipeline(numeric_features, categorical_features):
     """
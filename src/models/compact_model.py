@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import tempfile
+import argparse
+import joblib
+import numpy as np
+from sklearn.metrics import recall_score, precision_score, f1_score
+
+from src.models.compiled_model import COMPILED_MODEL_PATH, compile_pipeline, load_compiled_model, save_compiled_arrays
+from src.models.threshold import is_risk
+from src.utils.paths import ARTIFACTS_DIR
+
+COMPACTION_REPORT_PATH = os.path.join(ARTIFACTS_DIR, 'compaction_report.json')
+
+# Grade de variantes: fracao das arvores mantidas (melhores pelo OOB) x profundidade maxima
+TREE_FRACTIONS = (1.0, 0.5, 0.25)
+DEPTH_CAPS = (None, 12, 8)
+
+# Perda maxima de recall (no conjunto de teste) aceita ao escolher a menor variante
+RECALL_TOLERANCE = 0.01
+
+BATCH_ROWS = 1000
+
+
+def _n_samples_bootstrap(n_samples, max_samples):
+    # Mesma regra do RandomForest para o tamanho de cada amostra bootstrap
+    if max_samples is None:
+        return n_samples
+    if isinstance(max_samples, float):
+        return max(round(n_samples * max_samples), 1)
+    return max_samples
+
+
+def out_of_bag_masks(forest, n_samples):
+    """
+    Linhas fora da amostra bootstrap de cada arvore (n_arvores x n_amostras).
+
+    Refaz o sorteio do RandomForest a partir do random_state de cada arvore, por
+    isso so vale para os mesmos dados (e na mesma ordem) usados no fit.
+    """
+    n_bootstrap = _n_samples_bootstrap(n_samples, forest.max_samples)
+    masks = np.ones((len(forest.estimators_), n_samples), dtype=bool)
+    for i, estimator in enumerate(forest.estimators_):
+        sampled = np.random.RandomState(estimator.random_state).randint(0, n_samples, n_bootstrap)
+        masks[i, sampled] = False
+    return masks
+
+
+def rank_trees_by_oob(pipeline, X_train, y_train):
+    """
+    Indices das arvores da melhor para a pior pelo Brier score nas amostras
+    fora do bootstrap de cada uma (sem bootstrap, a ordem original).
+    """
+    forest = pipeline.named_steps['classifier']
+    if not forest.bootstrap:
+        print("Warning: floresta sem bootstrap; as arvores sao mantidas na ordem original.")
+        return np.arange(len(forest.estimators_))
+    X = np.asarray(pipeline.named_steps['preprocessor'].transform(X_train), dtype=np.float32)
+    y = np.asarray(y_train)
+    positive = list(forest.classes_).index(1)
+    masks = out_of_bag_masks(forest, len(X))
+    scores = np.full(len(forest.estimators_), np.inf)
+    for i, (estimator, oob) in enumerate(zip(forest.estimators_, masks)):
+        if oob.any():
+            scores[i] = np.mean((estimator.predict_proba(X[oob])[:, positive] - y[oob]) ** 2)
+    return np.argsort(scores, kind='mergesort')
+
+
+def variant_name(fraction, max_depth):
+    depth = 'full_depth' if max_depth is None else f"depth_{max_depth}"
+    return f"trees_{int(round(fraction * 100))}pct_{depth}"
+
+
+def build_variants(pipeline, X_train, y_train, fractions=TREE_FRACTIONS, depth_caps=DEPTH_CAPS):
+    """
+    Arrays do CompiledModel de cada variante: 'baseline' (export atual) e a
+    grade arvores x profundidade, todas com limiares/valores em float32 e
+    indices pequenos.
+    """
+    ranking = rank_trees_by_oob(pipeline, X_train, y_train)
+    variants = {'baseline': compile_pipeline(pipeline)}
+    for fraction in fractions:
+        # Mantem as melhores pelo OOB, na ordem original da floresta
+        kept = np.sort(ranking[:max(1, int(round(len(ranking) * fraction)))])
+        for max_depth in depth_caps:
+            variants[variant_name(fraction, max_depth)] = compile_pipeline(pipeline, kept, max_depth, compact=True)
+    return variants
+
+
+def _median_seconds(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+
+def measure_variant(path, X_test, y_test, reference, threshold=None, repeats=50):
+    """
+    Tamanho, tempo de carga, latencia (1 linha e lote) e qualidade de um .npz no conjunto de teste.
+    """
+    load_s = _median_seconds(lambda: load_compiled_model(path), 5)
+    model = load_compiled_model(path)
+    # Uma linha como dict de colunas, como a API monta para a engine NumPy
+    row = {col: [X_test[col].iloc[0]] for col in X_test.columns}
+    batch = X_test.sample(BATCH_ROWS, replace=True, random_state=0)
+    model.predict_proba(row)
+
+    probability = model.predict_proba(X_test)[:, 1]
+    predicted = is_risk(probability, threshold)
+    return {
+        'size_bytes': os.path.getsize(path),
+        'n_trees': int(len(model.tree_roots)),
+        'n_nodes': int(len(model.tree_feature)),
+        'max_depth': model.max_depth,
+        'load_s': load_s,
+        'single_row_s': _median_seconds(lambda: model.predict_proba(row), repeats),
+        'batch_s': _median_seconds(lambda: model.predict_proba(batch), max(3, repeats // 10)),
+        'recall': float(recall_score(y_test, predicted, zero_division=0)),
+        'precision': float(precision_score(y_test, predicted, zero_division=0)),
+        'f1': float(f1_score(y_test, predicted, zero_division=0)),
+        'max_abs_diff': float(np.max(np.abs(probability - reference))),
+    }
+
+
+def select_variant(variants, tolerance=RECALL_TOLERANCE):
+    """
+    Menor artefato com recall >= recall do baseline - tolerance.
+    """
+    floor = variants['baseline']['recall'] - tolerance
+    eligible = [name for name, row in variants.items() if row['recall'] >= floor]
+    return min(eligible, key=lambda name: (variants[name]['size_bytes'], variants[name]['single_row_s']))
+
+
+def compaction_report(pipeline, X_train, y_train, X_test, y_test, threshold=None, tolerance=RECALL_TOLERANCE,
+                      output_dir=None, repeats=50):
+    """
+    Gera as variantes, mede cada uma e indica a menor dentro da tolerancia de recall.
+
+    A linha 'sklearn' e o model.joblib (Pipeline original) como referencia de
+    tamanho, carga e latencia. Os .npz ficam em output_dir (temporario se None).
+    """
+    reference = pipeline.predict_proba(X_test)[:, 1]
+    arrays = build_variants(pipeline, X_train, y_train)
+    rows = {}
+    with tempfile.TemporaryDirectory(prefix='compaction_') as tmp_dir:
+        target_dir = output_dir or tmp_dir
+        os.makedirs(target_dir, exist_ok=True)
+
+        joblib_path = os.path.join(tmp_dir, 'model.joblib')
+        joblib.dump(pipeline, joblib_path)
+        row = X_test.iloc[:1]
+        batch = X_test.sample(BATCH_ROWS, replace=True, random_state=0)
+        predicted = is_risk(reference, threshold)
+        rows['sklearn'] = {
+            'size_bytes': os.path.getsize(joblib_path),
+            'n_trees': len(pipeline.named_steps['classifier'].estimators_),
+            'load_s': _median_seconds(lambda: joblib.load(joblib_path), 3),
+            'single_row_s': _median_seconds(lambda: pipeline.predict_proba(row), max(3, repeats // 5)),
+            'batch_s': _median_seconds(lambda: pipeline.predict_proba(batch), 3),
+            'recall': float(recall_score(y_test, predicted, zero_division=0)),
+            'precision': float(precision_score(y_test, predicted, zero_division=0)),
+            'f1': float(f1_score(y_test, predicted, zero_division=0)),
+            'max_abs_diff': 0.0,
+        }
+
+        for name, variant in arrays.items():
+            path = os.path.join(target_dir, f"{name}.npz")
+            save_compiled_arrays(variant, path)
+            rows[name] = measure_variant(path, X_test, y_test, reference, threshold, repeats)
+
+    compiled = {name: row for name, row in rows.items() if name != 'sklearn'}
+    selected = select_variant(compiled, tolerance)
+    return {
+        'threshold': threshold,
+        'recall_tolerance': tolerance,
+        'selected': selected,
+        'variants': rows,
+    }, arrays[selected]
+
+
+def format_report(report):
+    lines = [f"{'variante':<28}{'KB':>9}{'arvores':>9}{'carga ms':>10}{'1 linha ms':>12}"
+             f"{'lote ms':>10}{'recall':>8}{'f1':>8}"]
+    for name, row in report['variants'].items():
+        marker = ' *' if name == report['selected'] else ''
+        lines.append(
+            f"{name + marker:<28}{row['size_bytes'] / 1024:>9.0f}{row['n_trees']:>9}{row['load_s'] * 1000:>10.2f}"
+            f"{row['single_row_s'] * 1000:>12.3f}{row['batch_s'] * 1000:>10.2f}{row['recall']:>8.4f}{row['f1']:>8.4f}"
+        )
+    return '\n'.join(lines)
+
+
+def save_report(report, path=COMPACTION_REPORT_PATH):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Relatorio de compactacao salvo em {path}.")
+
+
+if __name__ == "__main__":
+    from sklearn.model_selection import train_test_split
+    from src.data.load_data import load_raw_data
+    from src.data.preprocess import preprocess_data, REQUIRED_COLUMNS
+    from src.models.threshold import load_threshold
+    from src.models.train_model import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Variantes compactas da floresta e relatorio tamanho/latencia/recall.")
+    parser.add_argument('--tolerance', type=float, default=RECALL_TOLERANCE, help="Perda maxima de recall")
+    parser.add_argument('--deploy', action='store_true', help=f"Grava a variante escolhida em {COMPILED_MODEL_PATH}")
+    args = parser.parse_args()
+
+    # Mesmo split do train_model: o OOB so e valido para as linhas do fit
+    X, y, _, _ = preprocess_data(load_raw_data(columns=REQUIRED_COLUMNS))
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    report, arrays = compaction_report(joblib.load(MODEL_PATH), X_train, y_train, X_test, y_test,
+                                       load_threshold(), args.tolerance)
+    print(format_report(report))
+    save_report(report)
+    if args.deploy:
+        save_compiled_arrays(arrays)
@@ -0,0 +1,299 @@
+import os
+import struct
+import zipfile
+import numpy as np
+from src.utils.paths import ARTIFACTS_DIR
+from src.models.feature_encoder import FeatureEncoder, compile_preprocessor
+
+COMPILED_MODEL_PATH = os.path.join(ARTIFACTS_DIR, 'model_compiled.npz')
+
+# Marcador de folha usado pelo sklearn em tree_.feature
+TREE_LEAF = -2
+
+# Linhas percorridas por vez: os arrays de nos (arvores x linhas) de um bloco cabem no cache
+BLOCK_ROWS = 2048
+
+
+def export_compiled_model(pipeline, path=COMPILED_MODEL_PATH):
+    """
+    Achata o Pipeline treinado (ColumnTransformer + RandomForestClassifier)
+    em arrays NumPy contiguos e salva em um arquivo .npz.
+
+    Guarda medianas de imputacao, media/escala do StandardScaler, tabelas de
+    categorias do OneHotEncoder e todas as arvores empilhadas em arrays de nos
+    (feature, threshold, left, right, valor da folha).
+    """
+    return save_compiled_arrays(compile_pipeline(pipeline), path)
+
+
+def save_compiled_arrays(arrays, path=COMPILED_MODEL_PATH):
+    # Grava em arquivo temporario e renomeia: quem observa o arquivo nunca ve um .npz pela metade
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    print(f"Compiled model saved to {path}.")
+    return path
+
+
+def compile_pipeline(pipeline, tree_indices=None, max_depth=None, compact=False):
+    """
+    Extrai do Pipeline treinado os arrays usados pelo CompiledModel.
+
+    tree_indices/max_depth/compact geram variantes reduzidas da floresta (ver stack_trees).
+    """
+    forest = pipeline.named_steps['classifier']
+    arrays = compile_preprocessor(pipeline.named_steps['preprocessor'])
+    arrays['classes'] = np.asarray(forest.classes_)
+    arrays.update(stack_trees(forest, tree_indices, max_depth, compact))
+    return arrays
+
+
+def tree_node_depths(tree):
+    """
+    Profundidade de cada no de uma arvore do sklearn (a raiz tem profundidade 0).
+    """
+    depth = np.zeros(tree.node_count, dtype=np.int64)
+    frontier, level = np.array([0]), 0
+    while len(frontier):
+        depth[frontier] = level
+        children = np.concatenate([tree.children_left[frontier], tree.children_right[frontier]])
+        frontier, level = children[children != -1], level + 1
+    return depth
+
+
+def floor_float32(values):
+    """
+    Arredonda para o float32 imediatamente abaixo (ou igual).
+
+    Como as features sao comparadas em float32, x <= t vale exatamente quando
+    x <= floor_float32(t): o limiar em float32 nao muda nenhuma decisao.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def stack_trees(forest, tree_indices=None, max_depth=None, compact=False):
+    """
+    Empilha os nos de todas as arvores em arrays contiguos.
+
+    Os filhos sao indices globais; cada folha aponta para si mesma, de modo que
+    o percurso pode rodar um numero fixo de passos sem ramificacao.
+
+    Variantes reduzidas: tree_indices escolhe um subconjunto das arvores;
+    max_depth corta cada arvore nessa profundidade (o no cortado vira folha com
+    a fracao de classes que ja guarda); compact grava limiares e valores em
+    float32 e indices em int32/int16.
+    """
+    estimators = forest.estimators_ if tree_indices is None else [forest.estimators_[i] for i in tree_indices]
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    depth_reached = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.feature == TREE_LEAF
+        keep = np.ones(tree.node_count, dtype=bool)
+        if max_depth is not None and tree.max_depth > max_depth:
+            depth = tree_node_depths(tree)
+            keep = depth <= max_depth
+            is_leaf = is_leaf | (depth == max_depth)
+        # Indice global de cada no mantido (os descartados nunca sao referenciados)
+        new_ids = np.cumsum(keep) - 1 + offset
+        node_ids = new_ids[keep]
+        is_leaf = is_leaf[keep]
+
+        features.append(np.where(is_leaf, 0, tree.feature[keep]).astype(np.int64))
+        thresholds.append(tree.threshold[keep].astype(np.float64))
+        lefts.append(np.where(is_leaf, node_ids, new_ids[tree.children_left[keep]]))
+        rights.append(np.where(is_leaf, node_ids, new_ids[tree.children_right[keep]]))
+        # tree_.value ja guarda a fracao de cada classe no no (= predict_proba da arvore nas folhas)
+        values.append(tree.value[keep, 0, :forest.n_classes_].astype(np.float64))
+        roots.append(offset)
+
+        offset += int(keep.sum())
+        depth_reached = max(depth_reached, tree.max_depth if max_depth is None else min(tree.max_depth, max_depth))
+
+    arrays = {
+        'tree_feature': np.concatenate(features),
+        'tree_threshold': np.concatenate(thresholds),
+        'tree_left': np.concatenate(lefts),
+        'tree_right': np.concatenate(rights),
+        'tree_value': np.concatenate(values),
+        'tree_roots': np.asarray(roots, dtype=np.int64),
+        'max_depth': np.int64(depth_reached),
+    }
+    if compact:
+        index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+        feature_dtype = np.int16 if forest.n_features_in_ < np.iinfo(np.int16).max else np.int32
+        arrays.update(
+            tree_feature=arrays['tree_feature'].astype(feature_dtype),
+            tree_threshold=floor_float32(arrays['tree_threshold']),
+            tree_left=arrays['tree_left'].astype(index_dtype),
+            tree_right=arrays['tree_right'].astype(index_dtype),
+            tree_value=arrays['tree_value'].astype(np.float32),
+            tree_roots=arrays['tree_roots'].astype(index_dtype),
+        )
+    return arrays
+
+
+class CompiledModel:
+    """
+    Avaliador NumPy puro do Pipeline exportado por export_compiled_model.
+
+    Expoe predict/predict_proba com a mesma interface do Pipeline do sklearn
+    e probabilidades identicas bit a bit.
+    """
+
+    def __init__(self, arrays):
+        self.encoder = FeatureEncoder(arrays)
+        self.classes_ = arrays['classes']
+
+        # Arrays no dtype gravado (int32/int16 nas variantes compactas), sem copia:
+        # memory-mapped, continuam compartilhados entre workers pelo page cache
+        self.tree_feature = arrays['tree_feature']
+        self.tree_threshold = arrays['tree_threshold']
+        self.tree_left = arrays['tree_left']
+        self.tree_right = arrays['tree_right']
+        self.tree_value = arrays['tree_value']
+        self.tree_roots = arrays['tree_roots']
+        self.max_depth = int(arrays['max_depth'])
+
+    @property
+    def n_features(self):
+        return self.encoder.n_features
+
+    def transform(self, data):
+        """
+        Equivalente ao ColumnTransformer: retorna a matriz densa de features.
+        """
+        return self.encoder.transform(data)
+
+    def predict_proba(self, data):
+        # Buffer da thread: a matriz so vive ate a conversao para float32 abaixo
+        X = self.encoder.transform(data, out=self.encoder.scratch(self.encoder.n_rows(data)))
+        return self.predict_proba_transformed(X)
+
+    def predict_proba_transformed(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows = X.shape[0]
+        if n_rows <= BLOCK_ROWS:
+            return self._average_leaves(self._traverse(X), n_rows)
+        # Lotes grandes em blocos de linhas: mesmo resultado, sem arrays de nos maiores que o cache
+        proba = np.empty((n_rows, len(self.classes_)), dtype=np.float64)
+        for start in range(0, n_rows, BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            proba[start:start + len(block)] = self._average_leaves(self._traverse(block), len(block))
+        return proba
+
+    def _traverse(self, X, on_step=None):
+        """
+        Percorre todas as arvores para todas as linhas de uma vez e retorna as folhas
+        (n_arvores * n_linhas). on_step(rows, feature, nodes, next_nodes) ve cada passo.
+        """
+        n_rows, n_features = X.shape
+        rows = np.tile(np.arange(n_rows), len(self.tree_roots))
+        # X[rows, feature] como take 1-D sobre X achatado (mais barato que o indexamento 2-D)
+        flat = np.ascontiguousarray(X).ravel()
+        row_offsets = rows * n_features
+        nodes = np.repeat(self.tree_roots, n_rows)
+        for _ in range(self.max_depth):
+            feature = self.tree_feature.take(nodes)
+            # As arvores do sklearn comparam as features em float32
+            go_left = flat.take(row_offsets + feature) <= self.tree_threshold.take(nodes)
+            next_nodes = np.where(go_left, self.tree_left.take(nodes), self.tree_right.take(nodes))
+            if on_step is not None:
+                on_step(rows, feature, nodes, next_nodes)
+            nodes = next_nodes
+        return nodes
+
+    def _average_leaves(self, nodes, n_rows):
+        n_trees = len(self.tree_roots)
+        # Variantes compactas guardam os valores em float32: uma conversao so, antes da soma
+        leaf_values = self.tree_value[nodes].astype(np.float64, copy=False).reshape(n_trees, n_rows, -1)
+
+        # Soma sequencial arvore a arvore, na mesma ordem do RandomForestClassifier
+        proba = np.zeros((n_rows, leaf_values.shape[2]), dtype=np.float64)
+        for tree_values in leaf_values:
+            proba += tree_values
+        proba /= n_trees
+        return proba
+
+    def explain(self, data):
+        """
+        Decomposicao pelos caminhos das arvores (P(risco) = base + soma das contribuicoes).
+
+        Cada no do caminho atribui a variacao de P(risco) entre ele e o filho
+        escolhido a feature que ele testa; a media sobre as arvores e somada
+        por coluna original (o bloco one-hot volta para a coluna categorica).
+        Roda no mesmo percurso vetorizado da previsao.
+
+        Retorna (P(risco), valor base, contribuicoes com shape (n_linhas, len(explain_columns))).
+        """
+        X = np.asarray(self.encoder.transform(data), dtype=np.float32)
+        n_rows, n_features = X.shape
+        value = np.ascontiguousarray(self.tree_value[:, 1])
+        contributions = np.zeros(n_rows * n_features, dtype=np.float64)
+
+        def accumulate(rows, feature, nodes, next_nodes):
+            # Nas folhas next_nodes == nodes: variacao zero, nada e atribuido
+            contributions[:] += np.bincount(
+                rows * n_features + feature, weights=value[next_nodes] - value[nodes], minlength=n_rows * n_features
+            )
+
+        leaves = self._traverse(X, accumulate)
+        n_trees = len(self.tree_roots)
+        contributions = contributions.reshape(n_rows, n_features) / n_trees
+        base_value = float(value[self.tree_roots].mean())
+        probability = self._average_leaves(leaves, n_rows)[:, 1]
+        return probability, base_value, contributions @ self.encoder.column_indicator
+
+    @property
+    def explain_columns(self):
+        return self.encoder.columns
+
+    def predict(self, data):
+        proba = self.predict_proba(data)
+        return self.classes_.take(np.argmax(proba, axis=1))
+
+
+def mmap_npz(path):
+    """
+    Abre os arrays de um .npz nao comprimido como np.memmap (somente leitura).
+
+    Varios processos que carregam o mesmo arquivo compartilham as paginas pelo
+    page cache do sistema, em vez de cada um manter uma copia privada.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} esta comprimido; use np.load sem mmap")
+            # Cabecalho local do zip: 30 bytes fixos + nome + campo extra
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_len, extra_len = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            order = 'F' if fortran_order else 'C'
+            key = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if int(np.prod(shape)) == 0:
+                arrays[key] = np.empty(shape, dtype=dtype, order=order)
+            else:
+                arrays[key] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order=order)
+    return arrays
+
+
+def load_compiled_model(path=COMPILED_MODEL_PATH, mmap=False):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Compiled model not found at {path}")
+    if mmap:
+        return CompiledModel(mmap_npz(path))
+    with np.load(path) as arrays:
+        return CompiledModel({key: arrays[key] for key in arrays.files})
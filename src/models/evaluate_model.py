@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import argparse
+import unicodedata
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.calibration import calibration_curve
+from sklearn.model_selection import RepeatedStratifiedKFold
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score, brier_score_loss
+
+from src.models.threshold import precision_recall_table, choose_threshold, MIN_RECALL
+from src.utils.paths import PROCESSED_DATA_DIR
+
+EVAL_CACHE_DIR = os.path.join(PROCESSED_DATA_DIR, 'eval_cache')
+
+# Limiares de P(risco) avaliados alem do 0.5 padrao
+THRESHOLDS = (0.3, 0.4, 0.5, 0.6, 0.7)
+
+# Recall por grupo: a escola e a pedra nao devem concentrar os alunos em risco nao detectados
+GROUP_COLUMNS = ('Instituição de ensino', 'Pedra 22')
+
+# Parametros que nao mudam o modelo ajustado e ficam fora da chave do cache
+IGNORED_PARAMS = ('memory', 'verbose', 'n_jobs')
+
+FOLD_METRICS = {
+    'accuracy': lambda y, p: accuracy_score(y, p >= 0.5),
+    'recall': lambda y, p: recall_score(y, p >= 0.5, zero_division=0),
+    'precision': lambda y, p: precision_score(y, p >= 0.5, zero_division=0),
+    'f1': lambda y, p: f1_score(y, p >= 0.5, zero_division=0),
+    'roc_auc': lambda y, p: roc_auc_score(y, p) if len(np.unique(y)) > 1 else np.nan,
+}
+
+
+def dataset_hash(X, y):
+    """
+    Hash do conteudo de X e y (valores, colunas e ordem das linhas).
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(list(map(str, X.columns))).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(np.asarray(y, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def params_hash(estimator):
+    """
+    Hash dos hiperparametros escalares do estimador (inclusive os aninhados do Pipeline).
+    """
+    params = {
+        k: v for k, v in estimator.get_params(deep=True).items()
+        if k.split('__')[-1] not in IGNORED_PARAMS and isinstance(v, (int, float, str, bool, type(None)))
+    }
+    params['estimator'] = type(estimator).__name__
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _fit_fold(estimator, X, y, train_idx, test_idx):
+    model = clone(estimator).fit(X.iloc[train_idx], y.iloc[train_idx])
+    positive = list(model.classes_).index(1)
+    return model.predict_proba(X.iloc[test_idx])[:, positive]
+
+
+def out_of_fold_predictions(estimator, X, y, n_splits=5, n_repeats=2, random_state=42, n_jobs=-1,
+                            cache_dir=EVAL_CACHE_DIR):
+    """
+    P(risco) fora do fold de cada aluno em cada repeticao do k-fold estratificado.
+
+    Os folds rodam em paralelo (joblib) e o resultado fica em cache no disco,
+    com chave = hash do dataset + hiperparametros + configuracao do CV: rodar
+    o relatorio de novo ou acrescentar uma metrica nao retreina nada.
+
+    Retorna (oof, fold), ambos com shape (n_repeats, n_amostras).
+    """
+    key = hashlib.sha256(
+        f"{dataset_hash(X, y)}:{params_hash(estimator)}:{n_splits}:{n_repeats}:{random_state}".encode('utf-8')
+    ).hexdigest()
+    cache_path = os.path.join(cache_dir, f"oof-{key[:24]}.npz") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            print(f"Previsoes out-of-fold carregadas do cache {cache_path}.")
+            return cached['oof'], cached['fold']
+
+    y = pd.Series(np.asarray(y), index=X.index)
+    cv = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+    splits = list(cv.split(X, y))
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold)(estimator, X, y, train_idx, test_idx) for train_idx, test_idx in splits
+    )
+
+    oof = np.full((n_repeats, len(X)), np.nan)
+    fold = np.full((n_repeats, len(X)), -1, dtype=np.int64)
+    for i, ((_, test_idx), proba) in enumerate(zip(splits, results)):
+        oof[i // n_splits, test_idx] = proba
+        fold[i // n_splits, test_idx] = i % n_splits
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, oof=oof, fold=fold)
+        os.replace(tmp_path, cache_path)
+    return oof, fold
+
+
+def evaluation_report(X, y, oof, fold, thresholds=THRESHOLDS, group_columns=GROUP_COLUMNS, n_bins=10,
+                      min_recall=MIN_RECALL):
+    """
+    Metricas a partir das previsoes out-of-fold (nenhum modelo e ajustado aqui).
+    """
+    y = np.asarray(y)
+    n_repeats, n_splits = oof.shape[0], int(fold.max()) + 1
+
+    # Metricas por fold (limiar 0.5): media e desvio entre todos os folds de todas as repeticoes
+    per_fold = {name: [] for name in FOLD_METRICS}
+    for r in range(n_repeats):
+        for k in range(n_splits):
+            mask = fold[r] == k
+            for name, metric in FOLD_METRICS.items():
+                per_fold[name].append(metric(y[mask], oof[r, mask]))
+    cv = {name: {'mean': float(np.nanmean(v)), 'std': float(np.nanstd(v))} for name, v in per_fold.items()}
+
+    # Demais metricas sobre a media das repeticoes
+    proba = oof.mean(axis=0)
+    at_threshold = {
+        str(t): {
+            'recall': float(recall_score(y, proba >= t, zero_division=0)),
+            'precision': float(precision_score(y, proba >= t, zero_division=0)),
+            'flagged_rate': float(np.mean(proba >= t)),
+        }
+        for t in thresholds
+    }
+
+    # Ponto de operacao: maior precisao com recall >= min_recall, entre todos os limiares
+    operating_point = choose_threshold(precision_recall_table(y, proba), min_recall)
+
+    prob_true, prob_pred = calibration_curve(y, proba, n_bins=n_bins, strategy='quantile')
+    calibration = {
+        'prob_pred': prob_pred.tolist(),
+        'prob_true': prob_true.tolist(),
+        'brier_score': float(brier_score_loss(y, proba)),
+    }
+
+    groups = {}
+    for col in [c for c in group_columns if c in X.columns]:
+        values = X[col].astype(object).where(X[col].notna(), 'missing').astype(str).to_numpy()
+        groups[col] = {}
+        for value in np.unique(values):
+            mask = values == value
+            positives = int(y[mask].sum())
+            groups[col][value] = {
+                'n': int(mask.sum()),
+                'positives': positives,
+                'recall': float(recall_score(y[mask], proba[mask] >= 0.5, zero_division=0)) if positives else None,
+            }
+
+    return {
+        'n_samples': int(len(y)),
+        'n_splits': n_splits,
+        'n_repeats': n_repeats,
+        'cv': cv,
+        'thresholds': at_threshold,
+        'operating_point': operating_point,
+        'calibration': calibration,
+        'groups': groups,
+    }
+
+
+def _metric_name(*parts):
+    # Nomes de metricas do MLflow: sem acentos nem espacos
+    text = '_'.join(str(p) for p in parts)
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return ''.join(c if c.isalnum() or c in '._-' else '_' for c in text).lower()
+
+
+def log_evaluation(report):
+    """
+    Registra o relatorio no run ativo do MLflow: metricas planas + JSON completo.
+    """
+    import mlflow
+
+    metrics = {}
+    for name, stats in report['cv'].items():
+        metrics[_metric_name('cv', name, 'mean')] = stats['mean']
+        metrics[_metric_name('cv', name, 'std')] = stats['std']
+    for t, values in report['thresholds'].items():
+        for name, value in values.items():
+            metrics[_metric_name(name, 'at', t)] = value
+    for name, value in report['operating_point'].items():
+        metrics[_metric_name('operating', name)] = value
+    metrics['brier_score'] = report['calibration']['brier_score']
+    for col, values in report['groups'].items():
+        for value, stats in values.items():
+            if stats['recall'] is not None:
+                metrics[_metric_name('recall', col, value)] = stats['recall']
+    metrics = {k: v for k, v in metrics.items() if not np.isnan(v)}
+
+    mlflow.log_metrics(metrics)
+    mlflow.log_dict(report, 'evaluation_report.json')
+
+
+def evaluate_model(estimator, X, y, n_splits=5, n_repeats=2, n_jobs=-1, cache_dir=EVAL_CACHE_DIR, log=True,
+                   min_recall=MIN_RECALL):
+    """
+    Relatorio de avaliacao por validacao cruzada; com log=True registra no run ativo do MLflow.
+    """
+    oof, fold = out_of_fold_predictions(estimator, X, y, n_splits, n_repeats, n_jobs=n_jobs, cache_dir=cache_dir)
+    report = evaluation_report(X, y, oof, fold, min_recall=min_recall)
+    if log:
+        log_evaluation(report)
+    print(f"CV recall: {report['cv']['recall']['mean']:.4f} (+/- {report['cv']['recall']['std']:.4f})")
+    point = report['operating_point']
+    print(f"Limiar para recall >= {min_recall}: {point['threshold']:.4f} "
+          f"(precisao {point['precision']:.4f}, recall {point['recall']:.4f})")
+    return report
+
+
+if __name__ == "__main__":
+    import joblib
+    import mlflow
+    from src.data.load_data import load_raw_data
+    from src.data.preprocess import preprocess_data, REQUIRED_COLUMNS
+    from src.models.train_model import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Relatorio de avaliacao por validacao cruzada do modelo salvo.")
+    parser.add_argument('--run-id', help="Run do MLflow que recebe as metricas (padrao: um run novo)")
+    parser.add_argument('--splits', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args()
+
+    X, y, _, _ = preprocess_data(load_raw_data(columns=REQUIRED_COLUMNS))
+    with mlflow.start_run(run_id=args.run_id):
+        report = evaluate_model(joblib.load(MODEL_PATH), X, y, args.splits, args.repeats)
+    print(json.dumps(report['thresholds'], indent=2))
@@ -0,0 +1,196 @@
+import threading
+import numpy as np
+
+# Acima disso o buffer reutilizavel nao compensa a memoria presa por thread
+SCRATCH_MAX_ROWS = 1024
+
+
+def compile_preprocessor(preprocessor):
+    """
+    Extrai do ColumnTransformer treinado (build_preprocessing_pipeline) os arrays
+    usados pelo FeatureEncoder: medianas de imputacao, media/escala do
+    StandardScaler e tabelas de categorias do OneHotEncoder.
+    """
+    transformers = {name: (steps, cols) for name, steps, cols in preprocessor.transformers_}
+    if set(transformers) - {'num', 'cat', 'remainder'}:
+        raise ValueError(f"Transformers nao suportados: {sorted(transformers)}")
+
+    num_steps, num_cols = transformers['num']
+    cat_steps, cat_cols = transformers['cat']
+    medians = num_steps.named_steps['imputer'].statistics_.astype(np.float64)
+    scaler = num_steps.named_steps['scaler']
+    encoder = cat_steps.named_steps['onehot']
+
+    # O SimpleImputer descarta colunas que eram totalmente vazias no treino
+    num_keep = ~np.isnan(medians)
+
+    categories = [np.asarray(c).astype(str) for c in encoder.categories_]
+
+    return {
+        'num_cols': np.asarray(num_cols, dtype=str),
+        'num_keep': num_keep,
+        'num_median': medians,
+        'num_mean': scaler.mean_.astype(np.float64),
+        'num_scale': scaler.scale_.astype(np.float64),
+        'cat_cols': np.asarray(cat_cols, dtype=str),
+        'cat_values': np.concatenate(categories) if categories else np.array([], dtype=str),
+        'cat_sizes': np.array([len(c) for c in categories], dtype=np.int64),
+    }
+
+
+def _category(value):
+    # Valores ausentes viram 'missing', como no SimpleImputer(fill_value='missing')
+    if value is None or (isinstance(value, float) and value != value):
+        return 'missing'
+    return str(value)
+
+
+class FeatureEncoder:
+    """
+    Equivalente NumPy do ColumnTransformer: mediana nos ausentes, padronizacao e
+    one-hot por tabelas categoria -> indice, com saida identica bit a bit.
+
+    Aceita DataFrame, dict de colunas ou record array do NumPy, sem pandas.
+    """
+
+    def __init__(self, arrays):
+        num_cols = [str(c) for c in arrays['num_cols']]
+        num_keep = np.asarray(arrays['num_keep'], dtype=bool)
+        self.num_cols = [c for c, keep in zip(num_cols, num_keep) if keep]
+        self.num_median = np.asarray(arrays['num_median'])[num_keep]
+        self.num_mean = np.asarray(arrays['num_mean'])
+        self.num_scale = np.asarray(arrays['num_scale'])
+        self.cat_cols = [str(c) for c in arrays['cat_cols']]
+
+        # Tabelas categoria -> posicao da coluna one-hot
+        self.cat_lookup = []
+        start = 0
+        for size in arrays['cat_sizes']:
+            values = arrays['cat_values'][start:start + size]
+            self.cat_lookup.append({str(v): start + i for i, v in enumerate(values)})
+            start += int(size)
+        self.n_onehot = start
+        self.n_numeric = len(self.num_cols)
+        self._local = threading.local()
+
+    @property
+    def n_features(self):
+        return self.n_numeric + self.n_onehot
+
+    @property
+    def columns(self):
+        """
+        Colunas originais (do preprocess_data) que geram as features.
+        """
+        return self.num_cols + self.cat_cols
+
+    @property
+    def column_indicator(self):
+        """
+        Matriz (n_features x n_colunas) que soma cada feature na coluna original:
+        identidade para as numericas, o bloco one-hot inteiro para cada categorica.
+        """
+        indicator = np.zeros((self.n_features, len(self.columns)), dtype=np.float64)
+        indicator[np.arange(self.n_numeric), np.arange(self.n_numeric)] = 1.0
+        start = self.n_numeric
+        for j, lookup in enumerate(self.cat_lookup):
+            indicator[start:start + len(lookup), self.n_numeric + j] = 1.0
+            start += len(lookup)
+        return indicator
+
+    def n_rows(self, data):
+        return len(data[self.num_cols[0]] if self.num_cols else data[self.cat_cols[0]])
+
+    def scratch(self, n_rows):
+        """
+        Buffer de saida reutilizado pela thread atual (None para lotes grandes).
+
+        O conteudo e sobrescrito na proxima chamada da mesma thread: so serve
+        para matrizes que sao consumidas em seguida (ex.: pelas arvores).
+        """
+        if n_rows > SCRATCH_MAX_ROWS:
+            return None
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < n_rows:
+            buffer = np.empty((max(n_rows, 1), self.n_features), dtype=np.float64)
+            self._local.buffer = buffer
+        return buffer[:n_rows]
+
+    def transform(self, data, out=None):
+        """
+        Matriz densa de features; escreve em `out` (n_rows x n_features) se informado.
+        """
+        n_rows = self.n_rows(data)
+        if out is None:
+            out = np.empty((n_rows, self.n_features), dtype=np.float64)
+        elif out.shape != (n_rows, self.n_features):
+            raise ValueError(f"Buffer com shape {out.shape}; esperado {(n_rows, self.n_features)}")
+
+        num = out[:, :self.n_numeric]
+        for j, col in enumerate(self.num_cols):
+            # asarray converte None em NaN; colunas de record array nao sao copiadas
+            num[:, j] = np.asarray(data[col], dtype=np.float64)
+        np.copyto(num, self.num_median, where=np.isnan(num))
+        num -= self.num_mean
+        num /= self.num_scale
+
+        onehot = out[:, self.n_numeric:]
+        onehot.fill(0.0)
+        for col, lookup in zip(self.cat_cols, self.cat_lookup):
+            for row, value in enumerate(data[col]):
+                # Categorias desconhecidas ficam zeradas (handle_unknown='ignore')
+                idx = lookup.get(_category(value))
+                if idx is not None:
+                    onehot[row, idx] = 1.0
+
+        return out
+
+
+class EncodedPipeline:
+    """
+    Pipeline do sklearn servido com o FeatureEncoder no lugar do ColumnTransformer:
+    a entrada (dict ou record array) vai direto para a matriz do RandomForest.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.encoder = FeatureEncoder(compile_preprocessor(pipeline.named_steps['preprocessor']))
+        self.classifier = pipeline.named_steps['classifier']
+        self.classes_ = self.classifier.classes_
+        self._compiled = None
+
+    def transform(self, data):
+        return self.encoder.transform(data)
+
+    def predict_proba(self, data):
+        X = self.encoder.transform(data, out=self.encoder.scratch(self.encoder.n_rows(data)))
+        return self.classifier.predict_proba(X)
+
+    def predict(self, data):
+        proba = self.predict_proba(data)
+        return self.classes_.take(np.argmax(proba, axis=1))
+
+    def explain(self, data):
+        """
+        Mesma decomposicao do CompiledModel, sobre as arvores empilhadas do classificador.
+        """
+        if self._compiled is None:
+            # Import tardio: compiled_model depende deste modulo
+            from src.models.compiled_model import CompiledModel, compile_pipeline
+            self._compiled = CompiledModel(compile_pipeline(self.pipeline))
+        return self._compiled.explain(data)
+
+    @property
+    def explain_columns(self):
+        return self.encoder.columns
+
+
+def encode_pipeline(model):
+    """
+    Envolve o Pipeline em um EncodedPipeline quando o pre-processamento e suportado;
+    caso contrario devolve o modelo como esta.
+    """
+    try:
+        return EncodedPipeline(model)
+    except (AttributeError, KeyError, ValueError):
+        return model
@@ -0,0 +1,356 @@
+import os
+import ast
+import copy
+import json
+import math
+import joblib
+import numpy as np
+import pandas as pd
+import mlflow
+import mlflow.sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import recall_score, precision_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+from src.data.load_data import load_raw_data
+from src.data.ingest import ingest_workbook, load_longitudinal
+from src.data.preprocess import preprocess_data, build_preprocessing_pipeline, REQUIRED_COLUMNS, LONGITUDINAL_FEATURES
+from src.models.compiled_model import export_compiled_model, COMPILED_MODEL_PATH
+from src.models.streaming_drift import DriftMonitor, load_reference_profile, save_reference_profile, REFERENCE_PROFILE_PATH
+from src.models.threshold import load_threshold, is_risk, THRESHOLD_PATH
+from src.models.train_model import MODEL_PATH, refresh_score_table, save_model
+from src.utils.fingerprint import file_fingerprint
+from src.utils.paths import PROCESSED_DATA_DIR
+
+# Arquivos de dados novos ja incorporados (fingerprint -> caminho), para nao treinar duas vezes nas mesmas linhas
+INCREMENTAL_STATE_PATH = os.path.join(PROCESSED_DATA_DIR, 'incremental_state.json')
+
+MODES = ('auto', 'warm_start', 'refit')
+
+# Mais que isso de features com drift: o pre-processamento (medianas, escalas,
+# categorias) ja nao representa os dados e a floresta e reajustada do zero
+REFIT_DRIFTED_FEATURES = 2
+
+# Fracao dos dados novos guardada para comparar modelo atual x candidato
+HOLDOUT_FRACTION = 0.3
+
+# Piora maxima aceita no holdout para promover o candidato
+PROMOTION_TOLERANCE = 0.01
+
+# Arvores novas no warm start: no minimo isso, mesmo com poucos dados novos
+MIN_NEW_TREES = 10
+
+
+def artifact_paths(model_path=MODEL_PATH):
+    """
+    Artefatos que acompanham o modelo (.npz compilado, perfil de drift e
+    limiar), no mesmo diretorio dele e com os nomes padrao.
+    """
+    directory = os.path.dirname(os.path.abspath(model_path))
+    return {
+        name: os.path.join(directory, os.path.basename(default))
+        for name, default in (
+            ('compiled', COMPILED_MODEL_PATH), ('reference', REFERENCE_PROFILE_PATH), ('threshold', THRESHOLD_PATH)
+        )
+    }
+
+
+def training_columns(df):
+    # Nomes genericos da tabela longitudinal viram as colunas do treino antes de qualquer concat
+    df = df.rename(columns={k: v for k, v in LONGITUDINAL_FEATURES.items() if k in df.columns and v not in df.columns})
+    return df[[c for c in REQUIRED_COLUMNS if c in df.columns]]
+
+
+def load_new_data(path):
+    """
+    Dados rotulados no formato bruto (com 'Defas') ou no schema da tabela
+    longitudinal: Excel, CSV ou Parquet.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Arquivo nao encontrado: {path}")
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        df = pd.read_parquet(path)
+    elif extension == '.csv':
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path)
+    return training_columns(df)
+
+
+def load_state(path=INCREMENTAL_STATE_PATH):
+    if not os.path.exists(path):
+        return {'incorporated': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state, path=INCREMENTAL_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _parse_param(value):
+    # Parametros do MLflow voltam como texto: '200' -> 200, 'None' -> None, 'sqrt' -> 'sqrt'
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def last_search_run():
+    """
+    Ultimo run de busca completa do MLflow (o que registrou 'search_strategy'), ou None.
+    """
+    try:
+        runs = mlflow.search_runs(order_by=['attributes.start_time DESC'])
+    except Exception as e:
+        print(f"Warning: MLflow indisponivel ({e}); usando os dados do modelo salvo.")
+        return None
+    if 'params.search_strategy' not in runs.columns:
+        return None
+    runs = runs[runs['params.search_strategy'].notna()]
+    return runs.iloc[0] if len(runs) else None
+
+
+def last_best_params(model=None, run=None):
+    """
+    Hiperparametros do classificador no run de busca (last_search_run); sem run, os do modelo salvo.
+    """
+    if run is not None:
+        params = {
+            col[len('params.classifier__'):]: _parse_param(run[col])
+            for col in run.index
+            if col.startswith('params.classifier__') and pd.notna(run[col])
+        }
+        print(f"Parametros do run {run['run_id']}: {params}")
+        return params
+    if model is None:
+        return {}
+    return {k: v for k, v in model.named_steps['classifier'].get_params().items() if k != 'warm_start'}
+
+
+def training_years(run, default=None):
+    """
+    Anos do --years do treino completo (None = so a primeira aba da planilha).
+    """
+    value = run.get('params.training_years') if run is not None else None
+    if value is None or pd.isna(value):
+        return default
+    if value == 'PEDE2022':
+        return None
+    return [int(year) for year in str(value).split(',')]
+
+
+def holdout_metrics(model, X, y, threshold=None):
+    """
+    Recall, precisao e AUC no holdout, com o limiar de decisao servido pela API.
+    """
+    probability = model.predict_proba(X)[:, list(model.classes_).index(1)]
+    predicted = is_risk(probability, threshold)
+    return {
+        'recall': float(recall_score(y, predicted, zero_division=0)),
+        'precision': float(precision_score(y, predicted, zero_division=0)),
+        'roc_auc': float(roc_auc_score(y, probability)) if len(np.unique(y)) > 1 else float('nan'),
+    }
+
+
+def should_promote(current, candidate, tolerance=PROMOTION_TOLERANCE):
+    """
+    O candidato nao pode perder mais que `tolerance` de recall nem de AUC.
+    """
+    for name in ('recall', 'roc_auc'):
+        if not math.isnan(current[name]) and candidate[name] < current[name] - tolerance:
+            return False
+    return True
+
+
+def choose_mode(drift_report, y_new, mode='auto', max_drifted=REFIT_DRIFTED_FEATURES):
+    """
+    'refit' quando o drift passa do limite (ou os dados novos tem uma classe so,
+    o que o warm start nao suporta, mesmo pedido explicitamente); caso contrario 'warm_start'.
+    """
+    single_class = len(np.unique(y_new)) < 2
+    if mode == 'warm_start' and single_class:
+        print("Warning: dados novos com uma classe so; warm start nao suportado, usando refit.")
+        return 'refit'
+    if mode != 'auto':
+        return mode
+    if len(drift_report['drifted_features']) > max_drifted or single_class:
+        return 'refit'
+    return 'warm_start'
+
+
+def warm_start_forest(model, X_new, y_new, n_history, min_new_trees=MIN_NEW_TREES):
+    """
+    Copia do Pipeline com arvores a mais treinadas so nas linhas novas.
+
+    O pre-processamento fica como esta (ajustado no historico). O numero de
+    arvores novas e proporcional ao volume de dados novos, para que o peso
+    delas na media da floresta acompanhe a fracao de linhas que representam.
+    """
+    if len(np.unique(y_new)) < 2:
+        # O fit com warm start refaz classes_ com uma classe so e as arvores novas sairiam com uma coluna
+        raise ValueError("Warm start precisa das duas classes nos dados novos; use o refit.")
+    candidate = copy.deepcopy(model)
+    forest = candidate.named_steps['classifier']
+    n_trees = len(forest.estimators_)
+    new_trees = max(min_new_trees, math.ceil(n_trees * len(X_new) / max(n_history, 1)))
+    forest.set_params(warm_start=True, n_estimators=n_trees + new_trees)
+    forest.fit(candidate.named_steps['preprocessor'].transform(X_new), y_new)
+    # O modelo salvo nao deve acumular arvores em um fit acidental
+    forest.set_params(warm_start=False)
+    return candidate
+
+
+def refit_forest(params, df):
+    """
+    Pipeline novo com os hiperparametros da ultima busca, sem repetir a busca.
+    """
+    X, y, numeric_cols, categorical_cols = preprocess_data(df)
+    pipeline = Pipeline(steps=[
+        ('preprocessor', build_preprocessing_pipeline(numeric_cols, categorical_cols)),
+        ('classifier', RandomForestClassifier(**{**params, 'random_state': 42}))
+    ])
+    return pipeline.fit(X, y), X
+
+
+def training_history(years=None):
+    """
+    Dataset bruto do treino completo: a primeira aba ou, com `years`, as mesmas particoes da tabela longitudinal.
+    """
+    if not years:
+        return load_raw_data(columns=REQUIRED_COLUMNS)
+    ingest_workbook()
+    return training_columns(load_longitudinal(years))
+
+
+def history_data(state):
+    """
+    Dataset bruto do treino completo (anos em state['training_years']) mais os arquivos novos ja promovidos.
+    """
+    frames = [training_history(state.get('training_years'))]
+    for entry in state['incorporated'].values():
+        if entry['promoted'] and os.path.exists(entry['path']):
+            frames.append(load_new_data(entry['path']))
+    return pd.concat(frames, ignore_index=True)
+
+
+def incremental_train(new_data_path, mode='auto', holdout_fraction=HOLDOUT_FRACTION,
+                      tolerance=PROMOTION_TOLERANCE, model_path=MODEL_PATH, state_path=INCREMENTAL_STATE_PATH):
+    """
+    Treino incremental: so as linhas novas sao processadas, sem busca de hiperparametros.
+
+    Uma parte dos dados novos fica de fora (holdout) e decide a promocao: o
+    candidato (warm start ou refit, conforme o drift) substitui o modelo atual
+    apenas se nao piorar recall e AUC nesse holdout, medidos com o limiar de
+    decisao servido. O limiar so e recalculado no proximo treino completo.
+
+    Perfil de drift, limiar e .npz sao lidos e gravados ao lado de `model_path`
+    (artifact_paths); a tabela de scores so e atualizada para o modelo padrao.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo invalido: {mode}. Opcoes: {MODES}")
+
+    state = load_state(state_path)
+    fingerprint = file_fingerprint(new_data_path)
+    if fingerprint in state['incorporated']:
+        print(f"{new_data_path} ja foi processado; nada a fazer.")
+        return None
+
+    print("Carregando dados novos...")
+    paths = artifact_paths(model_path)
+    model = joblib.load(model_path)
+    reference = load_reference_profile(paths['reference'])
+    new_df = load_new_data(new_data_path)
+    X_new, y_new, _, _ = preprocess_data(new_df)
+    stratify = y_new if y_new.value_counts().min() >= 2 else None
+    X_update, X_holdout, y_update, y_holdout = train_test_split(
+        X_new, y_new, test_size=holdout_fraction, random_state=42, stratify=stratify
+    )
+
+    monitor = DriftMonitor(reference)
+    monitor.observe(new_df)
+    drift = monitor.report()
+    mode = choose_mode(drift, y_update, mode)
+    print(f"{len(X_new)} linhas novas, features com drift: {drift['drifted_features']} -> {mode}.")
+
+    history_rows = state.get('history_rows', reference['n'])
+    if mode == 'warm_start':
+        candidate = warm_start_forest(model, X_update, y_update, history_rows)
+        X_fit = None
+    else:
+        # Mesmo run da busca: hiperparametros e anos do historico do treino completo
+        run = last_search_run()
+        params = last_best_params(model, run)
+        state['training_years'] = training_years(run, state.get('training_years'))
+        history = pd.concat([history_data(state), new_df.loc[X_update.index]], ignore_index=True)
+        candidate, X_fit = refit_forest(params, history)
+
+    threshold = load_threshold(paths['threshold'])
+    current_metrics = holdout_metrics(model, X_holdout, y_holdout, threshold)
+    candidate_metrics = holdout_metrics(candidate, X_holdout, y_holdout, threshold)
+    promoted = should_promote(current_metrics, candidate_metrics, tolerance)
+    print(f"Holdout atual: {current_metrics}")
+    print(f"Holdout candidato: {candidate_metrics}")
+
+    with mlflow.start_run():
+        mlflow.log_params({
+            'training_mode': 'incremental',
+            'incremental_mode': mode,
+            'new_rows': len(X_new),
+            'holdout_rows': len(X_holdout),
+            'drifted_features': len(drift['drifted_features']),
+            'n_trees': len(candidate.named_steps['classifier'].estimators_),
+        })
+        mlflow.log_metrics({f"current_holdout_{k}": v for k, v in current_metrics.items() if not math.isnan(v)})
+        mlflow.log_metrics({f"candidate_holdout_{k}": v for k, v in candidate_metrics.items() if not math.isnan(v)})
+        mlflow.log_metric('promoted', int(promoted))
+
+        if promoted:
+            print(f"Candidato promovido; salvando em {model_path}...")
+            save_model(candidate, model_path)
+            export_compiled_model(candidate, paths['compiled'])
+            if X_fit is not None:
+                # Refit: o perfil de drift passa a ser o do novo historico
+                save_reference_profile(X_fit, paths['reference'])
+                history_rows = len(X_fit)
+            else:
+                history_rows += len(X_update)
+            if os.path.abspath(model_path) == os.path.abspath(MODEL_PATH):
+                refresh_score_table()
+            mlflow.sklearn.log_model(candidate, "random_forest_model")
+        else:
+            print("Candidato rejeitado; o modelo atual foi mantido.")
+
+    # Arquivo registrado mesmo se rejeitado: rodar de novo nao muda o resultado
+    state['incorporated'][fingerprint] = {
+        'path': os.path.abspath(new_data_path),
+        'rows': int(len(X_new)),
+        'mode': mode,
+        'promoted': promoted,
+    }
+    state['history_rows'] = int(history_rows)
+    save_state(state, state_path)
+    return {
+        'mode': mode,
+        'promoted': promoted,
+        'drifted_features': drift['drifted_features'],
+        'current': current_metrics,
+        'candidate': candidate_metrics,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Treino incremental com os dados rotulados novos.")
+    parser.add_argument('new_data', help="Excel/CSV/Parquet no formato bruto, com a coluna 'Defas'")
+    parser.add_argument('--mode', choices=MODES, default='auto')
+    parser.add_argument('--holdout', type=float, default=HOLDOUT_FRACTION, help="Fracao dos dados novos no holdout")
+    parser.add_argument('--tolerance', type=float, default=PROMOTION_TOLERANCE)
+    args = parser.parse_args()
+    incremental_train(args.new_data, args.mode, args.holdout, args.tolerance)
@@ -4,20 +4,32 @@ from sklearn.model_selection import train_test_split
 from evidently import Report
 from evidently.presets import DataDriftPreset, DataSummaryPreset
 from src.data.load_data import load_raw_data
-from src.data.preprocess import preprocess_data
+from src.data.ingest import ingest_workbook, load_longitudinal
+from src.data.preprocess import preprocess_data, REQUIRED_COLUMNS
 
-def generate_drift_dashboard():
-    print("Carregando dados para análise de drift...")
-    df = load_raw_data()
-    
+def _with_target(df):
     # Processamos os dados para ter o formato final usado pelo modelo
     X, y, _, _ = preprocess_data(df)
     
     # Juntamos X e y para o Evidently poder analisar a base completa
     X['Defas'] = y
-    
-    # Dividimos os dados em referência (treino) e produção (teste) para simular o cenário real
-    reference_data, current_data = train_test_split(X, test_size=0.3, random_state=42)
+    return X
+
+def generate_drift_dashboard(reference_year=None, current_year=None):
+    """
+    Painel de drift. Com os dois anos, compara as particoes desses anos da
+    tabela longitudinal (ex.: 2022 x 2024); sem eles, simula com um split do PEDE2022.
+    """
+    print("Carregando dados para análise de drift...")
+    if reference_year and current_year:
+        ingest_workbook()
+        reference_data = _with_target(load_longitudinal([reference_year]))
+        current_data = _with_target(load_longitudinal([current_year]))
+    else:
+        X = _with_target(load_raw_data(columns=REQUIRED_COLUMNS))
+        
+        # Dividimos os dados em referência (treino) e produção (teste) para simular o cenário real
+        reference_data, current_data = train_test_split(X, test_size=0.3, random_state=42)
     
     print("Gerando painel de Drift (Evidently AI)...")
     
@@ -37,4 +49,9 @@ def generate_drift_dashboard():
     print(f"✅ Painel de monitoramento gerado com sucesso: {output_path}")
 
 if __name__ == "__main__":
-    generate_drift_dashboard()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Painel de drift (Evidently).")
+    parser.add_argument('--reference-year', type=int, help="Ano de referencia na tabela longitudinal")
+    parser.add_argument('--current-year', type=int, help="Ano comparado com a referencia")
+    args = parser.parse_args()
+    generate_drift_dashboard(args.reference_year, args.current_year)
\ No newline at end of file
@@ -1,28 +1,187 @@
 import joblib
 import os
+import sys
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from src.utils.paths import ARTIFACTS_DIR
+from src.utils.metrics import METRICS
+from src.models.compiled_model import load_compiled_model, COMPILED_MODEL_PATH
+from src.models.feature_encoder import EncodedPipeline
+from src.models.threshold import is_risk, load_threshold
+from src.data.preprocess import select_features, FEATURE_COLUMNS
 
 MODEL_PATH = os.path.join(ARTIFACTS_DIR, 'model.joblib')
 
-def load_model():
+# Engines de inferencia: 'sklearn' (Pipeline original) ou 'numpy' (modelo compilado)
+ENGINES = ('sklearn', 'numpy')
+
+def model_artifact_path(engine='sklearn'):
+    # Arquivo carregado por cada engine (a variante compacta tambem vai para o .npz)
+    return COMPILED_MODEL_PATH if engine == 'numpy' else MODEL_PATH
+
+@METRICS.timed('load_model')
+def load_model(engine='sklearn'):
+    if engine not in ENGINES:
+        raise ValueError(f"Engine invalida: {engine}. Opcoes: {ENGINES}")
+    if engine == 'numpy':
+        return load_compiled_model()
     if not os.path.exists(MODEL_PATH):
         raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
     return joblib.load(MODEL_PATH)
 
-def make_prediction(model, data: pd.DataFrame):
+def make_prediction(model, data: pd.DataFrame, threshold=None):
     """
     Faz uma previsão para os dados de entrada.
     Os dados de entrada devem ser um DataFrame com as mesmas colunas dos dados de treinamento.
+    Aceita tanto o Pipeline do sklearn quanto o CompiledModel (mesma interface).
+
+    Uma unica passada pela floresta: o rotulo vem das probabilidades, com o
+    limiar de decisao informado (ou o criterio padrao do model.predict).
     """
-    prediction = model.predict(data)
-    probability = model.predict_proba(data)
+    with METRICS.stage('make_prediction.predict_proba'):
+        probability = model.predict_proba(data)
+    prediction = predict_labels(model, probability[:, 1], threshold)
     return prediction, probability
 
+def predict_labels(model, risk_probability, threshold=None):
+    classes = getattr(model, 'classes_', np.array([0, 1]))
+    return np.where(is_risk(risk_probability, threshold), classes[1], classes[0])
+
+def explainer_for(model):
+    """
+    Modelo com explain(): o CompiledModel ja tem; o Pipeline do sklearn e envolvido uma vez.
+    """
+    return model if hasattr(model, 'explain') else EncodedPipeline(model)
+
+@METRICS.timed('score_chunk')
+def score_chunk(model, chunk, id_columns=(), threshold=None, explain=False):
+    """
+    Aplica a mesma selecao/conversao de features do treino e pontua o bloco
+    com uma unica passada (o rotulo vem das probabilidades e do limiar).
+
+    Com explain=True (modelo de explainer_for) acrescenta o valor base e uma
+    coluna contribution_<coluna> por feature original.
+    """
+    X, _, _ = select_features(chunk)
+    result = chunk[list(id_columns)].reset_index(drop=True)
+    if explain:
+        risk_probability, base_value, contributions = model.explain(X)
+    else:
+        risk_probability = model.predict_proba(X)[:, 1]
+    result['prediction'] = predict_labels(model, risk_probability, threshold)
+    result['risk_probability'] = risk_probability
+    if explain:
+        result['base_value'] = base_value
+        for j, col in enumerate(model.explain_columns):
+            result[f'contribution_{col}'] = contributions[:, j]
+    return result
+
+def iter_chunks(input_path, chunk_size, columns):
+    """
+    Le o arquivo em blocos: CSV com leitor em chunks, Parquet por lotes de row groups.
+    """
+    if input_path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(input_path)
+        available = [c for c in columns if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=available):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(input_path, chunksize=chunk_size, usecols=lambda c: c in columns)
+
+class ChunkWriter:
+    """
+    Escreve os resultados de forma incremental em Parquet ou CSV.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.parquet_writer = None
+        self.rows = 0
+
+    def write(self, df):
+        if self.output_path.endswith('.parquet'):
+            if self.parquet_writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self.parquet_writer = pq.ParquetWriter(self.output_path, table.schema)
+            else:
+                # O schema do arquivo e o do primeiro bloco: o read_csv infere os tipos por bloco
+                # (ex.: um id inteiro vira float64 no bloco que tem NaN) e a conversao vai para ele
+                table = pa.Table.from_pandas(df, schema=self.parquet_writer.schema, preserve_index=False)
+            self.parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.output_path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+# Modelo carregado uma vez por processo do pool
+_WORKER_MODEL = None
+
+def _init_worker(engine, explain):
+    global _WORKER_MODEL
+    _WORKER_MODEL = explainer_for(load_model(engine)) if explain else load_model(engine)
+
+def _score_in_worker(chunk, id_columns, threshold, explain):
+    return score_chunk(_WORKER_MODEL, chunk, id_columns, threshold, explain)
+
+def score_file(input_path, output_path, chunk_size=50000, workers=1, engine='sklearn', id_columns=(), threshold=None,
+               explain=False):
+    """
+    Pontua um CSV/Parquet grande em blocos, com memoria limitada ao tamanho do bloco.
+
+    Com workers > 1 os blocos sao distribuidos em um pool de processos; no
+    maximo 2 blocos por worker ficam em voo e a saida mantem a ordem da entrada.
+    """
+    columns = set(FEATURE_COLUMNS) | set(id_columns)
+    chunks = iter_chunks(input_path, chunk_size, columns)
+    writer = ChunkWriter(output_path)
+    try:
+        if workers <= 1:
+            model = explainer_for(load_model(engine)) if explain else load_model(engine)
+            for chunk in chunks:
+                writer.write(score_chunk(model, chunk, id_columns, threshold, explain))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(engine, explain)) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(_score_in_worker, chunk, tuple(id_columns), threshold, explain))
+                    if len(pending) >= 2 * workers:
+                        writer.write(pending.popleft().result())
+                while pending:
+                    writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+
+    print(f"{writer.rows} linhas pontuadas em {output_path}.")
+    return writer.rows
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pontuacao em lote de arquivos CSV/Parquet.")
+    parser.add_argument('input', help="Arquivo de entrada (.csv ou .parquet)")
+    parser.add_argument('output', help="Arquivo de saida (.csv ou .parquet)")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--engine', choices=ENGINES, default='sklearn')
+    parser.add_argument('--id-columns', nargs='*', default=[], help="Colunas copiadas para a saida (ex.: RA)")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="Limiar de P(risco) (padrao: o salvo no treino, ou 0.5)")
+    parser.add_argument('--explain', action='store_true', help="Inclui a contribuicao de cada feature")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        model = load_model()
-        print("Model loaded.")
-        pass
+        threshold = args.threshold if args.threshold is not None else load_threshold()
+        score_file(args.input, args.output, args.chunk_size, args.workers, args.engine, args.id_columns, threshold,
+                   args.explain)
     except Exception as e:
         print(f"Error: {e}")
+        # Codigo de saida != 0 para que jobs agendados detectem a falha
+        sys.exit(1)
@@ -0,0 +1,121 @@
+import os
+import time
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+from src.data.ingest import ingest_workbook, load_longitudinal
+from src.data.preprocess import select_features
+from src.models.predict_model import load_model, make_prediction, model_artifact_path, ENGINES
+from src.models.threshold import load_threshold, THRESHOLD_PATH
+from src.utils.fingerprint import artifact_fingerprint
+from src.utils.paths import PROCESSED_DATA_DIR
+
+# Tabela de scores pre-calculados, lida pelo GET /students/{id}/risk
+SCORE_TABLE_PATH = os.path.join(PROCESSED_DATA_DIR, 'risk_scores.sqlite')
+
+ID_COLUMN = 'RA'
+
+# Engine padrao da API (api.app, api.serve e Docker): a tabela e pontuada e versionada com
+# o artefato que ela serve, independente do ambiente de quem roda o job. Com a API em
+# MODEL_ENGINE=sklearn, rode com --engine sklearn (senao o /students/{id}/risk marca as linhas)
+SERVED_ENGINE = 'numpy'
+
+# WITHOUT ROWID: a tabela e a propria B-tree da chave primaria (busca O(log n), sem indice extra)
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS scores ("
+    "student_id TEXT PRIMARY KEY, "
+    "risk_probability REAL NOT NULL, "
+    "prediction INTEGER NOT NULL, "
+    "model_version TEXT NOT NULL, "
+    "input_hash INTEGER NOT NULL, "
+    "scored_at REAL NOT NULL"
+    ") WITHOUT ROWID"
+)
+
+
+def student_base(years=None):
+    """
+    Registro mais recente de cada aluno na tabela longitudinal.
+    """
+    ingest_workbook()
+    df = load_longitudinal(years)
+    df = df[df[ID_COLUMN].notna()].sort_values('year', kind='mergesort')
+    return df.drop_duplicates(ID_COLUMN, keep='last').reset_index(drop=True)
+
+
+def input_hashes(X):
+    # Hash de 64 bits das features de cada linha; int64 porque o INTEGER do SQLite e com sinal
+    return pd.util.hash_pandas_object(X, index=False).to_numpy().view(np.int64)
+
+
+def model_version(engine='sklearn'):
+    # Fingerprint do artefato que a engine carrega (model_compiled.npz na 'numpy', inclusive
+    # a variante compacta) com o do limiar; mesmo formato do model_version do log da API
+    return artifact_fingerprint(model_artifact_path(engine), THRESHOLD_PATH)[:12]
+
+
+def refresh_scores(model, df, version, threshold=None, path=SCORE_TABLE_PATH, id_column=ID_COLUMN):
+    """
+    Atualiza a tabela de scores para a base `df` (uma linha por aluno).
+
+    So os alunos novos, com features alteradas ou pontuados por outra versao do
+    modelo passam pelo make_prediction, em uma unica passada vetorizada; quem
+    saiu da base e removido. Tudo em uma transacao: a API ve a tabela antiga ou
+    a nova, nunca uma mistura.
+    """
+    X, _, _ = select_features(df)
+    ids = df[id_column].astype(str).to_numpy()
+    hashes = input_hashes(X)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(SCHEMA)
+        current = {
+            student_id: (input_hash, row_version)
+            for student_id, input_hash, row_version in db.execute(
+                "SELECT student_id, input_hash, model_version FROM scores"
+            )
+        }
+        stale = np.array([current.get(i) != (int(h), version) for i, h in zip(ids, hashes)], dtype=bool)
+        removed = set(current) - set(ids)
+
+        rows = []
+        if stale.any():
+            prediction, probability = make_prediction(model, X[stale], threshold)
+            now = time.time()
+            rows = list(zip(
+                ids[stale].tolist(), probability[:, 1].tolist(), prediction.astype(int).tolist(),
+                [version] * int(stale.sum()), hashes[stale].tolist(), [now] * int(stale.sum())
+            ))
+        with db:
+            db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)", rows)
+            db.executemany("DELETE FROM scores WHERE student_id = ?", [(i,) for i in removed])
+    finally:
+        db.close()
+
+    summary = {'scored': len(rows), 'unchanged': int((~stale).sum()), 'removed': len(removed)}
+    print(f"Tabela de scores atualizada em {path}: {summary}")
+    return summary
+
+
+def build_score_table(engine=SERVED_ENGINE, years=None, path=SCORE_TABLE_PATH):
+    """
+    Pontua a base inteira com o modelo salvo (rodado apos cada treino e pelo job noturno).
+
+    Por padrao usa a engine padrao da API: com a variante compacta servida, os
+    scores, rotulos e a versao gravada sao os dela, nao os do model.joblib.
+    """
+    model = load_model(engine)
+    return refresh_scores(model, student_base(years), model_version(engine), load_threshold(), path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tabela de scores de risco pre-calculados por aluno.")
+    parser.add_argument('--engine', choices=ENGINES, default=SERVED_ENGINE)
+    parser.add_argument('--years', type=int, nargs='+', help="Anos da tabela longitudinal (padrao: todos)")
+    parser.add_argument('--output', default=SCORE_TABLE_PATH)
+    args = parser.parse_args()
+    build_score_table(args.engine, args.years, args.output)
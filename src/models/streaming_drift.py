@@ -0,0 +1,391 @@
+import os
+import json
+import glob
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import stats
+from src.data.preprocess import select_features, NUMERIC_FEATURES, CATEGORICAL_FEATURES
+from src.utils.paths import ARTIFACTS_DIR, PROCESSED_DATA_DIR
+
+REFERENCE_PROFILE_PATH = os.path.join(ARTIFACTS_DIR, 'drift_reference.json')
+DRIFT_STATE_PATH = os.path.join(PROCESSED_DATA_DIR, 'drift_state.json')
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Limiares usuais: PSI > 0.2 indica mudanca relevante; p-valor < 0.05 nos testes
+PSI_THRESHOLD = 0.2
+P_VALUE_THRESHOLD = 0.05
+
+# Evita log(0) no PSI quando um bin fica vazio
+EPSILON = 1e-4
+
+# Erro relativo dos quantis da janela atual (sketch com buckets logaritmicos)
+SKETCH_ALPHA = 0.01
+# Abaixo disso (em modulo) o valor conta como zero
+SKETCH_MIN_VALUE = 1e-9
+
+# Arquivos do log de previsoes: predictions.jsonl, predictions-w<pid>.jsonl (um por worker)
+# e os segmentos fechados pela rotacao (predictions-<data>-<pid>-<n>.jsonl)
+LOG_PATTERN = 'predictions*.jsonl'
+
+
+def build_reference_profile(X, bins=10):
+    """
+    Perfil de referencia a partir dos dados de treino (saida de preprocess_data).
+
+    Numericas: bordas nos quantis da referencia, contagem por bin e quantis.
+    Categoricas: contagem por categoria. Tudo que o monitor precisa para
+    comparar janelas sem voltar aos dados brutos.
+    """
+    profile = {'n': int(len(X)), 'numeric': {}, 'categorical': {}}
+    for col in [c for c in NUMERIC_FEATURES if c in X.columns]:
+        values = pd.to_numeric(X[col], errors='coerce').to_numpy(dtype=np.float64)
+        present = values[~np.isnan(values)]
+        if len(present):
+            edges = np.unique(np.quantile(present, np.linspace(0, 1, bins + 1)[1:-1]))
+            quantiles = dict(zip(map(str, QUANTILES), np.quantile(present, QUANTILES).tolist()))
+        else:
+            edges, quantiles = np.array([]), {}
+        counts = np.bincount(np.searchsorted(edges, present, side='right'), minlength=len(edges) + 1)
+        profile['numeric'][col] = {
+            'edges': edges.tolist(),
+            'counts': counts.tolist(),
+            'missing': int(np.isnan(values).sum()),
+            'quantiles': quantiles,
+        }
+    for col in [c for c in CATEGORICAL_FEATURES if c in X.columns]:
+        values = X[col]
+        profile['categorical'][col] = {
+            'counts': {str(k): int(v) for k, v in values.dropna().astype(str).value_counts().items()},
+            'missing': int(values.isna().sum()),
+        }
+    return profile
+
+
+def save_reference_profile(X, path=REFERENCE_PROFILE_PATH, bins=10):
+    profile = build_reference_profile(X, bins)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False)
+    print(f"Perfil de referencia de drift salvo em {path}.")
+    return profile
+
+
+def load_reference_profile(path=REFERENCE_PROFILE_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Perfil de referencia nao encontrado: {path}")
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def reference_hash(reference):
+    """
+    Hash do perfil de referencia: o estado salvo so vale para as bordas do perfil que o gerou.
+    """
+    payload = json.dumps(reference, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def file_id(path):
+    # Identidade do arquivo (dispositivo:inode): sobrevive ao rename da rotacao
+    stat = os.stat(path)
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+class QuantileSketch:
+    """
+    Sketch de quantis com erro relativo limitado (no estilo do DDSketch).
+
+    Cada valor cai no bucket ceil(log_gamma(|x|)), com gamma = (1 + alpha) / (1 - alpha),
+    e o quantil devolvido fica a no maximo alpha (relativo) do quantil exato. A memoria
+    depende so da faixa dos valores, nao do volume, e o estado e a contagem por bucket.
+    """
+
+    def __init__(self, alpha=SKETCH_ALPHA, counts=None):
+        self.alpha = alpha
+        self.log_gamma = np.log((1 + alpha) / (1 - alpha))
+        # Chaves: 'z' (zero), 'p<k>' (positivos) e 'n<k>' (negativos)
+        self.counts = dict(counts or {})
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        nonzero = np.abs(values) >= SKETCH_MIN_VALUE
+        if not nonzero.all():
+            self.counts['z'] = self.counts.get('z', 0) + int((~nonzero).sum())
+        values = values[nonzero]
+        buckets = np.stack([np.sign(values), np.ceil(np.log(np.abs(values)) / self.log_gamma)], axis=1)
+        for (sign, index), count in zip(*np.unique(buckets.astype(np.int64), axis=0, return_counts=True)):
+            key = f"{'p' if sign > 0 else 'n'}{index}"
+            self.counts[key] = self.counts.get(key, 0) + int(count)
+
+    def value(self, key):
+        # Ponto do bucket com o mesmo erro relativo para os dois extremos
+        if key == 'z':
+            return 0.0
+        gamma = np.exp(self.log_gamma)
+        magnitude = 2 * gamma ** int(key[1:]) / (gamma + 1)
+        return float(magnitude if key[0] == 'p' else -magnitude)
+
+    def quantiles(self, qs=QUANTILES):
+        total = sum(self.counts.values())
+        if not total:
+            return {}
+        values = sorted((self.value(k), c) for k, c in self.counts.items())
+        cumulative = np.cumsum([c for _, c in values])
+        return {str(q): values[int(np.searchsorted(cumulative, q * (total - 1), side='right'))][0] for q in qs}
+
+
+def psi(ref_counts, cur_counts):
+    ref = np.maximum(np.asarray(ref_counts, dtype=np.float64) / max(sum(ref_counts), 1), EPSILON)
+    cur = np.maximum(np.asarray(cur_counts, dtype=np.float64) / max(sum(cur_counts), 1), EPSILON)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+
+def binned_ks(ref_counts, cur_counts):
+    """
+    KS de duas amostras sobre os histogramas: maior distancia entre as CDFs
+    nas bordas dos bins, com p-valor pela distribuicao assintotica.
+    """
+    n, m = sum(ref_counts), sum(cur_counts)
+    if n == 0 or m == 0:
+        return 0.0, 1.0
+    d = float(np.max(np.abs(np.cumsum(ref_counts) / n - np.cumsum(cur_counts) / m)))
+    en = np.sqrt(n * m / (n + m))
+    return d, float(stats.kstwobign.sf(d * en))
+
+
+def chi_square(ref_counts, cur_counts):
+    """
+    Qui-quadrado de homogeneidade (referencia x janela atual) por categoria.
+    """
+    categories = sorted(set(ref_counts) | set(cur_counts))
+    table = np.array([
+        [ref_counts.get(c, 0) for c in categories],
+        [cur_counts.get(c, 0) for c in categories],
+    ])
+    table = table[:, table.sum(axis=0) > 0]
+    if table.shape[1] < 2 or table[1].sum() == 0 or table[0].sum() == 0:
+        return 0.0, 1.0
+    statistic, p_value, _, _ = stats.chi2_contingency(table)
+    return float(statistic), float(p_value)
+
+
+class DriftMonitor:
+    """
+    Estatisticas incrementais da janela atual comparadas ao perfil de referencia.
+
+    Cada observacao so incrementa contadores (bins numericos, categorias e o
+    sketch de quantis das numericas), de modo que cada verificacao custa O(bins)
+    e nao depende do volume de dados.
+
+    Previsoes servidas do cache (cached=True no log) nao entram na janela: o
+    aluno ja foi contado quando foi pontuado, e um painel que reconsulta os
+    mesmos alunos dominaria PSI, KS e qui-quadrado.
+
+    Um estado salvo com outro perfil de referencia (o treino regrava o perfil)
+    tem contadores em outras bordas: a janela recomeca, mantendo a posicao no log.
+    """
+
+    def __init__(self, reference, state=None):
+        self.reference = reference
+        self.reference_hash = reference_hash(reference)
+        self.edges = {col: np.asarray(p['edges']) for col, p in reference['numeric'].items()}
+        if state is not None and state.get('reference_hash') != self.reference_hash:
+            print("Warning: estado de drift gerado com outro perfil de referencia; iniciando nova janela.")
+            self.log_offsets = dict(state.get('log_offsets', {}))
+            state = None
+        if state is None:
+            self.reset()
+        else:
+            self.n = state['n']
+            self.skipped_cached = state.get('skipped_cached', 0)
+            self.log_offsets = dict(state['log_offsets'])
+            self.numeric = {col: np.asarray(c['counts'], dtype=np.int64) for col, c in state['numeric'].items()}
+            self.numeric_missing = {col: c['missing'] for col, c in state['numeric'].items()}
+            self.sketches = {col: QuantileSketch(counts=c.get('sketch')) for col, c in state['numeric'].items()}
+            self.categorical = {col: dict(c['counts']) for col, c in state['categorical'].items()}
+            self.categorical_missing = {col: c['missing'] for col, c in state['categorical'].items()}
+
+    def reset(self):
+        """
+        Inicia uma nova janela (mantem a posicao ja lida do log).
+        """
+        self.n = 0
+        self.skipped_cached = 0
+        self.log_offsets = getattr(self, 'log_offsets', {})
+        self.numeric = {col: np.zeros(len(e) + 1, dtype=np.int64) for col, e in self.edges.items()}
+        self.numeric_missing = {col: 0 for col in self.edges}
+        self.sketches = {col: QuantileSketch() for col in self.edges}
+        self.categorical = {col: {} for col in self.reference['categorical']}
+        self.categorical_missing = {col: 0 for col in self.reference['categorical']}
+
+    def observe(self, df):
+        """
+        Atualiza a janela com um DataFrame no formato do dataset bruto.
+        """
+        X, _, _ = select_features(df)
+        self.n += len(X)
+        for col, edges in self.edges.items():
+            if col not in X.columns:
+                continue
+            values = X[col].to_numpy(dtype=np.float64)
+            missing = np.isnan(values)
+            self.numeric_missing[col] += int(missing.sum())
+            bins = np.searchsorted(edges, values[~missing], side='right')
+            self.numeric[col] += np.bincount(bins, minlength=len(edges) + 1)
+            self.sketches[col].add(values[~missing])
+        for col, counts in self.categorical.items():
+            if col not in X.columns:
+                continue
+            values = X[col]
+            self.categorical_missing[col] += int(values.isna().sum())
+            for category, count in values.dropna().astype(str).value_counts().items():
+                counts[category] = counts.get(category, 0) + int(count)
+
+    def observe_records(self, records):
+        """
+        Atualiza a janela com registros do log de previsoes, sem os servidos do cache.
+        """
+        rows = []
+        for record in records:
+            if record.get('cached'):
+                self.skipped_cached += 1
+                continue
+            rows.append(record.get('features', record))
+        if rows:
+            self.observe(pd.DataFrame(rows))
+
+    def log_files(self, log_path):
+        """
+        Arquivos a ler: todos os do LOG_PATTERN se log_path e um diretorio; senao o
+        arquivo e os segmentos rotacionados dele (mesmo inode, outro nome).
+        """
+        if os.path.isdir(log_path):
+            paths = glob.glob(os.path.join(log_path, LOG_PATTERN))
+        else:
+            directory = os.path.dirname(log_path) or '.'
+            rotated = [p for p in glob.glob(os.path.join(directory, LOG_PATTERN))
+                       if p != log_path and file_id(p) in self.log_offsets]
+            paths = rotated + ([log_path] if os.path.exists(log_path) else [])
+        # Mais antigos primeiro: o fim de um arquivo rotacionado antes do arquivo novo
+        return sorted(paths, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0.0)
+
+    def follow_log(self, log_path, batch_size=10000):
+        """
+        Le apenas as linhas novas do log JSONL de previsoes desde a ultima chamada.
+
+        log_path pode ser o diretorio do log (arquivos de todos os workers) ou um
+        arquivo. A posicao e guardada por inode, entao as linhas gravadas antes de
+        uma rotacao sao lidas no segmento renomeado, e um arquivo novo comeca do zero.
+        """
+        read = 0
+        seen = {}
+        for path in self.log_files(log_path):
+            try:
+                key = file_id(path)
+            except FileNotFoundError:
+                continue
+            offset = self.log_offsets.get(key, 0)
+            if os.path.getsize(path) < offset:
+                # Truncado (ou inode reaproveitado): recomeca do inicio
+                offset = 0
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                records = []
+                for line in f:
+                    # Linha ainda sendo escrita: fica para a proxima leitura
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+                    if line.strip():
+                        records.append(json.loads(line))
+                    if len(records) >= batch_size:
+                        self.observe_records(records)
+                        read += len(records)
+                        records = []
+                self.observe_records(records)
+                read += len(records)
+            seen[key] = offset
+        # Arquivos que sumiram (segmentos apagados) saem do estado
+        self.log_offsets = seen
+        return read
+
+    def report(self, psi_threshold=PSI_THRESHOLD, p_threshold=P_VALUE_THRESHOLD):
+        features = {}
+        for col, ref in self.reference['numeric'].items():
+            cur_counts = self.numeric[col].tolist()
+            value = psi(ref['counts'], cur_counts)
+            ks_stat, ks_p = binned_ks(ref['counts'], cur_counts)
+            features[col] = {
+                'type': 'numeric',
+                'psi': value,
+                'ks_statistic': ks_stat,
+                'ks_p_value': ks_p,
+                'missing_rate': self.numeric_missing[col] / self.n if self.n else 0.0,
+                'reference_quantiles': ref['quantiles'],
+                'quantiles': self.sketches[col].quantiles(),
+                'drift': bool(self.n) and (value > psi_threshold or ks_p < p_threshold),
+            }
+        for col, ref in self.reference['categorical'].items():
+            categories = sorted(set(ref['counts']) | set(self.categorical[col]))
+            value = psi([ref['counts'].get(c, 0) for c in categories],
+                        [self.categorical[col].get(c, 0) for c in categories])
+            chi2_stat, chi2_p = chi_square(ref['counts'], self.categorical[col])
+            features[col] = {
+                'type': 'categorical',
+                'psi': value,
+                'chi2_statistic': chi2_stat,
+                'chi2_p_value': chi2_p,
+                'missing_rate': self.categorical_missing[col] / self.n if self.n else 0.0,
+                'drift': bool(self.n) and (value > psi_threshold or chi2_p < p_threshold),
+            }
+        return {
+            'reference_size': self.reference['n'],
+            'current_size': self.n,
+            'skipped_cached': self.skipped_cached,
+            'drifted_features': [col for col, f in features.items() if f['drift']],
+            'features': features,
+        }
+
+    def state(self):
+        return {
+            'reference_hash': self.reference_hash,
+            'n': self.n,
+            'skipped_cached': self.skipped_cached,
+            'log_offsets': self.log_offsets,
+            'numeric': {col: {'counts': c.tolist(), 'missing': self.numeric_missing[col],
+                              'sketch': self.sketches[col].counts}
+                        for col, c in self.numeric.items()},
+            'categorical': {col: {'counts': c, 'missing': self.categorical_missing[col]}
+                            for col, c in self.categorical.items()},
+        }
+
+    def save_state(self, path=DRIFT_STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.state(), f, ensure_ascii=False)
+
+
+def load_monitor(reference_path=REFERENCE_PROFILE_PATH, state_path=DRIFT_STATE_PATH):
+    reference = load_reference_profile(reference_path)
+    state = None
+    if state_path and os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    return DriftMonitor(reference, state)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificacao incremental de drift sobre o log de previsoes.")
+    parser.add_argument('--log', required=True, help="Diretorio do log de previsoes (todos os workers) ou um arquivo JSONL")
+    parser.add_argument('--reset', action='store_true', help="Inicia uma nova janela antes de ler o log")
+    args = parser.parse_args()
+
+    monitor = load_monitor()
+    if args.reset:
+        monitor.reset()
+    new_rows = monitor.follow_log(args.log)
+    monitor.save_state()
+    print(f"{new_rows} novas linhas lidas.")
+    print(json.dumps(monitor.report(), ensure_ascii=False, indent=2))
@@ -0,0 +1,94 @@
+import os
+import json
+import numpy as np
+from src.utils.paths import ARTIFACTS_DIR
+
+# Sidecar do model.joblib com o ponto de operacao escolhido no treino
+THRESHOLD_PATH = os.path.join(ARTIFACTS_DIR, 'model_threshold.json')
+
+# Recall minimo da classe de risco: deixar de sinalizar um aluno defasado custa mais que um alerta a mais
+MIN_RECALL = 0.95
+
+# Corte usado quando nenhum limiar atinge o recall minimo (ex.: folds sem alunos em risco)
+DEFAULT_THRESHOLD = 0.5
+
+
+def precision_recall_table(y_true, scores):
+    """
+    Precisao, recall e taxa de alunos sinalizados para cada limiar distinto,
+    em uma unica passada sobre os scores ordenados (decrescente).
+
+    O limiar t sinaliza quem tem score >= t; empates entram juntos.
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(scores, kind='mergesort')[::-1]
+    scores, y_sorted = scores[order], y_true[order]
+
+    tp = np.cumsum(y_sorted)
+    fp = np.cumsum(1 - y_sorted)
+    # Ultima posicao de cada valor distinto de score
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp, fp = tp[last], fp[last]
+    positives = max(int(y_true.sum()), 1)
+
+    return {
+        'threshold': scores[last],
+        'precision': tp / (tp + fp),
+        'recall': tp / positives,
+        'flagged_rate': (tp + fp) / len(scores),
+    }
+
+
+def choose_threshold(table, min_recall=MIN_RECALL):
+    """
+    Maior precisao com recall >= min_recall; em empate, o maior limiar (menos alertas).
+
+    Sem limiar elegivel, volta para DEFAULT_THRESHOLD, com as metricas de quem
+    tem score >= DEFAULT_THRESHOLD.
+    """
+    eligible = np.flatnonzero(table['recall'] >= min_recall)
+    if len(eligible):
+        # Limiares estao em ordem decrescente: argmax devolve o maior entre os empatados
+        best = eligible[np.argmax(table['precision'][eligible])]
+        threshold = float(table['threshold'][best])
+    else:
+        print(f"Warning: nenhum limiar atinge recall >= {min_recall}; usando o corte padrao {DEFAULT_THRESHOLD}.")
+        # Menor limiar >= corte: o mesmo conjunto de alunos que o corte sinaliza
+        flagged = np.flatnonzero(table['threshold'] >= DEFAULT_THRESHOLD)
+        best = flagged[-1] if len(flagged) else None
+        threshold = DEFAULT_THRESHOLD
+
+    point = {'threshold': threshold}
+    for name in ('precision', 'recall', 'flagged_rate'):
+        point[name] = float(table[name][best]) if best is not None else 0.0
+    point['min_recall'] = float(min_recall)
+    return point
+
+
+def save_threshold(operating_point, path=THRESHOLD_PATH):
+    # Escrita atomica: a API pode ler o sidecar durante um reload
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(operating_point, f, indent=2)
+    os.replace(tmp_path, path)
+    print(f"Limiar de decisao {operating_point['threshold']:.4f} salvo em {path}.")
+
+
+def load_threshold(path=THRESHOLD_PATH):
+    """
+    Limiar salvo no treino, ou None (criterio padrao do RandomForest) se nao houver sidecar.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return float(json.load(f)['threshold'])
+
+
+def is_risk(probability, threshold=None):
+    """
+    P(risco) -> classe de risco. Sem limiar, P > 0.5 (o mesmo que o argmax do model.predict).
+    """
+    if threshold is None:
+        return probability > 0.5
+    return probability >= threshold
@@ -1,28 +1,135 @@
 import os
+import time
+import shutil
+import tempfile
 import joblib
 import pandas as pd
 import numpy as np
 import mlflow
 import mlflow.sklearn
 from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (habilita HalvingRandomSearchCV)
+from sklearn.model_selection import HalvingRandomSearchCV
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, accuracy_score, recall_score, f1_score
+from sklearn.metrics import classification_report, accuracy_score, recall_score, precision_score, f1_score
 from sklearn.pipeline import Pipeline
 
 from src.data.load_data import load_raw_data
-from src.data.preprocess import preprocess_data, build_preprocessing_pipeline
+from src.data.ingest import ingest_workbook, load_longitudinal
+from src.data.preprocess import preprocess_data, build_preprocessing_pipeline, REQUIRED_COLUMNS
+from src.models.compiled_model import export_compiled_model, save_compiled_arrays
+from src.models.compact_model import compaction_report, format_report, save_report
+from src.models.evaluate_model import evaluate_model
+from src.models.predict_model import make_prediction
+from src.models.threshold import save_threshold, MIN_RECALL
+from src.models.streaming_drift import save_reference_profile
+from src.models.score_table import build_score_table
 from src.utils.paths import ARTIFACTS_DIR
 
 MODEL_PATH = os.path.join(ARTIFACTS_DIR, 'model.joblib')
 
-def train_model():
+SEARCH_STRATEGIES = ('random', 'halving')
+
+# Espaco de busca do modo 'halving': mais amplo, ja que configuracoes ruins
+# sao descartadas com poucas arvores. n_estimators e o recurso, nao um parametro.
+HALVING_PARAM_DIST = {
+    'classifier__max_depth': [None, 5, 10, 15, 20, 30],
+    'classifier__min_samples_split': [2, 5, 10, 20],
+    'classifier__min_samples_leaf': [1, 2, 4, 8],
+    'classifier__max_features': ['sqrt', 'log2', None],
+    'classifier__bootstrap': [True, False]
+}
+
+def build_search(clf, strategy, param_dist):
+    """
+    Cria o objeto de busca de hiperparametros para a estrategia escolhida.
+
+    'random': RandomizedSearchCV (10 candidatos com orcamento completo).
+    'halving': successive halving com n_estimators como recurso: 45
+    candidatos comecam com 20 arvores e so o melhor terco avanca a cada
+    rodada (20 -> 60 -> 180).
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Estrategia invalida: {strategy}. Opcoes: {SEARCH_STRATEGIES}")
+
+    if strategy == 'halving':
+        return HalvingRandomSearchCV(
+            clf,
+            param_distributions=HALVING_PARAM_DIST,
+            n_candidates=45,
+            resource='classifier__n_estimators',
+            min_resources=20,
+            max_resources=180,
+            factor=3,
+            cv=3,
+            verbose=1,
+            random_state=42,
+            n_jobs=-1,
+            scoring='recall'
+        )
+
+    return RandomizedSearchCV(
+        clf, 
+        param_distributions=param_dist, 
+        n_iter=10, 
+        cv=3, 
+        verbose=1, 
+        random_state=42, 
+        n_jobs=-1,
+        scoring='recall' 
+    )
+
+def save_model(model, path=MODEL_PATH):
+    """
+    Grava o Pipeline em arquivo temporario no mesmo diretorio e renomeia.
+
+    Workers da API mantem o model.joblib aberto com mmap_mode='r' e o watcher
+    recarrega pelo mtime: reescrever o arquivo no lugar pode entregar a eles um
+    pickle pela metade (ou SIGBUS nas paginas mapeadas).
+    """
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def time_to_best(cv_results, best_index, n_splits=3):
+    """
+    Tempo de computo (fit + score de todos os folds) acumulado ate o melhor
+    candidato ser avaliado, na ordem do cv_results_.
+    """
+    per_candidate = (np.asarray(cv_results['mean_fit_time']) + np.asarray(cv_results['mean_score_time'])) * n_splits
+    return float(np.sum(per_candidate[:best_index + 1]))
+
+def refresh_score_table():
+    # O modelo ja esta salvo: falha aqui nao desfaz o treino, a tabela fica para o job noturno
+    try:
+        build_score_table()
+    except Exception as e:
+        print(f"Warning: tabela de scores nao atualizada: {e}")
+
+def train_model(search_strategy='random', min_recall=MIN_RECALL, years=None, compact=False, compaction=False):
     """
     Treino de modelo com tuning de hiperparametros.
+
+    Com `years`, treina nas particoes desses anos da tabela longitudinal
+    (todas as abas PEDE<ano>) em vez de so na primeira aba da planilha.
+
+    Com `compact`, a engine 'numpy' passa a servir a menor variante compacta
+    da floresta que mantem o recall do teste (ver compact_model). O relatorio
+    de compactacao (variantes medidas uma a uma) so roda com `compact` ou
+    `compaction`.
+
+    O limiar de decisao (maior precisao com recall >= min_recall nas previsoes
+    out-of-fold) e salvo ao lado do modelo e usado pela API no lugar de 0.5.
     """
     # 1. Carregar dados
     print("Carregando dados...")
     try:
-        df = load_raw_data()
+        if years:
+            ingest_workbook()
+            df = load_longitudinal(years)
+        else:
+            df = load_raw_data(columns=REQUIRED_COLUMNS)
     except FileNotFoundError:
         print("Arquivo de dados nao encontrado. Por favor verifique o path 'data/raw/'")
         return
@@ -38,16 +145,19 @@ def train_model():
     # Modelo de base
     rf = RandomForestClassifier(random_state=42)
     
+    # O ColumnTransformer ajustado em cada fold fica em cache no disco: os
+    # candidatos so reajustam o classificador
+    cache_dir = tempfile.mkdtemp(prefix='pipeline_cache_')
     clf = Pipeline(steps=[
         ('preprocessor', preprocessor),
         ('classifier', rf)
-    ])
+    ], memory=cache_dir)
     
     # 4. Separacao de dados de treino e teste
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     # 5. Tuning de Hypertparametros
-    print(" Realizando Tuning de hyperparametro (RandomizedSearchCV)...")
+    print(f" Realizando Tuning de hyperparametro ({search_strategy})...")
     
     # Define hyperparameter grid
     param_dist = {
@@ -59,54 +169,106 @@ def train_model():
     }
     
     with mlflow.start_run():
-        # RandomizedSearchCV
-        random_search = RandomizedSearchCV(
-            clf, 
-            param_distributions=param_dist, 
-            n_iter=10, 
-            cv=3, 
-            verbose=1, 
-            random_state=42, 
-            n_jobs=-1,
-            scoring='recall' 
-        )
+        search = build_search(clf, search_strategy, param_dist)
         
-        random_search.fit(X_train, y_train)
+        started = time.perf_counter()
+        try:
+            search.fit(X_train, y_train)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        search_seconds = time.perf_counter() - started
         
-        print(f"Best Parameters: {random_search.best_params_}")
-        print(f"Best CV Score: {random_search.best_score_:.4f}")
+        print(f"Best Parameters: {search.best_params_}")
+        print(f"Best CV Score: {search.best_score_:.4f}")
         
         # Log Melhores parametros
-        mlflow.log_params(random_search.best_params_)
-        mlflow.log_metric("best_cv_score", random_search.best_score_)
+        mlflow.log_params(search.best_params_)
+        mlflow.log_metric("best_cv_score", search.best_score_)
+        
+        # Estrategia de busca e custo para chegar ao melhor candidato
+        mlflow.log_param("search_strategy", search_strategy)
+        mlflow.log_param("training_years", ",".join(map(str, years)) if years else "PEDE2022")
+        mlflow.log_metric("search_seconds", search_seconds)
+        mlflow.log_metric("time_to_best_seconds", time_to_best(search.cv_results_, search.best_index_))
+        mlflow.log_metric("n_candidates", len(search.cv_results_['params']))
         
-        best_model = random_search.best_estimator_
+        # O cache era so para a busca; o modelo salvo nao aponta para ele
+        best_model = search.best_estimator_
+        if isinstance(best_model, Pipeline):
+            best_model.set_params(memory=None)
         
+        # Relatorio por validacao cruzada no treino (folds em paralelo, previsoes
+        # out-of-fold em cache): recall por limiar, calibracao e recall por grupo
+        print("Avaliacao por validacao cruzada...")
+        report = evaluate_model(best_model, X_train, y_train, min_recall=min_recall)
+        threshold = report['operating_point']['threshold']
+
         # 6. Evaluate
-        print("Indicadores melhor modelo...")
-        y_pred = best_model.predict(X_test)
+        # Rotulos com o limiar servido pela API, nao com o corte de 0.5 do model.predict
+        print(f"Indicadores melhor modelo (limiar {threshold:.4f})...")
+        y_pred, _ = make_prediction(best_model, X_test, threshold)
         
         acc = accuracy_score(y_test, y_pred)
-        rec = recall_score(y_test, y_pred, average='binary')
-        f1 = f1_score(y_test, y_pred, average='binary')
+        rec = recall_score(y_test, y_pred, average='binary', zero_division=0)
+        prec = precision_score(y_test, y_pred, average='binary', zero_division=0)
+        f1 = f1_score(y_test, y_pred, average='binary', zero_division=0)
 
-        print(classification_report(y_test, y_pred))
+        print(classification_report(y_test, y_pred, zero_division=0))
         print(f"Test Accuracy: {acc:.4f}")
         print(f"Test Recall: {rec:.4f}")
+        print(f"Test Precision: {prec:.4f}")
         print(f"Test F1-Score: {f1:.4f}")
         
         # Log Metrics
         mlflow.log_metric("test_accuracy", acc)
         mlflow.log_metric("test_recall", rec)
+        mlflow.log_metric("test_precision", prec)
         mlflow.log_metric("test_f1_score", f1)
+        mlflow.log_metric("decision_threshold", threshold)
         
         # 7. Save
+        # Sidecar antes do modelo: quando a API ve o artefato novo, o limiar dele ja esta no disco
+        save_threshold(report['operating_point'])
         print(f"Saving best model to {MODEL_PATH}...")
-        joblib.dump(best_model, MODEL_PATH)
+        save_model(best_model)
         print("Model saved.")
+
+        if compact or compaction:
+            # Variantes compactas (menos arvores pelo OOB, profundidade limitada, float32):
+            # tamanho, carga e latencia x recall/F1 no teste, no limiar escolhido
+            variants, compact_arrays = compaction_report(
+                best_model, X_train, y_train, X_test, y_test, threshold
+            )
+            print(format_report(variants))
+            save_report(variants)
+            mlflow.log_dict(variants, 'compaction_report.json')
+
+        # Versao compilada (arrays NumPy) usada pela engine 'numpy', gravada uma unica vez:
+        # a API observando o .npz troca direto para a variante final
+        if compact:
+            print(f"Servindo a variante compacta {variants['selected']}.")
+            save_compiled_arrays(compact_arrays)
+        else:
+            export_compiled_model(best_model)
+
+        # Perfil de referencia (dados de treino) para o monitor de drift incremental
+        save_reference_profile(X_train)
+
+        # Scores da base com o modelo novo (GET /students/{id}/risk)
+        refresh_score_table()
         
         # Log Model
         mlflow.sklearn.log_model(best_model, "random_forest_model")
 
 if __name__ == "__main__":
-    train_model()
+    import argparse
+    parser = argparse.ArgumentParser(description="Treino do modelo de risco de defasagem.")
+    parser.add_argument('--search', choices=SEARCH_STRATEGIES, default='random')
+    parser.add_argument('--min-recall', type=float, default=MIN_RECALL, help="Recall minimo do ponto de operacao")
+    parser.add_argument('--years', type=int, nargs='+', help="Anos da tabela longitudinal (padrao: so a aba PEDE2022)")
+    parser.add_argument('--compact', action='store_true',
+                        help="Exporta para a engine numpy a menor variante dentro da tolerancia de recall")
+    parser.add_argument('--compaction-report', action='store_true',
+                        help="Mede as variantes compactas (relatorio no MLflow) sem mudar o modelo servido")
+    args = parser.parse_args()
+    train_model(args.search, args.min_recall, args.years, args.compact, args.compaction_report)
@@ -0,0 +1,24 @@
+import os
+import hashlib
+
+def file_fingerprint(file_path, chunk_size=1 << 20):
+    """
+    Hash SHA-256 do conteudo de um arquivo (identifica a versao de um artefato).
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def artifact_fingerprint(file_path, *sidecar_paths):
+    """
+    Versao servida de um artefato: o fingerprint dele combinado com o dos
+    sidecars que existirem (ex.: o limiar de decisao). Trocar so o sidecar
+    muda a versao; sem sidecar e o proprio file_fingerprint.
+    """
+    fingerprint = file_fingerprint(file_path)
+    sidecars = [file_fingerprint(path) for path in sidecar_paths if path and os.path.exists(path)]
+    if not sidecars:
+        return fingerprint
+    return hashlib.sha256(''.join([fingerprint, *sidecars]).encode('ascii')).hexdigest()
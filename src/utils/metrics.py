@@ -0,0 +1,173 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Limites superiores (s) dos buckets de latencia, no formato do Prometheus
+LATENCY_BUCKETS_S = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Tempos por etapa da requisicao atual (dict mutavel, compartilhado com as threads que ela dispara)
+_request_timings = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """
+    Histograma de latencia com buckets fixos; observe() custa uma busca binaria.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_S):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self):
+        """
+        Pares (limite, contagem acumulada), incluindo '+Inf'.
+        """
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class _Stage:
+    # Classe em vez de @contextmanager: metade do custo por bloco medido
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.observe_stage(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Registro em memoria das metricas do processo: histogramas por etapa,
+    duracao das requisicoes e contadores de requisicoes/erros por rota.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.requests = {}
+        self.request_seconds = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.requests.clear()
+            self.request_seconds.clear()
+            self.errors.clear()
+
+    def _histogram(self, registry, key):
+        histogram = registry.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = registry.setdefault(key, Histogram())
+        return histogram
+
+    def observe_stage(self, stage, seconds):
+        self._histogram(self.stages, stage).observe(seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def stage(self, name):
+        """
+        Context manager que mede o bloco como a etapa `name`.
+        """
+        return _Stage(self, name)
+
+    def timed(self, name):
+        """
+        Decorator: mede cada chamada da funcao como a etapa `name`.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe_request(self, path, status, seconds):
+        key = (path, str(status))
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status >= 500:
+                self.errors[path] = self.errors.get(path, 0) + 1
+        self._histogram(self.request_seconds, path).observe(seconds)
+
+    def render(self, info=None, prefix='passos'):
+        """
+        Exposicao no formato texto do Prometheus. `info` vira a metrica <prefix>_model_info.
+        """
+        lines = []
+        if info is not None:
+            labels = ','.join(f'{k}="{v}"' for k, v in info.items())
+            lines += [f'# TYPE {prefix}_model_info gauge', f'{prefix}_model_info{{{labels}}} 1']
+
+        lines.append(f'# TYPE {prefix}_requests_total counter')
+        for (path, status), count in sorted(self.requests.items()):
+            lines.append(f'{prefix}_requests_total{{path="{path}",status="{status}"}} {count}')
+        lines.append(f'# TYPE {prefix}_errors_total counter')
+        for path, count in sorted(self.errors.items()):
+            lines.append(f'{prefix}_errors_total{{path="{path}"}} {count}')
+
+        for name, registry, label in (('request_seconds', self.request_seconds, 'path'),
+                                      ('stage_seconds', self.stages, 'stage')):
+            lines.append(f'# TYPE {prefix}_{name} histogram')
+            for key, histogram in sorted(registry.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{prefix}_{name}_bucket{{{label}="{key}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_{name}_sum{{{label}="{key}"}} {histogram.sum}')
+                lines.append(f'{prefix}_{name}_count{{{label}="{key}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def request_timings():
+    """
+    Coleta os tempos das etapas executadas dentro do bloco (inclusive em threads
+    do threadpool, que herdam o contexto) no dict retornado.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing(timings):
+    """
+    Valor do header Server-Timing (ms por etapa), lido pelo DevTools dos navegadores.
+    """
+    return ', '.join(f'{stage};dur={seconds * 1000.0:.3f}' for stage, seconds in timings.items())
+
+
+# Registro global do processo (API, CLI de pontuacao, treino)
+METRICS = Metrics()
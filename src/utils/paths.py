@@ -8,6 +8,7 @@ RAW_DATA_DIR = os.path.join(DATA_DIR, 'raw')
 PROCESSED_DATA_DIR = os.path.join(DATA_DIR, 'processed')
 MODELS_DIR = os.path.join(PROJECT_ROOT, 'models')
 ARTIFACTS_DIR = os.path.join(PROJECT_ROOT, 'models_artifacts')
+LOGS_DIR = os.path.join(PROJECT_ROOT, 'logs')
 if not os.path.exists(ARTIFACTS_DIR):
     os.makedirs(ARTIFACTS_DIR)
 
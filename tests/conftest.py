@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from benchmarks.synthetic import generate_students
+from src.data.preprocess import preprocess_data, build_preprocessing_pipeline
+
+
+@pytest.fixture(scope='session')
+def trained_forest():
+    """
+    Pipeline do treino (ColumnTransformer + RandomForest com 20 arvores) ajustado
+    nos 300 primeiros de 400 alunos sinteticos; os 100 restantes sao o teste.
+
+    Compartilhado pela sessao: os testes nao devem alterar o pipeline (use
+    sklearn.base.clone para um modelo nao ajustado com os mesmos parametros).
+    oob_score=True para que as mascaras OOB refeitas possam ser conferidas.
+    """
+    X, y, numeric_features, categorical_features = preprocess_data(generate_students(400, seed=31))
+    X_train, X_test, y_train, y_test = X.iloc[:300], X.iloc[300:], y.iloc[:300], y.iloc[300:]
+    pipeline = Pipeline(steps=[
+        ('preprocessor', build_preprocessing_pipeline(numeric_features, categorical_features)),
+        ('classifier', RandomForestClassifier(n_estimators=20, oob_score=True, random_state=42))
+    ]).fit(X_train, y_train)
+    return SimpleNamespace(
+        pipeline=pipeline,
+        X_train=X_train, y_train=y_train, X_test=X_test, y_test=y_test,
+        numeric_features=numeric_features, categorical_features=categorical_features,
+    )
@@ -1,16 +1,24 @@
+import os
+import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import numpy as np
-from api.app import app
+from api.app import app, ServedModel
 
 client = TestClient(app)
 
+@pytest.fixture
+def mock_model():
+    # Modelo falso servido pela API (limiar padrao, sem fingerprint)
+    model = MagicMock()
+    with patch('api.app.served', ServedModel(model)):
+        yield model
+
 def test_read_main():
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to Passos Mágicos Lag Prediction API"}
 
-@patch('api.app.model')
 def test_predict_endpoint_success(mock_model):
     # 1. Mock do modelo para retornar uma previsão fixa
     mock_model.predict.return_value = np.array([1])
@@ -39,4 +47,367 @@ def test_predict_endpoint_success(mock_model):
     assert response.status_code == 200
     data = response.json()
     assert "risk_of_lag" in data
-    assert "risk_probability" in data
\ No newline at end of file
+    assert "risk_probability" in data
+
+PAYLOAD = {
+    "idade_22": 15.0,
+    "genero": "Menino",
+    "instituicao_ensino": "Escola Pública",
+    "pedra_22": "Ametista",
+    "inde_22": 7.5,
+    "iaa": 8.0,
+    "ieg": 6.5,
+    "ips": 7.0,
+    "ida": 7.2,
+    "matem": 6.0,
+    "portug": 6.5,
+    "ingles": 8.0
+}
+
+def test_predict_batch_preserves_order(mock_model):
+    mock_model.predict_proba.return_value = np.array([[0.1, 0.9], [0.8, 0.2], [0.4, 0.6]])
+
+    response = client.post("/predict/batch", json={"students": [PAYLOAD] * 3})
+
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert [p["risk_of_lag"] for p in predictions] == [True, False, True]
+    assert predictions[1]["risk_probability"] == 0.2
+
+    # Um unico DataFrame com todos os alunos e nenhuma chamada ao predict
+    mock_model.predict_proba.assert_called_once()
+    assert len(mock_model.predict_proba.call_args[0][0]) == 3
+    mock_model.predict.assert_not_called()
+
+@patch('api.app.MAX_BATCH_SIZE', 2)
+def test_predict_batch_rejects_oversized(mock_model):
+    response = client.post("/predict/batch", json={"students": [PAYLOAD] * 3})
+
+    assert response.status_code == 413
+    mock_model.predict_proba.assert_not_called()
+
+def test_micro_batcher_groups_concurrent_requests():
+    import asyncio
+    from api.batching import MicroBatcher
+
+    calls = []
+
+    def score(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(score, max_wait_ms=50, max_batch_size=8)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        stats = batcher.stats()
+        await batcher.stop()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+
+    # Uma unica chamada ao modelo, cada chamador recebe o proprio resultado
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert results == [0, 10, 20, 30, 40]
+    assert stats["batches"] == 1
+    assert stats["batch_size_histogram"]["8"] == 1
+
+def test_micro_batcher_without_window_dispatches_immediately():
+    import asyncio
+    from api.batching import MicroBatcher
+
+    calls = []
+
+    def score(items):
+        calls.append(list(items))
+        return items
+
+    async def run():
+        batcher = MicroBatcher(score, max_batch_size=8)
+        await batcher.start()
+        assert await batcher.submit('sozinho') == 'sozinho'
+        # Concorrentes ainda sao agrupados: chegaram juntos na fila
+        await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        stats = batcher.stats()
+        await batcher.stop()
+        return stats
+
+    stats = asyncio.run(run())
+    assert calls == [['sozinho'], [0, 1, 2, 3, 4]]
+    assert stats["max_wait_ms"] == 0.0
+
+def test_prediction_cache_skips_model_on_repeat(mock_model):
+    from api.app import prediction_cache
+    prediction_cache.clear()
+    mock_model.predict_proba.return_value = np.array([[0.3, 0.7]])
+
+    # Mesmo aluno com espacos extras e casas decimais alem da precisao do dataset
+    repeated = dict(PAYLOAD, genero=" Menino ", inde_22=7.5000001)
+    with patch('api.app.served', ServedModel(mock_model, fingerprint='modelo-v1')):
+        first = client.post("/predict", json=PAYLOAD)
+        second = client.post("/predict", json=repeated)
+        stats = client.get("/predict/cache").json()
+
+    assert first.json() == second.json()
+    mock_model.predict_proba.assert_called_once()
+    assert stats["hits"] >= 1
+    assert stats["model_fingerprint"] == 'modelo-v1'
+
+    # A forma canonica so entra na chave: o modelo recebe os valores como enviados
+    with patch('api.app.served', ServedModel(mock_model, fingerprint='modelo-v2')):
+        client.post("/predict", json=repeated)
+    data = mock_model.predict_proba.call_args[0][0]
+    assert data['Gênero'][0] == " Menino "
+    assert data['INDE 22'][0] == 7.5000001
+
+def test_predict_uses_decision_threshold(mock_model):
+    mock_model.predict_proba.return_value = np.array([[0.1, 0.9]])
+
+    with patch('api.app.served', ServedModel(mock_model, threshold=0.95)):
+        data = client.post("/predict/batch", json={"students": [PAYLOAD]}).json()["predictions"][0]
+
+    # 0.9 passaria no corte padrao de 0.5, mas nao no limiar do treino
+    assert data["risk_probability"] == 0.9
+    assert data["risk_of_lag"] is False
+    mock_model.predict.assert_not_called()
+
+def test_swap_model_replaces_model_and_threshold_together(mock_model):
+    import api.app as app_module
+
+    previous = app_module.served
+    with patch('api.app.registry', MagicMock(threshold=0.95)):
+        app_module.swap_model(mock_model, 'modelo-v2')
+    # Uma unica atribuicao: quem leu `served` antes continua com modelo e limiar antigos
+    assert app_module.served == ServedModel(mock_model, 0.95, 'modelo-v2')
+    assert previous.threshold is None and previous.fingerprint is None
+
+def test_predict_explain_returns_contributions(mock_model):
+    mock_model.explain.return_value = (np.array([0.8]), 0.6, np.array([[0.05, -0.1, 0.25]]))
+    mock_model.explain_columns = ['IAA', 'IDA', 'Pedra 22']
+
+    data = client.post("/predict?explain=true", json=PAYLOAD).json()
+
+    assert data["risk_probability"] == 0.8
+    assert data["explanation"]["base_value"] == 0.6
+    # Ordenadas pelo impacto absoluto
+    assert list(data["explanation"]["contributions"]) == ['Pedra 22', 'IDA', 'IAA']
+    mock_model.predict_proba.assert_not_called()
+
+def test_predict_explain_errors_return_prediction_error(mock_model):
+    mock_model.explain.side_effect = ValueError("falha na arvore")
+
+    for url, payload in [("/predict?explain=true", PAYLOAD), ("/predict/batch?explain=true", {"students": [PAYLOAD]})]:
+        response = client.post(url, json=payload)
+        assert response.status_code == 500
+        assert response.json()["detail"] == "Prediction error: falha na arvore"
+
+    # Modelo sem explain continua respondendo 501
+    with patch('api.app.served', ServedModel(MagicMock(spec=['predict_proba']))):
+        assert client.post("/predict?explain=true", json=PAYLOAD).status_code == 501
+
+def test_student_risk_lookup_skips_model(mock_model, tmp_path):
+    import sqlite3
+    from api.score_store import ScoreStore
+
+    path = str(tmp_path / "scores.sqlite")
+    with patch('api.app.score_store', ScoreStore(path)):
+        # Tabela ainda nao gerada
+        assert client.get("/students/RA-1/risk").status_code == 503
+
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE scores (student_id TEXT PRIMARY KEY, risk_probability REAL, prediction INTEGER, "
+                       "model_version TEXT, input_hash INTEGER, scored_at REAL) WITHOUT ROWID")
+            db.execute("INSERT INTO scores VALUES ('RA-1', 0.7, 1, 'abc123', 42, 1700000000.0)")
+
+        data = client.get("/students/RA-1/risk").json()
+        assert data["risk_of_lag"] is True
+        assert data["risk_probability"] == 0.7
+        assert data["model_version"] == 'abc123'
+        assert data["current_model"] is False
+        assert client.get("/students/RA-999/risk").status_code == 404
+
+        # O rotulo e o gravado com o score, nao o limiar do modelo servido agora
+        with patch('api.app.served', ServedModel(mock_model, threshold=0.9, fingerprint='abc123')):
+            data = client.get("/students/RA-1/risk").json()
+        assert data["risk_of_lag"] is True and data["current_model"] is True
+    mock_model.predict_proba.assert_not_called()
+
+def test_prediction_cache_key_changes_with_model(tmp_path):
+    from api.prediction_cache import PredictionCache, cache_key
+
+    cache = PredictionCache(max_size=2, ttl_seconds=60, path=str(tmp_path / "cache.db"))
+    features = [15.0, "Menino", "Escola Pública"]
+    cache.set(cache_key(features, "v1"), 0.8)
+
+    # Outro processo (mesmo arquivo) enxerga a entrada; outro modelo nao
+    shared = PredictionCache(max_size=2, ttl_seconds=60, path=str(tmp_path / "cache.db"))
+    assert shared.get(cache_key(features, "v1")) == 0.8
+    assert shared.get(cache_key(features, "v2")) is None
+    assert shared.stats()["hits"] == 1 and shared.stats()["misses"] == 1
+
+def test_prediction_logger_flushes_and_drops(tmp_path):
+    import asyncio
+    import json
+    from api.prediction_logger import PredictionLogger, prediction_record
+
+    async def run():
+        logger = PredictionLogger(str(tmp_path), capacity=3, flush_size=100, flush_interval_s=60)
+        await logger.start()
+        for i in range(5):
+            logger.log(prediction_record({"IAA": i}, 0.5, "v1", 1.0))
+        # Nada foi gravado ainda: o shutdown grava o que sobrou no buffer
+        await logger.stop()
+        return logger.stats()
+
+    stats = asyncio.run(run())
+
+    lines = (tmp_path / "predictions.jsonl").read_text().splitlines()
+    # Buffer de 3: os dois registros mais antigos foram descartados
+    assert [json.loads(line)["features"]["IAA"] for line in lines] == [2, 3, 4]
+    assert stats["dropped"] == 2 and stats["written"] == 3
+
+    # Varias threads (handlers sync) com o buffer cheio: nenhum descarte se perde na contagem
+    from concurrent.futures import ThreadPoolExecutor
+    logger = PredictionLogger(str(tmp_path), capacity=10)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: logger.log({"i": i}), range(5000)))
+    assert logger.logged == 5000
+    assert logger.dropped == 5000 - len(logger._buffer) == 4990
+
+def test_model_registry_swaps_only_valid_new_artifacts(tmp_path):
+    import json
+    import joblib
+    import pandas as pd
+    from sklearn.dummy import DummyClassifier
+    from api.model_registry import ModelRegistry, WARMUP_ROWS
+
+    model_path = tmp_path / "model.joblib"
+    joblib.dump(DummyClassifier(strategy="prior").fit(pd.DataFrame(WARMUP_ROWS), [0, 1, 1]), model_path)
+    swaps = []
+    threshold_path = tmp_path / "model_threshold.json"
+    registry = ModelRegistry(str(model_path), on_swap=lambda m, f: swaps.append(f), threshold_path=str(threshold_path))
+
+    assert registry.reload() is True
+    # Mesmo artefato: nada a fazer
+    assert registry.reload() is False
+
+    # Novo artefato: carregado, aquecido e trocado
+    joblib.dump(DummyClassifier(strategy="prior").fit(pd.DataFrame(WARMUP_ROWS), [0, 0, 1]), model_path)
+    assert registry.reload() is True
+    assert len(swaps) == 2 and swaps[0] != swaps[1]
+
+    # Mesmo artefato com outro limiar (ex.: --min-recall diferente): nova versao
+    threshold_path.write_text(json.dumps({"threshold": 0.3}))
+    assert registry.reload() is True
+    assert registry.threshold == 0.3 and len(swaps) == 3 and swaps[2] != swaps[1]
+    assert registry.reload() is False
+
+    # Artefato corrompido nao substitui o modelo em uso
+    model_path.write_bytes(b"corrompido")
+    assert registry.reload() is False
+    assert registry.last_error is not None
+    assert registry.fingerprint == swaps[2]
+
+def test_api_import_stays_slim():
+    import subprocess
+    import sys
+
+    # Processo novo: o import da API nao pode puxar treino/monitoramento nem libs pesadas
+    code = (
+        "import sys, api.app; "
+        "print(','.join(m for m in ('mlflow', 'evidently', 'sklearn', 'pandas', 'pyarrow') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+@patch('api.app.METRICS_DEBUG_HEADER', True)
+def test_metrics_endpoint_and_timing_header(mock_model):
+    from src.utils.metrics import METRICS
+    METRICS.reset()
+    mock_model.predict_proba.return_value = np.array([[0.2, 0.8], [0.6, 0.4]])
+
+    response = client.post("/predict/batch", json={"students": [PAYLOAD, PAYLOAD]})
+    timing = response.headers["Server-Timing"]
+    for stage in ("validate", "frame", "model", "total"):
+        assert f"{stage};dur=" in timing
+
+    mock_model.predict_proba.side_effect = RuntimeError("falha")
+    assert client.post("/predict/batch", json={"students": [PAYLOAD]}).status_code == 500
+
+    body = client.get("/metrics").text
+    assert 'passos_requests_total{path="/predict/batch",status="200"} 1' in body
+    assert 'passos_errors_total{path="/predict/batch"} 1' in body
+    assert 'passos_stage_seconds_count{stage="model"} 2' in body
+    assert 'passos_stage_seconds_count{stage="validate"} 3' in body
+    assert 'passos_model_info{engine=' in body
+
+def test_worker_readiness_waits_for_all_live_workers(tmp_path):
+    import subprocess
+    import sys
+    from api.readiness import WorkerReadiness
+    from api.serve import available_cpus
+
+    readiness = WorkerReadiness(str(tmp_path), expected_workers=2)
+    readiness.mark_ready("abc")
+    assert readiness.status()["ready"] is False
+
+    # Marcador de um worker que ja morreu nao conta
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    readiness.mark_ready("abc", pid=dead.pid)
+    assert readiness.status()["ready_workers"] == 1
+
+    readiness.mark_ready("abc", pid=os.getppid())
+    status = readiness.status()
+    assert status["ready"] is True
+    assert status["model_fingerprints"] == ["abc"]
+
+    readiness.mark_stopped()
+    assert readiness.status()["ready"] is False
+    assert available_cpus() >= 1
+
+@patch('api.app.served', ServedModel())
+def test_ready_endpoint_requires_model():
+    assert client.get("/health").status_code == 200
+    assert client.get("/ready").status_code == 503
+
+def test_load_test_open_loop_step(mock_model):
+    import asyncio
+    import httpx
+    from benchmarks.load_test import run_step, arrival_times
+
+    mock_model.predict_proba.return_value = np.array([[0.1, 0.9]])
+    # Taxa constante: 40 req/s por 0.5s = 20 requisicoes agendadas
+    assert len(arrival_times(40, 0.5, 'constant')) == 20
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as load_client:
+            return await run_step(load_client, [PAYLOAD], rate=40, duration_s=0.5, arrival='constant')
+
+    step = asyncio.run(run())
+    assert step["sent"] == 20
+    assert step["errors"] == 0
+    assert step["p50_ms"] <= step["p95_ms"] <= step["p99_ms"]
+
+def test_load_test_replays_log_and_finds_saturation(tmp_path):
+    import json
+    from benchmarks.load_test import read_payloads, saturation_point
+    from api.app import StudentData
+
+    # Registro do log de previsoes (colunas do modelo) vira um payload valido
+    features = {col: values[0] for col, values in StudentData(**PAYLOAD).to_dict().items()}
+    log_path = tmp_path / "predictions.jsonl"
+    log_path.write_text(json.dumps({"features": features, "risk_probability": 0.9}) + "\n" + json.dumps(PAYLOAD) + "\n")
+    assert read_payloads([log_path]) == [PAYLOAD, PAYLOAD]
+
+    step = {"error_rate": 0.0, "p99_ms": 20.0}
+    steps = [
+        {**step, "offered_rps": 10.0, "throughput_rps": 10.0},
+        {**step, "offered_rps": 50.0, "throughput_rps": 49.0},
+        {**step, "offered_rps": 100.0, "throughput_rps": 70.0},
+    ]
+    assert saturation_point(steps) == 100.0
+    assert saturation_point(steps[:2]) is None
+    steps[1]["p99_ms"] = 500.0
+    assert saturation_point(steps, slo_p99_ms=200.0) == 50.0
@@ -4,9 +4,10 @@ import numpy as np
 import os
 from unittest.mock import patch
 from src.models.predict_model import make_prediction
-from src.data.preprocess import preprocess_data, build_preprocessing_pipeline
+from src.data.preprocess import preprocess_data, select_features, build_preprocessing_pipeline
 from src.models.train_model import train_model
 from src.models.monitor_drift import generate_drift_dashboard
+from src.models.compiled_model import compile_pipeline, CompiledModel, save_compiled_arrays, load_compiled_model
 from src.utils.paths import ARTIFACTS_DIR
 
 MODEL_PATH = os.path.join(ARTIFACTS_DIR, 'model.joblib')
@@ -42,12 +43,19 @@ def test_preprocess_data(sample_data):
 # Testa a função de construção do pipeline de pré-processamento
 
 # Testa a função de orquestração do treinamento simulando dependências pesadas
-@patch('src.models.train_model.joblib.dump')
+@patch('src.models.train_model.save_report')
+@patch('src.models.train_model.compaction_report', return_value=({'selected': 'baseline', 'variants': {}}, {}))
+@patch('src.models.train_model.build_score_table')
+@patch('src.models.train_model.save_threshold')
+@patch('src.models.train_model.evaluate_model')
+@patch('src.models.train_model.save_reference_profile')
+@patch('src.models.train_model.export_compiled_model')
+@patch('src.models.train_model.save_model')
 @patch('src.models.train_model.mlflow')
 @patch('src.models.train_model.RandomizedSearchCV')
 @patch('src.models.train_model.load_raw_data')
 
-def test_model_training_runs(mock_load_data, mock_random_search, mock_mlflow, mock_joblib_dump, sample_data):
+def test_model_training_runs(mock_load_data, mock_random_search, mock_mlflow, mock_save_model, mock_export, mock_reference, mock_evaluate, mock_threshold, mock_scores, mock_compaction, mock_save_report, sample_data):
     """
     Testa a orquestração do modelo (train_model).
     Usamos mocks para evitar que o teste carregue os dados reais do CSV, 
@@ -60,14 +68,21 @@ def test_model_training_runs(mock_load_data, mock_random_search, mock_mlflow, mo
     mock_search_instance = mock_random_search.return_value
     mock_search_instance.best_params_ = {'n_estimators': 100, 'max_depth': 10}
     mock_search_instance.best_score_ = 0.95
+    mock_search_instance.best_index_ = 0
+    mock_search_instance.cv_results_ = {
+        'params': [{'n_estimators': 100, 'max_depth': 10}],
+        'mean_fit_time': [0.5],
+        'mean_score_time': [0.1],
+    }
     
     # Criamos um "melhor modelo" de mentira que sabe fazer predições
     class DummyBestEstimator:
-        def predict(self, X):
-            # Retorna uma array de '1's do mesmo tamanho dos dados de teste
-            return np.ones(len(X)) 
+        def predict_proba(self, X):
+            # P(risco) = 0.45 para todos: abaixo do corte de 0.5, acima do limiar do treino
+            return np.tile([0.55, 0.45], (len(X), 1))
             
     mock_search_instance.best_estimator_ = DummyBestEstimator()
+    mock_evaluate.return_value = {'operating_point': {'threshold': 0.4}}
     
     # 3. Chama a sua função original (que não sabe que está sendo "enganada")
     train_model()
@@ -76,7 +91,417 @@ def test_model_training_runs(mock_load_data, mock_random_search, mock_mlflow, mo
     mock_load_data.assert_called_once()
     mock_random_search.assert_called_once()
     mock_search_instance.fit.assert_called_once()
-    mock_joblib_dump.assert_called_once()
+    mock_save_model.assert_called_once()
+    mock_export.assert_called_once()
+    mock_reference.assert_called_once()
+    mock_evaluate.assert_called_once()
+    mock_threshold.assert_called_once()
+    mock_scores.assert_called_once()
+    # Sem --compact/--compaction-report as variantes nao sao medidas
+    mock_compaction.assert_not_called()
+    # Metricas de teste com o limiar servido: todos os alunos sinalizados
+    mock_mlflow.log_metric.assert_any_call("decision_threshold", 0.4)
+    mock_mlflow.log_metric.assert_any_call("test_accuracy", 0.0)
+
+    # --compact: o .npz e gravado uma unica vez, ja com a variante escolhida
+    with patch('src.models.train_model.save_compiled_arrays') as mock_save_arrays:
+        train_model(compact=True)
+    mock_compaction.assert_called_once()
+    mock_save_arrays.assert_called_once()
+    mock_export.assert_called_once()
+
+# Testa as estrategias de busca: halving usa n_estimators como recurso (20 -> 60 -> 180)
+def test_build_search_strategies(trained_forest):
+    from sklearn.model_selection import HalvingRandomSearchCV, RandomizedSearchCV
+    from src.models.train_model import build_search, HALVING_PARAM_DIST
+
+    clf = trained_forest.pipeline
+    search = build_search(clf, 'halving', {'classifier__n_estimators': [50, 100]})
+    assert isinstance(search, HalvingRandomSearchCV) and search.estimator is clf
+    assert search.resource == 'classifier__n_estimators'
+    assert search.param_distributions == HALVING_PARAM_DIST
+    assert 'classifier__n_estimators' not in search.param_distributions
+    rounds = [search.min_resources * search.factor ** i for i in range(3)]
+    assert rounds == [20, 60, 180] and search.max_resources == rounds[-1]
+    assert search.n_candidates // search.factor ** 2 == 5
+
+    assert isinstance(build_search(clf, 'random', {}), RandomizedSearchCV)
+    with pytest.raises(ValueError):
+        build_search(clf, 'grid', {})
+
+# Testa se o cache do Pipeline some apos a busca (mesmo com erro) e nao vai para o modelo salvo
+@patch('src.models.train_model.save_report')
+@patch('src.models.train_model.compaction_report', return_value=({'selected': 'baseline', 'variants': {}}, {}))
+@patch('src.models.train_model.build_score_table')
+@patch('src.models.train_model.save_threshold')
+@patch('src.models.train_model.evaluate_model')
+@patch('src.models.train_model.save_reference_profile')
+@patch('src.models.train_model.export_compiled_model')
+@patch('src.models.train_model.save_model')
+@patch('src.models.train_model.mlflow')
+@patch('src.models.train_model.RandomizedSearchCV')
+@patch('src.models.train_model.load_raw_data')
+def test_training_drops_pipeline_cache(mock_load_data, mock_random_search, mock_mlflow, mock_save_model, mock_export, mock_reference, mock_evaluate, mock_threshold, mock_scores, mock_compaction, mock_save_report, sample_data):
+    from sklearn.dummy import DummyClassifier
+    from sklearn.pipeline import Pipeline
+
+    mock_load_data.return_value = sample_data
+    mock_evaluate.return_value = {'operating_point': {'threshold': 0.5}}
+    search = mock_random_search.return_value
+    search.best_params_, search.best_score_, search.best_index_ = {}, 0.9, 0
+    search.cv_results_ = {'params': [{}], 'mean_fit_time': [0.5], 'mean_score_time': [0.1]}
+
+    # Busca falha: o diretorio de cache e removido e o erro propaga
+    search.fit.side_effect = RuntimeError("falhou")
+    with pytest.raises(RuntimeError):
+        train_model()
+    failed_cache = mock_random_search.call_args.args[0].memory
+    assert failed_cache and not os.path.exists(failed_cache)
+
+    search.fit.side_effect = None
+    X, y, _, _ = preprocess_data(sample_data)
+    search.best_estimator_ = Pipeline([('classifier', DummyClassifier())], memory=failed_cache).fit(X, y)
+    train_model()
+    cache_dir = mock_random_search.call_args.args[0].memory
+    assert cache_dir != failed_cache and not os.path.exists(cache_dir)
+    saved = mock_save_model.call_args.args[0]
+    assert saved is search.best_estimator_ and saved.memory is None
+
+# Testa se a engine NumPy reproduz exatamente as probabilidades do Pipeline
+def test_compiled_model_matches_pipeline():
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.pipeline import Pipeline
+
+    rng = np.random.default_rng(0)
+    n = 200
+    df = pd.DataFrame({
+        'Defas': rng.integers(-2, 2, n).astype(float),
+        'Idade 22': rng.integers(7, 20, n),
+        'Gênero': rng.choice(['Menino', 'Menina'], n),
+        'Instituição de ensino': rng.choice(['Escola Pública', 'Rede Decisão'], n),
+        'Pedra 22': rng.choice(['Ametista', 'Ágata', 'Quartzo', 'Topázio'], n),
+        'INDE 22': rng.normal(7, 1, n),
+        'IAA': rng.normal(8, 1, n),
+        'IEG': rng.normal(7, 1, n),
+        'IPS': rng.normal(7, 1, n),
+        'IDA': rng.normal(6, 1, n),
+        'Matem': rng.normal(6, 2, n),
+        'Portug': rng.normal(6, 2, n),
+        'Inglês': rng.normal(6, 2, n),
+    })
+    X, y, num_cols, cat_cols = preprocess_data(df)
+    pipeline = Pipeline(steps=[
+        ('preprocessor', build_preprocessing_pipeline(num_cols, cat_cols)),
+        ('classifier', RandomForestClassifier(n_estimators=20, random_state=42))
+    ]).fit(X, y)
+
+    # Ausentes e categorias desconhecidas
+    X_test = X.copy()
+    X_test.iloc[:20, X_test.columns.get_loc('INDE 22')] = np.nan
+    X_test.iloc[20:40, X_test.columns.get_loc('Pedra 22')] = np.nan
+    X_test.iloc[40:60, X_test.columns.get_loc('Gênero')] = 'Outro'
+
+    compiled = CompiledModel(compile_pipeline(pipeline))
+
+    assert np.array_equal(compiled.predict_proba(X_test), pipeline.predict_proba(X_test))
+    assert np.array_equal(compiled.predict(X_test), pipeline.predict(X_test))
+
+# Testa se o FeatureEncoder reproduz o ColumnTransformer para DataFrame, dict e record array
+def test_feature_encoder_matches_preprocessor(trained_forest):
+    from benchmarks.synthetic import generate_students
+    from src.models.feature_encoder import EncodedPipeline
+
+    pipeline = trained_forest.pipeline
+    encoded = EncodedPipeline(pipeline)
+
+    rng = np.random.default_rng(0)
+    for seed in range(5):
+        X_test, _, _ = select_features(generate_students(50, seed=100 + seed))
+        # Ausentes e categorias desconhecidas em posicoes aleatorias
+        for col in X_test.columns:
+            X_test.loc[rng.random(50) < 0.1, col] = np.nan
+        X_test.loc[rng.random(50) < 0.1, 'Pedra 22'] = 'Diamante'
+        expected = pipeline.named_steps['preprocessor'].transform(X_test)
+
+        records = X_test.to_records(index=False)
+        columns = {col: X_test[col].tolist() for col in X_test.columns}
+        buffer = np.full(expected.shape, -1.0)
+        assert np.array_equal(encoded.encoder.transform(X_test), expected)
+        assert np.array_equal(encoded.encoder.transform(records), expected)
+        assert encoded.encoder.transform(columns, out=buffer) is buffer
+        assert np.array_equal(buffer, expected)
+        assert np.array_equal(encoded.predict_proba(columns), pipeline.predict_proba(X_test))
+
+# Testa o relatorio por validacao cruzada e o cache das previsoes out-of-fold
+def test_evaluation_report_reuses_cached_folds(trained_forest, tmp_path):
+    from sklearn.base import clone
+    from src.models.evaluate_model import out_of_fold_predictions, evaluation_report
+
+    X, y = trained_forest.X_train.iloc[:150], trained_forest.y_train.iloc[:150]
+    pipeline = clone(trained_forest.pipeline)
+
+    oof, fold = out_of_fold_predictions(pipeline, X, y, n_splits=3, n_repeats=2, n_jobs=2, cache_dir=str(tmp_path))
+    assert oof.shape == (2, 150)
+    assert not np.isnan(oof).any()
+    assert set(np.unique(fold)) == {0, 1, 2}
+
+    # Mesmo dataset e parametros: nada e reajustado
+    with patch('src.models.evaluate_model._fit_fold', side_effect=AssertionError("retreinou")):
+        cached, _ = out_of_fold_predictions(pipeline, X, y, n_splits=3, n_repeats=2, n_jobs=1, cache_dir=str(tmp_path))
+    assert np.array_equal(cached, oof)
+
+    report = evaluation_report(X, y, oof, fold)
+    assert report['n_repeats'] == 2 and report['n_splits'] == 3
+    assert 0.0 <= report['cv']['recall']['mean'] <= 1.0
+    # Recall nao aumenta com o limiar
+    recalls = [report['thresholds'][t]['recall'] for t in sorted(report['thresholds'], key=float)]
+    assert recalls == sorted(recalls, reverse=True)
+    assert set(report['groups']) == {'Instituição de ensino', 'Pedra 22'}
+    assert len(report['calibration']['prob_pred']) == len(report['calibration']['prob_true'])
+
+# Testa a tabela precisao/recall por limiar contra o sklearn e a escolha do ponto de operacao
+def test_threshold_table_and_operating_point(tmp_path):
+    from sklearn.metrics import precision_recall_curve
+    from src.models.threshold import precision_recall_table, choose_threshold, save_threshold, load_threshold
+
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 500)
+    # Scores com empates, como as medias de votos da floresta
+    scores = np.round(np.clip(y * 0.3 + rng.random(500) * 0.7, 0, 1), 2)
+
+    table = precision_recall_table(y, scores)
+    precision, recall, thresholds = precision_recall_curve(y, scores)
+    order = np.argsort(table['threshold'])
+    assert np.allclose(table['threshold'][order], thresholds)
+    assert np.allclose(table['precision'][order], precision[:-1])
+    assert np.allclose(table['recall'][order], recall[:-1])
+
+    point = choose_threshold(table, min_recall=0.95)
+    assert point['recall'] >= 0.95
+    eligible = table['recall'] >= 0.95
+    assert point['precision'] == table['precision'][eligible].max()
+
+    path = str(tmp_path / "model_threshold.json")
+    save_threshold(point, path)
+    assert load_threshold(path) == point['threshold']
+    assert load_threshold(str(tmp_path / "inexistente.json")) is None
+
+    # Sem alunos em risco nenhum limiar atinge o recall minimo: volta para o corte padrao
+    fallback = choose_threshold(precision_recall_table(np.zeros(5), [0.1, 0.3, 0.5, 0.7, 0.9]))
+    assert fallback['threshold'] == 0.5 and fallback['recall'] == 0.0
+    assert fallback['flagged_rate'] == 0.6
+    empty = choose_threshold(precision_recall_table([0, 0], [0.1, 0.2]), min_recall=0.95)
+    assert empty['threshold'] == 0.5 and empty['flagged_rate'] == 0.0
+
+# Testa a decomposicao pelos caminhos das arvores: base + contribuicoes = P(risco)
+def test_tree_path_explanations(trained_forest):
+    from src.models.feature_encoder import EncodedPipeline
+    from src.models.predict_model import score_chunk
+
+    pipeline = trained_forest.pipeline
+    compiled = CompiledModel(compile_pipeline(pipeline))
+
+    X_test = trained_forest.X_train.iloc[:40].copy()
+    X_test.iloc[:5, X_test.columns.get_loc('Pedra 22')] = 'Diamante'
+    probability, base_value, contributions = compiled.explain(X_test)
+
+    assert np.array_equal(probability, pipeline.predict_proba(X_test)[:, 1])
+    assert np.allclose(base_value + contributions.sum(axis=1), probability)
+    assert contributions.shape == (40, len(compiled.explain_columns))
+    assert set(compiled.explain_columns) == set(trained_forest.numeric_features) | set(trained_forest.categorical_features)
+
+    # Engine sklearn: mesmas arvores, mesmas contribuicoes
+    _, _, from_pipeline = EncodedPipeline(pipeline).explain(X_test)
+    assert np.array_equal(from_pipeline, contributions)
+
+    scored = score_chunk(compiled, X_test, explain=True)
+    assert np.allclose(scored['contribution_Pedra 22'], contributions[:, compiled.explain_columns.index('Pedra 22')])
+    assert np.allclose(scored['base_value'], base_value)
+
+# Testa o treino incremental: warm start com arvores a mais, promocao pelo holdout e arquivo ja processado
+def test_incremental_training_warm_start(trained_forest, tmp_path):
+    import joblib
+    from benchmarks.synthetic import generate_students
+    from src.models.streaming_drift import save_reference_profile
+    from src.models.incremental_train import incremental_train, warm_start_forest, should_promote, choose_mode
+
+    pipeline, X = trained_forest.pipeline, trained_forest.X_train
+
+    new_df = generate_students(200, seed=12)
+    X_new, y_new, _, _ = preprocess_data(new_df)
+    candidate = warm_start_forest(pipeline, X_new, y_new, n_history=len(X))
+    # 200 linhas novas sobre 300 -> 20 * 200/300 = 14 arvores novas; o modelo original nao muda
+    assert len(candidate.named_steps['classifier'].estimators_) == 34
+    assert len(pipeline.named_steps['classifier'].estimators_) == 20
+    assert candidate.predict_proba(X_new).shape == (200, 2)
+
+    # Uma classe so: o warm start refaria classes_; --mode warm_start cai para o refit
+    single = y_new[y_new == 0].index[:30]
+    with pytest.raises(ValueError):
+        warm_start_forest(pipeline, X_new.loc[single], y_new.loc[single], n_history=len(X))
+    assert choose_mode({'drifted_features': []}, y_new.loc[single], 'warm_start') == 'refit'
+    assert choose_mode({'drifted_features': []}, y_new, 'warm_start') == 'warm_start'
+
+    assert should_promote({'recall': 0.9, 'roc_auc': 0.8}, {'recall': 0.895, 'roc_auc': 0.85})
+    assert not should_promote({'recall': 0.9, 'roc_auc': 0.8}, {'recall': 0.85, 'roc_auc': 0.9})
+
+    model_path = str(tmp_path / "model.joblib")
+    state_path = str(tmp_path / "incremental_state.json")
+    joblib.dump(pipeline, model_path)
+    new_path = str(tmp_path / "novos.csv")
+    new_df.to_csv(new_path, index=False)
+    # Perfil de drift e .npz ficam ao lado do modelo, nao em models_artifacts/
+    save_reference_profile(X, str(tmp_path / "drift_reference.json"))
+
+    with patch('src.models.incremental_train.mlflow'), \
+            patch('src.models.incremental_train.refresh_score_table') as mock_scores:
+        result = incremental_train(new_path, mode='warm_start', tolerance=1.0,
+                                   model_path=model_path, state_path=state_path)
+        assert result['mode'] == 'warm_start' and result['promoted']
+        assert set(result['candidate']) == {'recall', 'precision', 'roc_auc'}
+        mock_scores.assert_not_called()
+        promoted = joblib.load(model_path)
+        compiled = load_compiled_model(str(tmp_path / "model_compiled.npz"))
+        assert np.array_equal(compiled.predict_proba(X_new), promoted.predict_proba(X_new))
+        assert len(promoted.named_steps['classifier'].estimators_) > 20
+        assert promoted.named_steps['classifier'].warm_start is False
+
+        # Mesmo arquivo de novo: nada e retreinado
+        assert incremental_train(new_path, model_path=model_path, state_path=state_path) is None
+
+# Testa o refit com linhas no schema longitudinal (Idade/Pedra/INDE) somadas ao historico do PEDE2022
+def test_incremental_refit_accepts_longitudinal_schema(tmp_path):
+    from benchmarks.synthetic import generate_students
+    from src.data.preprocess import LONGITUDINAL_FEATURES, REQUIRED_COLUMNS
+    from src.models.incremental_train import history_data, load_new_data, refit_forest, training_years
+
+    new_path = str(tmp_path / "pede2024.csv")
+    generate_students(50, seed=14).rename(columns={v: k for k, v in LONGITUDINAL_FEATURES.items()}).to_csv(new_path, index=False)
+    assert set(LONGITUDINAL_FEATURES.values()) <= set(load_new_data(new_path).columns)
+
+    state = {'incorporated': {'a': {'path': new_path, 'promoted': True}}}
+    history_raw = generate_students(80, seed=13)[REQUIRED_COLUMNS]
+    with patch('src.models.incremental_train.load_raw_data', return_value=history_raw):
+        history = history_data(state)
+    _, X_fit = refit_forest({'n_estimators': 5, 'max_depth': 4}, history)
+
+    assert len(X_fit) == 130
+    assert not X_fit[list(LONGITUDINAL_FEATURES.values())].isna().any().any()
+
+    # Modelo treinado com --years: o historico vem das mesmas particoes da tabela longitudinal
+    longitudinal = generate_students(40, seed=15).rename(columns={v: k for k, v in LONGITUDINAL_FEATURES.items()})
+    with patch('src.models.incremental_train.ingest_workbook'), \
+            patch('src.models.incremental_train.load_longitudinal', return_value=longitudinal) as mock_longitudinal, \
+            patch('src.models.incremental_train.load_raw_data') as mock_raw:
+        history = history_data({**state, 'training_years': [2023, 2024]})
+    mock_longitudinal.assert_called_once_with([2023, 2024])
+    assert training_years(pd.Series({'params.training_years': '2023,2024'})) == [2023, 2024]
+    assert training_years(pd.Series({'params.training_years': 'PEDE2022'}), [2024]) is None
+    assert training_years(None, [2024]) == [2024]
+    mock_raw.assert_not_called()
+    assert len(history) == 90 and not history[list(LONGITUDINAL_FEATURES.values())].isna().any().any()
+
+# Testa a tabela de scores: so alunos novos, alterados ou de outra versao do modelo sao repontuados
+def test_score_table_refreshes_only_stale_rows(trained_forest, tmp_path):
+    import sqlite3
+    from benchmarks.synthetic import generate_students
+    from src.models.score_table import refresh_scores
+
+    base = generate_students(60, seed=21)
+    pipeline = trained_forest.pipeline
+    path = str(tmp_path / "scores.sqlite")
+
+    assert refresh_scores(pipeline, base, 'v1', path=path) == {'scored': 60, 'unchanged': 0, 'removed': 0}
+    assert refresh_scores(pipeline, base, 'v1', path=path) == {'scored': 0, 'unchanged': 60, 'removed': 0}
+
+    changed = base.iloc[1:].copy()
+    changed.loc[5, 'IDA'] = 0.0
+    with patch('src.models.score_table.make_prediction', wraps=make_prediction) as mock_predict:
+        assert refresh_scores(pipeline, changed, 'v1', path=path) == {'scored': 1, 'unchanged': 58, 'removed': 1}
+        assert len(mock_predict.call_args.args[1]) == 1
+    assert refresh_scores(pipeline, changed, 'v2', path=path)['scored'] == 59
+
+    with sqlite3.connect(path) as db:
+        rows = dict(db.execute("SELECT student_id, risk_probability FROM scores").fetchall())
+        versions = {v for (v,) in db.execute("SELECT model_version FROM scores")}
+    assert versions == {'v2'} and 'RA-0' not in rows
+    expected = pipeline.predict_proba(select_features(changed)[0])[:, 1]
+    assert np.allclose([rows[ra] for ra in changed['RA']], expected)
+
+# Testa se a versao da tabela de scores e o fingerprint do artefato servido pela engine
+def test_score_table_version_follows_served_artifact(trained_forest, tmp_path):
+    import joblib
+    import sqlite3
+    from benchmarks.synthetic import generate_students
+    from src.models.score_table import build_score_table, model_version
+    from src.utils.fingerprint import file_fingerprint
+
+    pipeline = trained_forest.pipeline
+    model_path, compiled_path = str(tmp_path / "model.joblib"), str(tmp_path / "model_compiled.npz")
+    joblib.dump(pipeline, model_path)
+    save_compiled_arrays(compile_pipeline(pipeline, compact=True), compiled_path)
+    path = str(tmp_path / "scores.sqlite")
+
+    with patch('src.models.predict_model.MODEL_PATH', model_path), \
+            patch('src.models.predict_model.COMPILED_MODEL_PATH', compiled_path), \
+            patch('src.models.predict_model.load_compiled_model', side_effect=lambda: load_compiled_model(compiled_path)), \
+            patch('src.models.score_table.student_base', return_value=generate_students(30, seed=22)), \
+            patch('src.models.score_table.load_threshold', return_value=None), \
+            patch('src.models.score_table.THRESHOLD_PATH', str(tmp_path / "model_threshold.json")):
+        assert model_version('sklearn') == file_fingerprint(model_path)[:12]
+        assert model_version('numpy') == file_fingerprint(compiled_path)[:12]
+        build_score_table('numpy', path=path)
+
+    with sqlite3.connect(path) as db:
+        versions = {v for (v,) in db.execute("SELECT model_version FROM scores")}
+    assert versions == {file_fingerprint(compiled_path)[:12]}
+
+# Testa as variantes compactas da floresta: float32 sem mudar decisoes, corte de profundidade e OOB
+def test_forest_compaction_variants(trained_forest, tmp_path):
+    from src.models.compiled_model import tree_node_depths
+    from src.models.compact_model import out_of_bag_masks, compaction_report
+
+    pipeline = trained_forest.pipeline
+    X_train, X_test = trained_forest.X_train, trained_forest.X_test
+    y_train, y_test = trained_forest.y_train, trained_forest.y_test
+    forest = pipeline.named_steps['classifier']
+    Xt = pipeline.named_steps['preprocessor'].transform(X_train).astype(np.float32)
+
+    # Mascaras OOB refeitas batem com o oob_decision_function_ do sklearn
+    masks = out_of_bag_masks(forest, len(X_train))
+    votes = sum(np.where(m[:, None], e.predict_proba(Xt), 0.0) for e, m in zip(forest.estimators_, masks))
+    assert np.allclose(votes / votes.sum(axis=1, keepdims=True), forest.oob_decision_function_)
+
+    # Limiares float32 arredondados para baixo: mesmas folhas, valores com erro de float32
+    compact = CompiledModel(compile_pipeline(pipeline, compact=True))
+    assert compact.tree_threshold.dtype == np.float32
+    assert np.abs(compact.predict_proba(X_test) - pipeline.predict_proba(X_test)).max() < 1e-6
+
+    # Carregada com mmap, a variante compacta pontua direto sobre os indices int32 mapeados (sem copia por worker)
+    compact_path = str(tmp_path / "compact.npz")
+    save_compiled_arrays(compile_pipeline(pipeline, compact=True), compact_path)
+    mapped = load_compiled_model(compact_path, mmap=True)
+    assert isinstance(mapped.tree_left, np.memmap) and mapped.tree_left.dtype == np.int32
+    assert np.array_equal(mapped.predict_proba(X_test), compact.predict_proba(X_test))
+
+    # Corte de profundidade = valor do no do caminho na profundidade de corte
+    tree = forest.estimators_[0]
+    capped = CompiledModel(compile_pipeline(pipeline, [0], max_depth=3))
+    depth = tree_node_depths(tree.tree_)
+    Xt_test = pipeline.named_steps['preprocessor'].transform(X_test).astype(np.float32)
+    path = tree.decision_path(Xt_test).toarray().astype(bool)
+    node = np.array([np.flatnonzero(p & (depth <= 3))[-1] for p in path])
+    assert np.allclose(capped.predict_proba(X_test), tree.tree_.value[node, 0])
+    assert len(capped.tree_feature) < tree.tree_.node_count
+
+    report, arrays = compaction_report(pipeline, X_train, y_train, X_test, y_test, tolerance=0.05, repeats=2)
+    variants = report['variants']
+    assert {'sklearn', 'baseline', 'trees_25pct_depth_8'} <= set(variants)
+    assert variants['baseline']['max_abs_diff'] == 0.0
+    selected = variants[report['selected']]
+    assert selected['recall'] >= variants['baseline']['recall'] - 0.05
+    assert selected['size_bytes'] <= variants['baseline']['size_bytes']
+    assert len(arrays['tree_roots']) == selected['n_trees']
 
 # Testa se o artifact do modelo existe
 def test_model_artifact_exists():
@@ -128,4 +553,152 @@ def test_monitor_drift_runs(mock_load, mock_report, sample_data):
     
     # 4. Verificamos se os métodos vitais foram chamados
     mock_report_instance.run.assert_called_once()
-    mock_eval_mock.save_html.assert_called_once_with("drift_dashboard.html")
\ No newline at end of file
+    mock_eval_mock.save_html.assert_called_once_with("drift_dashboard.html")
+
+# Testa a pontuacao em blocos de um CSV, mantendo a ordem das linhas
+@patch('src.models.predict_model.load_model')
+def test_score_file_streams_chunks(mock_load_model, sample_data, tmp_path):
+    from src.models.predict_model import score_file
+
+    class MockPipeline:
+        classes_ = np.array([0, 1])
+        calls = []
+
+        def predict_proba(self, X):
+            self.calls.append(len(X))
+            p = (X['INDE 22'].to_numpy() / 10.0)
+            return np.column_stack([1 - p, p])
+
+    model = MockPipeline()
+    mock_load_model.return_value = model
+    input_path = tmp_path / "alunos.csv"
+    sample_data.assign(RA=range(5)).to_csv(input_path, index=False)
+    output_path = tmp_path / "scores.parquet"
+
+    rows = score_file(str(input_path), str(output_path), chunk_size=2, id_columns=['RA'])
+
+    scores = pd.read_parquet(output_path)
+    assert rows == 5
+    assert model.calls == [2, 2, 1]
+    assert scores['RA'].tolist() == [0, 1, 2, 3, 4]
+    assert np.allclose(scores['risk_probability'], sample_data['INDE 22'] / 10.0)
+    assert scores['prediction'].tolist() == [1, 1, 1, 0, 1]
+
+# Testa a escrita em Parquet quando um bloco posterior infere outro tipo (id inteiro com NaN)
+@patch('src.models.predict_model.load_model')
+def test_score_file_keeps_first_chunk_schema(mock_load_model, sample_data, tmp_path):
+    from src.models.predict_model import score_file
+
+    class MockPipeline:
+        classes_ = np.array([0, 1])
+
+        def predict_proba(self, X):
+            return np.tile([0.4, 0.6], (len(X), 1))
+
+    mock_load_model.return_value = MockPipeline()
+    input_path = tmp_path / "alunos.csv"
+    sample_data.assign(RA=pd.array([0, 1, 2, None, 4], dtype="Int64")).to_csv(input_path, index=False)
+    output_path = tmp_path / "scores.parquet"
+
+    # Bloco 1: RA int64; blocos 2 e 3: float64 (o do meio com NaN)
+    assert score_file(str(input_path), str(output_path), chunk_size=2, id_columns=['RA']) == 5
+
+    scores = pd.read_parquet(output_path)
+    assert scores['RA'].isna().tolist() == [False, False, False, True, False]
+    assert scores['RA'].dropna().tolist() == [0, 1, 2, 4]
+
+# Testa o monitor de drift incremental sobre um log JSONL
+def test_streaming_drift_monitor(sample_data, tmp_path):
+    import json
+    from src.models.streaming_drift import build_reference_profile, DriftMonitor
+
+    reference = pd.concat([sample_data] * 20, ignore_index=True)
+    X, _, _, _ = preprocess_data(reference)
+    monitor = DriftMonitor(build_reference_profile(X, bins=4))
+
+    # Mesma distribuicao da referencia: sem drift
+    monitor.observe(reference)
+    report = monitor.report()
+    assert report['current_size'] == 100
+    assert report['drifted_features'] == []
+
+    # Log com alunos muito mais velhos e de outra escola, lido em duas etapas
+    monitor.reset()
+    log_path = tmp_path / "predictions.jsonl"
+    shifted = reference.assign(**{'Idade 22': 30, 'Instituição de ensino': 'Outra'})
+    records = [{"features": row} for row in shifted.drop(columns=['Defas']).to_dict(orient='records')]
+    with open(log_path, 'w') as f:
+        f.writelines(json.dumps(r) + "\n" for r in records[:60])
+    assert monitor.follow_log(str(log_path)) == 60
+    with open(log_path, 'a') as f:
+        f.writelines(json.dumps(r) + "\n" for r in records[60:])
+    assert monitor.follow_log(str(log_path)) == 40
+
+    # Reconsultas servidas do cache nao entram na janela
+    with open(log_path, 'a') as f:
+        f.writelines(json.dumps({**records[0], "cached": True}) + "\n" for _ in range(500))
+    assert monitor.follow_log(str(log_path)) == 500
+
+    report = monitor.report()
+    assert report['current_size'] == 100
+    assert report['skipped_cached'] == 500
+    # Quantis da janela pelo sketch: erro relativo de ate 1%
+    assert report['features']['Idade 22']['quantiles']['0.5'] == pytest.approx(30, rel=0.01)
+    assert report['features']['Idade 22']['reference_quantiles']['0.5'] < 30
+    assert 'Idade 22' in report['drifted_features']
+    assert 'Instituição de ensino' in report['drifted_features']
+    assert 'IAA' not in report['drifted_features']
+
+# Testa o log de varios workers com rotacao e o descarte do estado de outro perfil de referencia
+def test_streaming_drift_follows_rotation_and_reference_change(sample_data, tmp_path):
+    import json
+    import os
+    from src.models.streaming_drift import build_reference_profile, DriftMonitor, load_monitor
+
+    reference = pd.concat([sample_data] * 20, ignore_index=True)
+    X, _, _, _ = preprocess_data(reference)
+    records = [json.dumps({"features": row}) + "\n" for row in reference.drop(columns=['Defas']).to_dict(orient='records')]
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    worker_1, worker_2 = log_dir / "predictions-w1.jsonl", log_dir / "predictions-w2.jsonl"
+
+    monitor = DriftMonitor(build_reference_profile(X, bins=4))
+    worker_1.write_text(''.join(records[:30]))
+    worker_2.write_text(''.join(records[30:50]))
+    assert monitor.follow_log(str(log_dir)) == 50
+
+    # Linhas gravadas e rotacionadas entre duas leituras: lidas no segmento renomeado
+    with open(worker_1, 'a') as f:
+        f.writelines(records[50:70])
+    os.replace(worker_1, log_dir / "predictions-20260101T000000-1-00001.jsonl")
+    worker_1.write_text(''.join(records[70:80]))
+    assert monitor.follow_log(str(log_dir)) == 30
+    assert monitor.follow_log(str(log_dir)) == 0
+    assert monitor.n == 80
+
+    # Estado salvo com outro perfil (novo treino): contadores descartados, posicao no log mantida
+    reference_path, state_path = tmp_path / "reference.json", tmp_path / "state.json"
+    reference_path.write_text(json.dumps(monitor.reference))
+    monitor.save_state(str(state_path))
+    assert load_monitor(str(reference_path), str(state_path)).n == 80
+    reference_path.write_text(json.dumps(build_reference_profile(X, bins=8)))
+    restored = load_monitor(str(reference_path), str(state_path))
+    assert restored.n == 0
+    assert len(restored.numeric['IAA']) == len(restored.edges['IAA']) + 1
+    assert restored.follow_log(str(log_dir)) == 0
+
+def test_benchmark_synthetic_data_and_regression_check():
+    from benchmarks.synthetic import generate_students
+    from benchmarks.run_benchmarks import compare_results
+
+    # Dataset sintetico reproduzivel e compativel com o preprocess_data
+    df = generate_students(200, seed=1)
+    pd.testing.assert_frame_equal(df, generate_students(200, seed=1))
+    X, y, num_cols, cat_cols = preprocess_data(df)
+    assert len(X) == 200
+    assert set(y.unique()) == {0, 1}
+
+    baseline = {'metrics': {'predict_s': 1.0, 'fit_s': 2.0, 'removida_s': 1.0}}
+    current = {'metrics': {'predict_s': 1.1, 'fit_s': 3.0}}
+    regressions = compare_results(current, baseline, threshold=0.25)
+    assert [r['metric'] for r in regressions] == ['fit_s']